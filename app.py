@@ -3,21 +3,51 @@
 # ──────────────────────────────────────────────────────────────────────────────
 
 # ── Core Imports ──────────────────────────────────────────────────────────────
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import os
 import csv
 import io
 import base64
-import traceback
+import atexit
+import copy
+import json
+import logging
+import queue
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from logging.handlers import QueueHandler, QueueListener
+import random
+import threading
+import time
+import hashlib
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape as xml_escape
 from types import SimpleNamespace
 
 # ── Flask & Extensions ────────────────────────────────────────────────────────
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, g, has_request_context, abort
+from flask import stream_template, send_file
+from flask import before_render_template, template_rendered
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail, Message
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_, case, inspect, text, insert, update, select, delete, event, literal, union_all, cast, null
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, selectinload
+from sqlalchemy.schema import CreateIndex
 import requests
-from urllib.parse import unquote
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote, unquote, urlsplit
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails are served at full size without Pillow
+    Image = ImageOps = None
 
 
 # ── App Configuration ─────────────────────────────────────────────────────────
@@ -46,28 +76,235 @@ app.config["MAIL_USE_TLS"] = os.environ.get("MAIL_USE_TLS", "True").lower() == "
 app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME", "servitech.stock@gmail.com")
 app.config["MAIL_PASSWORD"] = os.environ.get("MAIL_PASSWORD")
 app.config["MAIL_DEFAULT_SENDER"] = ("Servitech Stock", app.config["MAIL_USERNAME"])
+app.config["MAIL_ENABLED"] = os.environ.get("MAIL_ENABLED", str(bool(app.config["MAIL_PASSWORD"]))).lower() == "true"
+
+# Outbound mail queue: dispatch emails are written to email_outbox and sent by background workers
+app.config["MAIL_OUTBOX_RUN_IN_APP"] = os.environ.get("MAIL_OUTBOX_RUN_IN_APP", "True").lower() == "true"
+app.config["MAIL_OUTBOX_WORKERS"] = int(os.environ.get("MAIL_OUTBOX_WORKERS", 1))
+app.config["MAIL_OUTBOX_BATCH_SIZE"] = int(os.environ.get("MAIL_OUTBOX_BATCH_SIZE", 20))
+app.config["MAIL_OUTBOX_POLL_INTERVAL"] = int(os.environ.get("MAIL_OUTBOX_POLL_INTERVAL", 15))
+app.config["MAIL_OUTBOX_MAX_ATTEMPTS"] = int(os.environ.get("MAIL_OUTBOX_MAX_ATTEMPTS", 6))
+app.config["MAIL_OUTBOX_RETRY_BASE"] = int(os.environ.get("MAIL_OUTBOX_RETRY_BASE", 30))
+app.config["MAIL_OUTBOX_LEASE_SECONDS"] = int(os.environ.get("MAIL_OUTBOX_LEASE_SECONDS", 300))
 
 # GitHub configuration
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
 GITHUB_REPO = os.environ.get("GITHUB_REPO", "tomward0606/PartsProjectMain")
 CSV_FILE_PATH = os.environ.get("CSV_FILE_PATH", "parts.csv")
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_RAW_URL = os.environ.get("GITHUB_RAW_URL", "https://raw.githubusercontent.com").rstrip("/")
+GITHUB_MAX_RETRIES = int(os.environ.get("GITHUB_MAX_RETRIES", 3))
+GITHUB_BACKOFF_BASE = float(os.environ.get("GITHUB_BACKOFF_BASE", 0.5))
+GITHUB_RATE_LIMIT_MAX_WAIT = float(os.environ.get("GITHUB_RATE_LIMIT_MAX_WAIT", 30))
+GITHUB_POOL_SIZE = int(os.environ.get("GITHUB_POOL_SIZE", 10))
+
+# Catalogue writes: edits arriving within this many seconds share one GitHub commit
+CATALOGUE_WRITE_WINDOW = float(os.environ.get("CATALOGUE_WRITE_WINDOW", 0.25))
+CATALOGUE_WRITE_RETRIES = int(os.environ.get("CATALOGUE_WRITE_RETRIES", 3))
+
+# Catalogue cache: seconds a parsed catalogue is served before checking the local mirror's version
+CATALOGUE_CACHE_TTL = int(os.environ.get("CATALOGUE_CACHE_TTL", 60))
+
+# Catalogue mirror: how often `flask catalogue-sync` polls GitHub for a new CSV revision
+CATALOGUE_SYNC_INTERVAL = int(os.environ.get("CATALOGUE_SYNC_INTERVAL", 120))
+
+# Dispatch history paging
+DISPATCH_HISTORY_PER_PAGE = int(os.environ.get("DISPATCH_HISTORY_PER_PAGE", 50))
+DISPATCH_HISTORY_MAX_PER_PAGE = int(os.environ.get("DISPATCH_HISTORY_MAX_PER_PAGE", 200))
+
+# Batch printing: most dispatch notes one combined print document may hold
+BATCH_PRINT_MAX_NOTES = int(os.environ.get("BATCH_PRINT_MAX_NOTES", 1000))
+ENGINEER_HISTORY_PER_PAGE = int(os.environ.get("ENGINEER_HISTORY_PER_PAGE", 10))
+
+# Engineer summary: each sync re-scans this many of the newest line ids, catching lines committed out of order
+SUMMARY_SYNC_OVERLAP_IDS = int(os.environ.get("SUMMARY_SYNC_OVERLAP_IDS", 500))
+
+# Part history search: results per page, and the shortest term the trigram indexes can serve
+PART_SEARCH_PER_PAGE = int(os.environ.get("PART_SEARCH_PER_PAGE", 50))
+PART_SEARCH_MIN_LENGTH = 3
+
+# Demand report: default period and how many parts each top-N table lists
+DEMAND_REPORT_WEEKS = int(os.environ.get("DEMAND_REPORT_WEEKS", 12))
+DEMAND_TOP_PARTS = int(os.environ.get("DEMAND_TOP_PARTS", 20))
+
+# Catalogue thumbnails: relative image names are resolved against IMAGE_BASE_URL
+IMAGE_BASE_URL = os.environ.get("IMAGE_BASE_URL", "").rstrip("/")
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", 96))
+THUMBNAIL_CACHE_DIR = os.environ.get("THUMBNAIL_CACHE_DIR")
+THUMBNAIL_CACHE_MAX_MB = int(os.environ.get("THUMBNAIL_CACHE_MAX_MB", 256))
+THUMBNAIL_MAX_AGE = int(os.environ.get("THUMBNAIL_MAX_AGE", 365 * 24 * 3600))
+THUMBNAIL_FETCH_TIMEOUT = float(os.environ.get("THUMBNAIL_FETCH_TIMEOUT", 10))
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.environ.get("THUMBNAIL_MAX_SOURCE_BYTES", 10 * 1024 * 1024))
+THUMBNAIL_RETRY_AFTER = int(os.environ.get("THUMBNAIL_RETRY_AFTER", 300))
+THUMBNAIL_WARM_WORKERS = int(os.environ.get("THUMBNAIL_WARM_WORKERS", 8))
+
+# Archiving: fully sent orders and dispatch notes older than this move to the archive tables
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 365))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 500))
+
+# Stock ledger: snapshots only roll up movements at least this old, so late commits are never skipped
+STOCK_SNAPSHOT_SETTLE_SECONDS = int(os.environ.get("STOCK_SNAPSHOT_SETTLE_SECONDS", 60))
+
+# Dispatch notes: seconds a rendered back-order section is reused before it is rebuilt
+BACK_ORDER_CACHE_TTL = int(os.environ.get("BACK_ORDER_CACHE_TTL", 30))
+
+# Streaming exports: rows fetched per server-side cursor batch and rows per response chunk
+EXPORT_FETCH_SIZE = int(os.environ.get("EXPORT_FETCH_SIZE", 1000))
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 500))
+
+# JSON API: default and maximum page sizes; smaller bodies are not worth gzipping
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 100))
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 500))
+API_GZIP_MIN_BYTES = int(os.environ.get("API_GZIP_MIN_BYTES", 1024))
+
+# Logging: LOG_LEVELS takes per-logger overrides, e.g. "stock.github=DEBUG,stock.mail=WARNING"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_ROW_SAMPLE = max(1, int(os.environ.get("LOG_ROW_SAMPLE", 1000)))
+
+# Request instrumentation: Server-Timing header on every response; requests slower than this are logged
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "True").lower() == "true"
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 1000))
 
 # Initialize extensions
 db = SQLAlchemy(app)
 mail = Mail(app)
 
+# ── Logging ───────────────────────────────────────────────────────────────────
+
+github_log = logging.getLogger("stock.github")
+catalogue_log = logging.getLogger("stock.catalogue")
+mail_log = logging.getLogger("stock.mail")
+dispatch_log = logging.getLogger("stock.dispatch")
+perf_log = logging.getLogger("stock.perf")
+
+_STANDARD_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line; anything passed via `extra=` becomes a field"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in _STANDARD_RECORD_FIELDS)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class RedactSecretsFilter(logging.Filter):
+    """Scrub configured secrets and credential-shaped strings from messages and tracebacks before they are queued"""
+
+    # Each pattern keeps group 1 and replaces the credential after it
+    _PATTERNS = [
+        re.compile(r"\b(Bearer\s+)\S+"),
+        re.compile(r"(token=)[^\s&'\",]+", re.IGNORECASE),
+        re.compile(r"\b()(?:gh[pousr]_[A-Za-z0-9]{20,}|github_pat_[A-Za-z0-9_]{20,})"),
+        re.compile(r"(['\"]?(?:Authorization|password)['\"]?\s*[:=]\s*['\"]?)[^'\",}]+", re.IGNORECASE),
+    ]
+
+    def secrets(self):
+        return [v for v in (GITHUB_TOKEN, app.config.get("MAIL_PASSWORD"), app.config.get("SECRET_KEY")) if v]
+
+    def redact(self, value: str) -> str:
+        for secret in self.secrets():
+            value = value.replace(secret, "[REDACTED]")
+        for pattern in self._PATTERNS:
+            value = pattern.sub(lambda m: m.group(1) + "[REDACTED]", value)
+        return value
+
+    def filter(self, record):
+        record.msg = self.redact(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.exc_text:
+            record.exc_text = self.redact(record.exc_text)
+        if record.stack_info:
+            record.stack_info = self.redact(record.stack_info)
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_FIELDS and isinstance(value, str):
+                setattr(record, key, self.redact(value))
+        return True
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue records for the listener thread, keeping extras intact for the JSON formatter"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def configure_logging():
+    """Route the "stock" loggers through a queue to a background writer thread.
+
+    Request threads only pay for putting a record on an in-memory queue;
+    formatting and the stdout write happen on the listener thread.
+    """
+    root = logging.getLogger("stock")
+    if getattr(configure_logging, "listener", None):
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(
+        JsonLogFormatter() if LOG_FORMAT == "json"
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RedactSecretsFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    for override in filter(None, (o.strip() for o in LOG_LEVELS.split(","))):
+        name, _, level = override.partition("=")
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    configure_logging.listener = listener
+
+configure_logging()
+
 # ── Database Models ───────────────────────────────────────────────────────────
 
 class PartsOrder(db.Model):
     __tablename__ = "parts_order"
+    __table_args__ = (
+        db.Index("ix_parts_order_email", "email"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), nullable=True)
     items = db.relationship("PartsOrderItem", backref="order", cascade="all, delete-orphan")
 
+# Never negative, like the old Python property: an over-dispatched line has nothing remaining
+QTY_REMAINING_SQL = (
+    "CASE WHEN coalesce(quantity, 0) > coalesce(quantity_sent, 0) "
+    "THEN coalesce(quantity, 0) - coalesce(quantity_sent, 0) ELSE 0 END"
+)
+
 class PartsOrderItem(db.Model):
     __tablename__ = "parts_order_item"
+    __table_args__ = (
+        db.Index("ix_parts_order_item_order_id", "order_id"),
+        # Lines still outstanding: the only rows the hot order screens ever read
+        db.Index(
+            "ix_parts_order_item_outstanding", "order_id",
+            postgresql_where=text("qty_remaining > 0"),
+            sqlite_where=text("qty_remaining > 0"),
+        ),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey("parts_order.id"), nullable=False)
     part_number = db.Column(db.String(64))
@@ -75,16 +312,15 @@ class PartsOrderItem(db.Model):
     quantity = db.Column(db.Integer)
     quantity_sent = db.Column(db.Integer, default=0)
     back_order = db.Column(db.Boolean, nullable=False, default=False)
-
-    @property
-    def qty_remaining(self) -> int:
-        try:
-            return max(0, int(self.quantity or 0) - int(self.quantity_sent or 0))
-        except Exception:
-            return 0
+    # Generated by the database; reflects quantity_sent after the row is flushed
+    qty_remaining = db.Column(db.Integer, db.Computed(QTY_REMAINING_SQL, persisted=True))
 
 class DispatchNote(db.Model):
     __tablename__ = "dispatch_note"
+    __table_args__ = (
+        db.Index("ix_dispatch_note_engineer_date", "engineer_email", "date"),
+        db.Index("ix_dispatch_note_date_id", "date", "id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     engineer_email = db.Column(db.String(120), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -93,12 +329,186 @@ class DispatchNote(db.Model):
 
 class DispatchItem(db.Model):
     __tablename__ = "dispatch_item"
+    __table_args__ = (
+        db.Index("ix_dispatch_item_dispatch_note_id", "dispatch_note_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     dispatch_note_id = db.Column(db.Integer, db.ForeignKey("dispatch_note.id"), nullable=False)
     part_number = db.Column(db.String(64))
     quantity_sent = db.Column(db.Integer)
     description = db.Column(db.String(256))
 
+class DispatchDocument(db.Model):
+    """A dispatch note's fixed content, rendered once when the dispatch is recorded"""
+    __tablename__ = "dispatch_document"
+    dispatch_note_id = db.Column(db.Integer, db.ForeignKey("dispatch_note.id"), primary_key=True)
+    engineer_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# ── Archive tables: same columns and ids as the live tables, filled by `flask archive`
+
+class PartsOrderArchive(db.Model):
+    __tablename__ = "parts_order_archive"
+    __table_args__ = (
+        db.Index("ix_parts_order_archive_email", "email"),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    email = db.Column(db.String(120), nullable=False)
+    date = db.Column(db.DateTime)
+    status = db.Column(db.String(20), nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    items = db.relationship("PartsOrderItemArchive", backref="order")
+
+class PartsOrderItemArchive(db.Model):
+    __tablename__ = "parts_order_item_archive"
+    __table_args__ = (
+        db.Index("ix_parts_order_item_archive_order_id", "order_id"),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey("parts_order_archive.id"), nullable=False)
+    part_number = db.Column(db.String(64))
+    description = db.Column(db.String(256))
+    quantity = db.Column(db.Integer)
+    quantity_sent = db.Column(db.Integer)
+    back_order = db.Column(db.Boolean, nullable=False, default=False)
+
+    @property
+    def qty_remaining(self):
+        return (self.quantity or 0) - (self.quantity_sent or 0)
+
+class DispatchNoteArchive(db.Model):
+    __tablename__ = "dispatch_note_archive"
+    __table_args__ = (
+        db.Index("ix_dispatch_note_archive_engineer_date", "engineer_email", "date"),
+        db.Index("ix_dispatch_note_archive_date_id", "date", "id"),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    engineer_email = db.Column(db.String(120), nullable=False)
+    date = db.Column(db.DateTime)
+    picker_name = db.Column(db.String(100), nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    items = db.relationship("DispatchItemArchive", backref="dispatch_note")
+
+class DispatchItemArchive(db.Model):
+    __tablename__ = "dispatch_item_archive"
+    __table_args__ = (
+        db.Index("ix_dispatch_item_archive_dispatch_note_id", "dispatch_note_id"),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    dispatch_note_id = db.Column(db.Integer, db.ForeignKey("dispatch_note_archive.id"), nullable=False)
+    part_number = db.Column(db.String(64))
+    quantity_sent = db.Column(db.Integer)
+    description = db.Column(db.String(256))
+
+class DispatchDocumentArchive(db.Model):
+    __tablename__ = "dispatch_document_archive"
+    dispatch_note_id = db.Column(db.Integer, db.ForeignKey("dispatch_note_archive.id"), primary_key=True, autoincrement=False)
+    engineer_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+class StockMovement(db.Model):
+    """One change to stock on hand; quantity is negative for stock going out"""
+    __tablename__ = "stock_movement"
+    __table_args__ = (
+        db.Index("ix_stock_movement_part_id", "part_number", "id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    part_number = db.Column(db.String(64), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # receipt, dispatch or adjustment
+    # Not a foreign key: the note may since have moved to dispatch_note_archive
+    dispatch_note_id = db.Column(db.Integer, nullable=True)
+    reference = db.Column(db.String(120), nullable=True)
+    note = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class StockBalance(db.Model):
+    """Current stock on hand per part, kept in step with stock_movement"""
+    __tablename__ = "stock_balance"
+    part_number = db.Column(db.String(64), primary_key=True)
+    on_hand = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class StockSnapshot(db.Model):
+    """Stock on hand for every part as of last_movement_id"""
+    __tablename__ = "stock_snapshot"
+    id = db.Column(db.Integer, primary_key=True)
+    last_movement_id = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class StockSnapshotLine(db.Model):
+    __tablename__ = "stock_snapshot_line"
+    snapshot_id = db.Column(db.Integer, db.ForeignKey("stock_snapshot.id"), primary_key=True)
+    part_number = db.Column(db.String(64), primary_key=True)
+    on_hand = db.Column(db.Integer, nullable=False)
+
+class DemandPartDaily(db.Model):
+    """Per-part demand for one UTC day, maintained by record_demand"""
+    __tablename__ = "demand_part_daily"
+    day = db.Column(db.Date, primary_key=True)
+    part_number = db.Column(db.String(64), primary_key=True)
+    qty_dispatched = db.Column(db.Integer, nullable=False, default=0)
+    dispatch_lines = db.Column(db.Integer, nullable=False, default=0)
+    qty_cancelled = db.Column(db.Integer, nullable=False, default=0)
+    back_orders_raised = db.Column(db.Integer, nullable=False, default=0)
+
+class DemandEngineerDaily(db.Model):
+    """Per-engineer demand for one UTC day, maintained by record_demand"""
+    __tablename__ = "demand_engineer_daily"
+    day = db.Column(db.Date, primary_key=True)
+    engineer_email = db.Column(db.String(120), primary_key=True)
+    qty_dispatched = db.Column(db.Integer, nullable=False, default=0)
+    dispatch_lines = db.Column(db.Integer, nullable=False, default=0)
+    qty_cancelled = db.Column(db.Integer, nullable=False, default=0)
+    back_orders_raised = db.Column(db.Integer, nullable=False, default=0)
+
+class EmailOutbox(db.Model):
+    __tablename__ = "email_outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    dispatch_note_id = db.Column(db.Integer, db.ForeignKey("dispatch_note.id"), nullable=True)
+    subject = db.Column(db.String(255), nullable=True)
+    body = db.Column(db.Text, nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    dispatch_note = db.relationship("DispatchNote")
+
+class EngineerOutstandingSummary(db.Model):
+    """Per-engineer outstanding totals, kept current by the routes that change them"""
+    __tablename__ = "engineer_outstanding_summary"
+    email = db.Column(db.String(120), primary_key=True)
+    outstanding_qty = db.Column(db.Integer, nullable=False, default=0)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    back_order_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AppState(db.Model):
+    """Small key/value store for bookkeeping such as sync watermarks"""
+    __tablename__ = "app_state"
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(255), nullable=True)
+
+class CataloguePart(db.Model):
+    """Local mirror of the GitHub parts CSV; every catalogue read is served from here"""
+    __tablename__ = "catalogue_part"
+    product_code = db.Column(db.String, primary_key=True)
+    description = db.Column(db.String, nullable=False, default="")
+    category = db.Column(db.String, nullable=False, default="")
+    make = db.Column(db.String, nullable=False, default="")
+    manufacturer = db.Column(db.String, nullable=False, default="")
+    image = db.Column(db.String, nullable=False, default="")
+
 class HiddenPart(db.Model):
     __tablename__ = "hidden_part"
     part_number = db.Column(db.String, primary_key=True)
@@ -108,285 +518,1604 @@ class HiddenPart(db.Model):
 
 # ── Helper Functions ──────────────────────────────────────────────────────────
 
-def get_outstanding_items(engineer_email: str):
+def outstanding_items_query(engineer_email: str):
     return (
         db.session.query(PartsOrderItem)
         .join(PartsOrder, PartsOrder.id == PartsOrderItem.order_id)
         .filter(
             PartsOrder.email == engineer_email,
-            (PartsOrderItem.quantity - func.coalesce(PartsOrderItem.quantity_sent, 0)) > 0
+            PartsOrderItem.qty_remaining > 0
         )
+        .options(contains_eager(PartsOrderItem.order))
         .order_by(PartsOrderItem.id.asc())
-        .all()
     )
 
+def get_outstanding_items(engineer_email: str):
+    return outstanding_items_query(engineer_email).all()
+
 def get_back_orders(engineer_email: str):
     return (
+        outstanding_items_query(engineer_email)
+        .filter(PartsOrderItem.back_order.is_(True))
+        .all()
+    )
+
+def get_back_orders_by_engineer(engineer_emails):
+    """Back orders for several engineers in one query, as {email: [items]}"""
+    by_email = {email: [] for email in engineer_emails}
+    if not by_email:
+        return by_email
+    items = (
         db.session.query(PartsOrderItem)
         .join(PartsOrder, PartsOrder.id == PartsOrderItem.order_id)
         .filter(
-            PartsOrder.email == engineer_email,
+            PartsOrder.email.in_(by_email),
+            PartsOrderItem.qty_remaining > 0,
             PartsOrderItem.back_order.is_(True),
-            (PartsOrderItem.quantity - func.coalesce(PartsOrderItem.quantity_sent, 0)) > 0
         )
+        .options(contains_eager(PartsOrderItem.order))
         .order_by(PartsOrderItem.id.asc())
-        .all()
     )
+    for item in items:
+        by_email[item.order.email].append(item)
+    return by_email
+
+def get_app_state(key: str, default=None):
+    row = db.session.get(AppState, key)
+    return row.value if row and row.value is not None else default
+
+def set_app_state(key: str, value) -> None:
+    row = db.session.get(AppState, key)
+    if row is None:
+        db.session.add(AppState(key=key, value=str(value)))
+    else:
+        row.value = str(value)
+
+# ── Engineer Outstanding Summary ──────────────────────────────────────────────
+
+def compute_engineer_totals(emails=None):
+    """Aggregate outstanding qty, lines and back orders per engineer from the order tables"""
+    remaining = PartsOrderItem.qty_remaining
+    is_outstanding = remaining > 0
+    query = (
+        db.session.query(
+            PartsOrder.email,
+            func.coalesce(func.sum(case((is_outstanding, remaining), else_=0)), 0),
+            func.coalesce(func.sum(case((is_outstanding, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((and_(is_outstanding, PartsOrderItem.back_order.is_(True)), 1), else_=0)), 0),
+        )
+        .join(PartsOrderItem)
+        .group_by(PartsOrder.email)
+    )
+    if emails is not None:
+        query = query.filter(PartsOrder.email.in_(emails))
+    return {email: (int(qty), int(lines), int(back)) for email, qty, lines, back in query.all()}
+
+def refresh_engineer_summaries(emails) -> None:
+    """Recompute the summary rows for the given engineers within the current transaction.
+
+    Engineers left with no order lines at all are dropped, matching the old
+    GROUP BY which only listed engineers that had items.
+    """
+    emails = set(emails)
+    if not emails:
+        return
+    totals = compute_engineer_totals(emails)
+    existing = {
+        row.email: row
+        for row in db.session.query(EngineerOutstandingSummary).filter(EngineerOutstandingSummary.email.in_(emails))
+    }
+    for email in emails:
+        row = existing.get(email)
+        if email not in totals:
+            if row is not None:
+                db.session.delete(row)
+            continue
+        qty, lines, back = totals[email]
+        if row is None:
+            db.session.add(EngineerOutstandingSummary(email=email, outstanding_qty=qty, line_count=lines, back_order_count=back))
+        elif (row.outstanding_qty, row.line_count, row.back_order_count) != (qty, lines, back):
+            row.outstanding_qty, row.line_count, row.back_order_count = qty, lines, back
+
+def rebuild_engineer_summaries() -> None:
+    """Recompute every engineer's summary row from scratch"""
+    db.session.query(EngineerOutstandingSummary).delete()
+    for email, (qty, lines, back) in compute_engineer_totals().items():
+        db.session.add(EngineerOutstandingSummary(email=email, outstanding_qty=qty, line_count=lines, back_order_count=back))
+    set_app_state("summary_max_item_id", db.session.query(func.max(PartsOrderItem.id)).scalar() or 0)
+
+def sync_engineer_summaries() -> None:
+    """Fold in order lines written by the engineer-facing app since the last sync.
+
+    New lines are found by comparing max(parts_order_item.id) with a stored
+    watermark and refreshing only the engineers who own them. Ids are handed
+    out before commit, so a line can land below a watermark a sync has
+    already passed; every sync re-scans the newest SUMMARY_SYNC_OVERLAP_IDS
+    ids to catch those. Edits and deletions leave no trace in the ids; they
+    are picked up by `flask rebuild-engineer-summary`, run from cron. A sync
+    never rebuilds the whole table itself, though with no watermark yet it
+    refreshes every engineer once.
+    """
+    max_item_id = db.session.query(func.max(PartsOrderItem.id)).scalar() or 0
+    watermark = int(get_app_state("summary_max_item_id") or 0)
+    if watermark >= max_item_id:
+        return
+
+    try:
+        new_emails = (
+            db.session.query(PartsOrder.email)
+            .join(PartsOrderItem)
+            .filter(PartsOrderItem.id > watermark - SUMMARY_SYNC_OVERLAP_IDS)
+            .distinct()
+        )
+        refresh_engineer_summaries(email for (email,) in new_emails)
+        set_app_state("summary_max_item_id", max_item_id)
+        db.session.commit()
+    except IntegrityError:
+        # Another request synced the same engineers first
+        db.session.rollback()
+
+@app.cli.command("rebuild-engineer-summary")
+def rebuild_engineer_summary_command():
+    """Recompute engineer_outstanding_summary from the order tables; run from cron."""
+    rebuild_engineer_summaries()
+    db.session.commit()
+    click.echo("Engineer outstanding summary rebuilt")
+
+def load_engineer_detail(engineer_email: str, history_cursor=None, history_per_page=ENGINEER_HISTORY_PER_PAGE):
+    """Everything the engineer detail screen shows, in four queries.
+
+    Outstanding lines come back with their parent orders in one joined query,
+    back orders are picked out of them in memory, stock on hand for those
+    parts is one lookup, and the engineer's dispatch history is one keyset
+    page plus its items.
+    """
+    outstanding_items = get_outstanding_items(engineer_email)
+    stock_on_hand = get_stock_balances(item.part_number for item in outstanding_items)
+    history_query = db.session.query(DispatchNote).filter(DispatchNote.engineer_email == engineer_email)
+    dispatches, next_cursor = paginate_dispatch_notes(history_query, history_cursor, history_per_page)
+    return SimpleNamespace(
+        outstanding_items=outstanding_items,
+        back_orders=[item for item in outstanding_items if item.back_order],
+        stock_on_hand=stock_on_hand,
+        engineer_dispatches=dispatches,
+        history_next_cursor=next_cursor,
+    )
+
+def parse_date_arg(value, end_of_day=False):
+    """Parse a YYYY-MM-DD query argument; returns None when blank or malformed"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.strptime(value.strip(), "%Y-%m-%d")
+    except ValueError:
+        return None
+    return parsed + timedelta(days=1) if end_of_day else parsed
+
+def clamp_per_page(value, default=DISPATCH_HISTORY_PER_PAGE, maximum=DISPATCH_HISTORY_MAX_PER_PAGE):
+    try:
+        per_page = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(per_page, maximum))
+
+def encode_dispatch_cursor(dispatch) -> str:
+    return f"{dispatch.date.isoformat()}_{dispatch.id}"
+
+def decode_dispatch_cursor(cursor):
+    """Turn a cursor from encode_dispatch_cursor back into (date, id); None if invalid"""
+    try:
+        date_part, id_part = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (AttributeError, ValueError):
+        return None
+
+def dispatch_history_query(note_model=DispatchNote, engineer=None, start=None, end=None):
+    """A query over note_model (DispatchNote or DispatchNoteArchive) filtered by engineer and [start, end)"""
+    query = db.session.query(note_model)
+    if engineer:
+        query = query.filter(note_model.engineer_email == engineer)
+    if start:
+        query = query.filter(note_model.date >= start)
+    if end:
+        query = query.filter(note_model.date < end)
+    return query
+
+def dispatch_page_windows(query, cursor=None, per_page=DISPATCH_HISTORY_PER_PAGE, archived_query=None):
+    """(note model, query) for each table behind one page: seeked past cursor, newest first, per_page + 1 rows"""
+    position = decode_dispatch_cursor(cursor) if cursor else None
+    windows = []
+    for q in (query, archived_query):
+        if q is None:
+            continue
+        note = q.column_descriptions[0]["entity"]
+        if position:
+            before_date, before_id = position
+            q = q.filter(or_(
+                note.date < before_date,
+                and_(note.date == before_date, note.id < before_id),
+            ))
+        windows.append((note, q.order_by(note.date.desc(), note.id.desc()).limit(per_page + 1)))
+    return windows
+
+def paginate_dispatch_notes(query, cursor=None, per_page=DISPATCH_HISTORY_PER_PAGE, with_items=True, archived_query=None):
+    """Keyset-paginate a DispatchNote query, newest first, with items eager-loaded unless with_items is False.
+
+    Returns (dispatches, next_cursor); next_cursor is None on the last page.
+    Seeking on (date, id) keeps every page as cheap as the first, however much
+    history there is. Pass archived_query (over DispatchNoteArchive) to page
+    through archived notes as well; archived notes keep their ids, so both
+    tables seek on the same cursor and the two pages merge into one.
+    """
+    rows = []
+    for note, window in dispatch_page_windows(query, cursor, per_page, archived_query):
+        if with_items:
+            window = window.options(selectinload(note.items))
+        rows.extend(window.all())
+
+    if archived_query is not None:
+        rows.sort(key=lambda d: (d.date, d.id), reverse=True)
+    if len(rows) > per_page:
+        return rows[:per_page], encode_dispatch_cursor(rows[per_page - 1])
+    return rows, None
+
+# ── GitHub Client ─────────────────────────────────────────────────────────────
+
+def git_blob_sha(content: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+class GitHubClient:
+    """Shared, pooled HTTP client for every call to GitHub.
+
+    One keep-alive requests.Session serves both raw.githubusercontent.com and
+    api.github.com. Connection errors, 429 and 5xx responses are retried with
+    full-jitter exponential backoff, honouring Retry-After. Once
+    X-RateLimit-Remaining reaches zero, calls wait for the reset (up to
+    GITHUB_RATE_LIMIT_MAX_WAIT seconds) rather than burning requests on 403s.
+    Per-call latency is recorded by call name. Base URLs are configurable so
+    the client can be pointed at the fake in tests/fakes.py.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_url, raw_url, max_retries=3, backoff_base=0.5, pool_size=10, rate_limit_max_wait=30):
+        self.api_url = api_url
+        self.raw_url = raw_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.rate_limit_max_wait = rate_limit_max_wait
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._metrics = {}
+        # Callables taking (name, elapsed_ms), run after every attempt
+        self.observers = []
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+
+    def auth_headers(self):
+        headers = {'Accept': 'application/vnd.github+json', 'X-GitHub-Api-Version': '2022-11-28'}
+        if GITHUB_TOKEN:
+            headers['Authorization'] = f'Bearer {GITHUB_TOKEN}'
+        return headers
+
+    def _record(self, name, elapsed_ms, status, retried):
+        with self._lock:
+            m = self._metrics.setdefault(name, {"calls": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0})
+            m["calls"] += 1
+            m["retries"] += retried
+            m["errors"] += status is None or status >= 400
+            m["total_ms"] += elapsed_ms
+            m["max_ms"] = max(m["max_ms"], elapsed_ms)
+        for observer in self.observers:
+            observer(name, elapsed_ms)
+
+    def _note_rate_limit(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is not None and remaining.isdigit():
+            self.rate_limit_remaining = int(remaining)
+        if reset is not None and reset.isdigit():
+            self.rate_limit_reset = int(reset)
+
+    def _wait_for_rate_limit(self):
+        if self.rate_limit_remaining == 0 and self.rate_limit_reset:
+            delay = self.rate_limit_reset - time.time()
+            if delay > 0:
+                github_log.warning("GitHub rate limit exhausted; waiting %.1fs", min(delay, self.rate_limit_max_wait))
+                time.sleep(min(delay, self.rate_limit_max_wait))
+            self.rate_limit_remaining = None
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.rate_limit_max_wait)
+            if response.headers.get("X-RateLimit-Remaining") == "0" and response.headers.get("X-RateLimit-Reset", "").isdigit():
+                return min(max(0.0, int(response.headers["X-RateLimit-Reset"]) - time.time()), self.rate_limit_max_wait)
+        return random.uniform(0, self.backoff_base * 2 ** attempt)
+
+    def _should_retry(self, response):
+        if response.status_code in self.RETRY_STATUSES:
+            return True
+        # Secondary and primary rate limits come back as 403 with these headers
+        return response.status_code == 403 and (
+            response.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in response.headers
+        )
+
+    def request(self, name, method, url, timeout=10, **kwargs):
+        """Send a request with retries; raises requests.RequestException once retries run out"""
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(name, (time.perf_counter() - start) * 1000, None, attempt > 0)
+                if attempt == self.max_retries:
+                    raise
+                github_log.info("%s %s failed (%s); retrying", method, name, e)
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            self._record(name, (time.perf_counter() - start) * 1000, response.status_code, attempt > 0)
+            self._note_rate_limit(response)
+            if attempt < self.max_retries and self._should_retry(response):
+                delay = self._retry_delay(attempt, response)
+                github_log.info("%s %s returned %s; retrying in %.2fs", method, name, response.status_code, delay)
+                time.sleep(delay)
+                continue
+            return response
+
+    def fetch_raw(self, path, etag=None, timeout=10):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.request("raw_get", "GET", f"{self.raw_url}/{GITHUB_REPO}/main/{path}", headers=headers, timeout=timeout)
+
+    def get_contents(self, path, timeout=10):
+        return self.request("contents_get", "GET", f"{self.api_url}/repos/{GITHUB_REPO}/contents/{path}",
+                            headers=self.auth_headers(), timeout=timeout)
+
+    def put_contents(self, path, payload, timeout=30):
+        return self.request("contents_put", "PUT", f"{self.api_url}/repos/{GITHUB_REPO}/contents/{path}",
+                            headers=self.auth_headers(), json=payload, timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            calls = {
+                name: dict(m, avg_ms=round(m["total_ms"] / m["calls"], 2) if m["calls"] else 0.0)
+                for name, m in self._metrics.items()
+            }
+        return {"calls": calls, "rate_limit_remaining": self.rate_limit_remaining, "rate_limit_reset": self.rate_limit_reset}
+
+github = GitHubClient(
+    GITHUB_API_URL, GITHUB_RAW_URL,
+    max_retries=GITHUB_MAX_RETRIES, backoff_base=GITHUB_BACKOFF_BASE,
+    pool_size=GITHUB_POOL_SIZE, rate_limit_max_wait=GITHUB_RATE_LIMIT_MAX_WAIT,
+)
+
+# ── Request Instrumentation ───────────────────────────────────────────────────
+#
+# Every request gets a RequestTimings in flask.g. SQLAlchemy cursor events add
+# query count and time (and remember the slowest statement), GitHubClient
+# observers add outbound HTTP time and the template signals add render time.
+# The totals go out as a Server-Timing header and into the per-route
+# histograms served at /metrics. Work outside a request (the outbox and sync
+# threads, CLI commands) is not counted.
+
+class RequestTimings:
+    __slots__ = ("started", "db_count", "db_ms", "slowest_ms", "slowest_sql",
+                 "http_count", "http_ms", "template_ms", "_template_started")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql = None
+        self.http_count = 0
+        self.http_ms = 0.0
+        self.template_ms = 0.0
+        self._template_started = []
+
+def current_timings():
+    return g.get("timings") if has_request_context() else None
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the per-statement context, so a statement that raises leaves nothing behind
+    if context is not None and current_timings() is not None:
+        context._stock_query_started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = current_timings()
+    started = getattr(context, "_stock_query_started", None)
+    if timings is None or started is None:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    timings.db_count += 1
+    timings.db_ms += elapsed_ms
+    if elapsed_ms > timings.slowest_ms:
+        timings.slowest_ms = elapsed_ms
+        timings.slowest_sql = statement
+
+def _record_github_call(name, elapsed_ms):
+    timings = current_timings()
+    if timings is not None:
+        timings.http_count += 1
+        timings.http_ms += elapsed_ms
+
+github.observers.append(_record_github_call)
+
+def _template_started(sender, template, context, **extra):
+    timings = current_timings()
+    if timings is not None:
+        timings._template_started.append(time.perf_counter())
+
+def _template_finished(sender, template, context, **extra):
+    timings = current_timings()
+    if timings is not None and timings._template_started:
+        started = timings._template_started.pop()
+        # Only the outermost render counts; nested renders are already inside it
+        if not timings._template_started:
+            timings.template_ms += (time.perf_counter() - started) * 1000
+
+before_render_template.connect(_template_started, app)
+template_rendered.connect(_template_finished, app)
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label tuple"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                base = ",".join(f'{k}="{prometheus_escape(v)}"' for k, v in zip(self.label_names, labels))
+                sep = "," if base else ""
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound:g}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{base}}} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{{{base}}} {series['count']}")
+        return "\n".join(lines)
+
+def prometheus_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+REQUEST_HISTOGRAMS = {
+    "duration": Histogram("stock_request_duration_seconds", "Time spent handling the request.", ("route", "method", "status"), SECONDS_BUCKETS),
+    "db": Histogram("stock_request_db_seconds", "Time spent in database statements per request.", ("route", "method"), SECONDS_BUCKETS),
+    "queries": Histogram("stock_request_db_queries", "Database statements executed per request.", ("route", "method"), COUNT_BUCKETS),
+    "http": Histogram("stock_request_http_seconds", "Time spent in GitHub HTTP calls per request.", ("route", "method"), SECONDS_BUCKETS),
+    "template": Histogram("stock_request_template_seconds", "Time spent rendering templates per request.", ("route", "method"), SECONDS_BUCKETS),
+}
+
+@app.before_request
+def start_request_timings():
+    g.timings = RequestTimings()
+
+@app.after_request
+def finish_request_timings(response):
+    timings = g.pop("timings", None)
+    if timings is None:
+        return response
+    total_ms = (time.perf_counter() - timings.started) * 1000
+    route = request.endpoint or "unmatched"
+    labels = (route, request.method)
+
+    REQUEST_HISTOGRAMS["duration"].observe(labels + (str(response.status_code),), total_ms / 1000)
+    REQUEST_HISTOGRAMS["db"].observe(labels, timings.db_ms / 1000)
+    REQUEST_HISTOGRAMS["queries"].observe(labels, timings.db_count)
+    REQUEST_HISTOGRAMS["http"].observe(labels, timings.http_ms / 1000)
+    REQUEST_HISTOGRAMS["template"].observe(labels, timings.template_ms / 1000)
+
+    if SERVER_TIMING_ENABLED:
+        response.headers.add("Server-Timing", ", ".join([
+            f'db;dur={timings.db_ms:.1f};desc="{timings.db_count} queries"',
+            f'db-slowest;dur={timings.slowest_ms:.1f}',
+            f'github;dur={timings.http_ms:.1f};desc="{timings.http_count} calls"',
+            f'render;dur={timings.template_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ]))
+
+    if total_ms >= SLOW_REQUEST_MS:
+        perf_log.warning(
+            "Slow request %s %s: %.0fms (db %.0fms over %d queries, github %.0fms, render %.0fms); slowest statement %.0fms: %s",
+            request.method, request.path, total_ms, timings.db_ms, timings.db_count, timings.http_ms,
+            timings.template_ms, timings.slowest_ms, (timings.slowest_sql or "")[:500],
+        )
+    return response
+
+@app.route("/metrics")
+def metrics():
+    """Per-route request histograms in the Prometheus text exposition format"""
+    body = "\n".join(h.render() for h in REQUEST_HISTOGRAMS.values()) + "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+# ── Catalogue Store ───────────────────────────────────────────────────────────
+
+CATALOGUE_FIELDS = ('description', 'category', 'make', 'manufacturer', 'image')
+
+class CatalogueStore:
+    """Column-oriented in-memory catalogue.
+
+    Each field is one list of strings, so a part costs a few list slots rather
+    than a dict of six keys. Category, make and manufacturer repeat heavily
+    and are interned, so every part shares one copy of each distinct value.
+
+    Two indexes are kept alongside the columns: `slot_of` maps product code
+    to row for O(1) lookup, and `sorted_codes` is the live product codes in
+    order. Adds and deletes find their place in `sorted_codes` by bisect, but
+    the list insert or delete itself shifts the pointers after it, so they
+    are O(N); codes arriving in order, as from the CSV or the mirror, are
+    appended in O(1). Iteration, positional access and tuples() all follow
+    `sorted_codes`, which is the order the CSV is written in.
+
+    Deleting a part tombstones its row (it drops out of both indexes). Once
+    tombstones outnumber live rows the columns are compacted, which renumbers
+    every row, so rows and PartRows taken before a delete must be looked up
+    again after it.
+    """
+
+    FIELDS = ('product_code',) + CATALOGUE_FIELDS
+    INTERNED = frozenset(('category', 'make', 'manufacturer'))
+    # Below this many tombstones compacting is not worth the copy
+    COMPACT_MIN_TOMBSTONES = 64
+
+    def __init__(self):
+        self.columns = {field: [] for field in self.FIELDS}
+        self.slot_of = {}
+        self.sorted_codes = []
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a store from (product_code, description, ...) tuples in FIELDS order"""
+        store = cls()
+        for row in rows:
+            store.append(row)
+        return store
+
+    def _store_value(self, field, value):
+        value = value or ''
+        return sys.intern(value) if field in self.INTERNED else value
+
+    def append(self, values):
+        """Add a part from a tuple in FIELDS order; returns its row"""
+        code = values[0]
+        if code in self.slot_of:
+            raise KeyError(f"Part {code} already exists")
+        row = len(self.columns['product_code'])
+        for field, value in zip(self.FIELDS, values):
+            self.columns[field].append(self._store_value(field, value))
+        self.slot_of[code] = row
+        codes = self.sorted_codes
+        if not codes or codes[-1] < code:
+            codes.append(code)      # rows arriving in order, as from the CSV or the mirror
+        else:
+            insort(codes, code)
+        return row
+
+    def set(self, row, field, value):
+        if field == 'product_code':
+            raise KeyError("product_code cannot be changed in place")
+        self.columns[field][row] = self._store_value(field, value)
+
+    def delete(self, product_code):
+        """Tombstone a part; returns False if it was not present"""
+        if self.slot_of.pop(product_code, None) is None:
+            return False
+        codes = self.sorted_codes
+        del codes[bisect_left(codes, product_code)]
+        if self.tombstones > max(self.COMPACT_MIN_TOMBSTONES, len(codes)):
+            self.compact()
+        return True
+
+    @property
+    def tombstones(self):
+        return len(self.columns['product_code']) - len(self.slot_of)
+
+    def compact(self):
+        """Drop tombstoned rows, renumbering the live ones in product code order"""
+        rows = self.live_rows()
+        for field, column in self.columns.items():
+            self.columns[field] = [column[row] for row in rows]
+        self.slot_of = {code: row for row, code in enumerate(self.sorted_codes)}
+
+    def live_rows(self):
+        """Row numbers of the live parts, in product code order"""
+        slot_of = self.slot_of
+        return [slot_of[code] for code in self.sorted_codes]
+
+    def get(self, product_code):
+        row = self.slot_of.get(product_code)
+        return None if row is None else PartRow(self, row)
+
+    def tuples(self):
+        """Iterate live rows as plain tuples in FIELDS order, sorted by product code"""
+        columns = [self.columns[field] for field in self.FIELDS]
+        for row in self.live_rows():
+            yield tuple(column[row] for column in columns)
+
+    def __contains__(self, product_code):
+        return product_code in self.slot_of
+
+    def __len__(self):
+        return len(self.sorted_codes)
+
+    def __getitem__(self, position):
+        return PartRow(self, self.slot_of[self.sorted_codes[position]])
+
+    def __iter__(self):
+        for row in self.live_rows():
+            yield PartRow(self, row)
+
+class PartRow:
+    """View of one catalogue row; supports part.field, part['field'] and part.get()"""
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getattr__(self, field):
+        try:
+            return self._store.columns[field][self._row]
+        except KeyError:
+            raise AttributeError(field) from None
+
+    def __getitem__(self, field):
+        return self._store.columns[field][self._row]
+
+    def __setitem__(self, field, value):
+        self._store.set(self._row, field, value)
+
+    def get(self, field, default=None):
+        column = self._store.columns.get(field)
+        return default if column is None else column[self._row]
+
+    def keys(self):
+        return CatalogueStore.FIELDS
+
+    def to_dict(self):
+        return {field: self._store.columns[field][self._row] for field in CatalogueStore.FIELDS}
+
+    def __eq__(self, other):
+        if isinstance(other, PartRow):
+            return self._store is other._store and self._row == other._row
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self._store), self._row))
+
+    def __repr__(self):
+        return f"<PartRow {self['product_code']}>"
 
 # ── GitHub CSV Functions (Debug Version) ─────────────────────────────────────
 
 def fetch_csv_from_github():
     """Fetch CSV content directly from GitHub repository"""
-    github_url = f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/{CSV_FILE_PATH}"
+    _, csv_content, _ = fetch_csv_from_github_conditional()
+    return csv_content
+
+def fetch_csv_from_github_conditional(etag=None):
+    """Fetch CSV content, sending If-None-Match when an ETag is known.
+
+    Returns (status_code, csv_content, etag). A 304 comes back with no content;
+    any failure comes back as (None, None, None).
+    """
     try:
-        response = requests.get(github_url, timeout=10)
+        response = github.fetch_raw(CSV_FILE_PATH, etag)
+        if response.status_code == 304:
+            return 304, None, etag
         response.raise_for_status()
-        return response.text
+        return response.status_code, response.text, response.headers.get('ETag')
     except requests.RequestException as e:
-        print(f"Error fetching CSV from GitHub: {e}")
-        return None
+        github_log.warning("Error fetching CSV from GitHub: %s", e)
+        return None, None, None
 
 def parse_csv_content(csv_content):
-    """Parse CSV content into list of part dictionaries"""
+    """Parse CSV content into a CatalogueStore"""
+    store = CatalogueStore()
     if not csv_content:
-        return []
+        return store
     
     try:
         reader = csv.DictReader(io.StringIO(csv_content))
-        parts = []
         for row in reader:
-            part = {
-                'product_code': (row.get('Product Code') or row.get('product_code', '')).strip(),
-                'description': (row.get('Description') or row.get('description', '')).strip(),
-                'category': (row.get('Category') or row.get('category', '')).strip(),
-                'make': (row.get('Make') or row.get('make', '')).strip(),
-                'manufacturer': (row.get('Manufacturer') or row.get('manufacturer', '')).strip(),
-                'image': (row.get('image') or row.get('Image', '')).strip()
-            }
-            if part['product_code']:
-                parts.append(part)
-        return parts
+            product_code = (row.get('Product Code') or row.get('product_code', '')).strip()
+            if product_code and product_code not in store:
+                store.append((
+                    product_code,
+                    (row.get('Description') or row.get('description', '')).strip(),
+                    (row.get('Category') or row.get('category', '')).strip(),
+                    (row.get('Make') or row.get('make', '')).strip(),
+                    (row.get('Manufacturer') or row.get('manufacturer', '')).strip(),
+                    (row.get('image') or row.get('Image', '')).strip(),
+                ))
+        return store
     except Exception as e:
-        print(f"Error parsing CSV: {e}")
-        return []
+        catalogue_log.exception("Error parsing CSV: %s", e)
+        return CatalogueStore()
 
 def get_github_file_info():
-    """DEBUG VERSION: Get file content and SHA from GitHub API"""
-    print("=== DEBUG: get_github_file_info called ===")
-    
+    """Get file content and SHA from GitHub API"""
     if not GITHUB_TOKEN:
-        print("ERROR: No GITHUB_TOKEN provided")
+        github_log.error("No GITHUB_TOKEN provided")
         return None, None
     
-    print(f"Using GITHUB_TOKEN: {GITHUB_TOKEN[:10]}...")
-    print(f"Repository: {GITHUB_REPO}")
-    print(f"File path: {CSV_FILE_PATH}")
-    
     try:
-        api_url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{CSV_FILE_PATH}"
-        print(f"API URL: {api_url}")
-        
-        headers = {
-            'Authorization': f'Bearer {GITHUB_TOKEN}',
-            'Accept': 'application/vnd.github+json',
-            'X-GitHub-Api-Version': '2022-11-28'
-        }
-        print(f"Request headers: {headers}")
-        
-        print("Making request to GitHub API...")
-        response = requests.get(api_url, headers=headers, timeout=10)
-        print(f"Response status: {response.status_code}")
-        print(f"Response headers: {dict(response.headers)}")
+        response = github.get_contents(CSV_FILE_PATH)
         
         if response.status_code != 200:
-            print(f"ERROR: GitHub API returned {response.status_code}")
-            print(f"Response text: {response.text}")
+            github_log.error("GitHub API returned %s for %s: %s", response.status_code, CSV_FILE_PATH, response.text[:500])
             return None, None
         
-        response.raise_for_status()
-        
         file_data = response.json()
-        print(f"File data keys: {file_data.keys()}")
-        print(f"File SHA: {file_data.get('sha', 'NOT FOUND')}")
-        
         content = base64.b64decode(file_data['content']).decode('utf-8')
         sha = file_data['sha']
-        
-        print(f"Decoded content length: {len(content)} characters")
-        print(f"First 100 chars: {content[:100]}")
+        github_log.debug("Fetched %s from %s: %d characters, sha %s", CSV_FILE_PATH, GITHUB_REPO, len(content), sha)
         
         return content, sha
     except Exception as e:
-        print(f"Exception in get_github_file_info: {str(e)}")
-        traceback.print_exc()
+        github_log.exception("Exception in get_github_file_info: %s", e)
         return None, None
 
-def update_github_csv(parts_list, sha, commit_message):
-    """DEBUG VERSION: Update CSV file in GitHub repository"""
-    print("=== DEBUG: update_github_csv called ===")
-    print(f"Parts to write: {len(parts_list)}")
-    print(f"SHA: {sha}")
-    print(f"Commit message: {commit_message}")
-    
-    if not GITHUB_TOKEN:
-        error_msg = "GitHub token not configured"
-        print(f"ERROR: {error_msg}")
-        return False, error_msg
+CSV_FIELDNAMES = ['Product Code', 'Description', 'Category', 'Make', 'Manufacturer', 'image']
+
+def serialize_parts_csv(store):
+    """Render a CatalogueStore back into the catalogue CSV format"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_FIELDNAMES)
+    if catalogue_log.isEnabledFor(logging.DEBUG):
+        # Per-row logging is DEBUG-only and sampled; in production nothing is logged per row
+        for i in range(0, len(store), LOG_ROW_SAMPLE):
+            catalogue_log.debug("Writing part %d: %s", i, store.sorted_codes[i])
+    # CSV_FIELDNAMES and CatalogueStore.FIELDS are in the same order
+    writer.writerows(store.tuples())
+    return output.getvalue()
+
+def put_github_csv(csv_content, sha, commit_message):
+    """PUT new CSV content to GitHub.
+
+    Returns (status_code, message); status_code is None if the request itself
+    failed, and 409 means `sha` is no longer the file's current SHA.
+    """
+    data = {
+        'message': commit_message,
+        'content': base64.b64encode(csv_content.encode('utf-8')).decode('utf-8'),
+        'sha': sha
+    }
     
     try:
-        # Convert parts list to CSV format
-        print("Converting parts to CSV format...")
-        output = io.StringIO()
-        fieldnames = ['Product Code', 'Description', 'Category', 'Make', 'Manufacturer', 'image']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for i, part in enumerate(parts_list):
-            print(f"Writing part {i}: {part['product_code']}")
-            writer.writerow({
-                'Product Code': part.get('product_code', ''),
-                'Description': part.get('description', ''),
-                'Category': part.get('category', ''),
-                'Make': part.get('make', ''),
-                'Manufacturer': part.get('manufacturer', ''),
-                'image': part.get('image', '')
-            })
-        
-        csv_content = output.getvalue()
-        print(f"Generated CSV length: {len(csv_content)} characters")
-        print(f"First 200 chars: {csv_content[:200]}")
-        
-        # Update in GitHub with fixed headers
-        api_url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{CSV_FILE_PATH}"
-        print(f"Update API URL: {api_url}")
-        
-        headers = {
-            'Authorization': f'Bearer {GITHUB_TOKEN}',
-            'Accept': 'application/vnd.github+json',
-            'X-GitHub-Api-Version': '2022-11-28',
-            'Content-Type': 'application/json'
-        }
-        print(f"Update headers: {headers}")
-        
-        encoded_content = base64.b64encode(csv_content.encode('utf-8')).decode('utf-8')
-        print(f"Encoded content length: {len(encoded_content)}")
-        
-        data = {
-            'message': commit_message,
-            'content': encoded_content,
-            'sha': sha
-        }
-        print(f"Request data keys: {data.keys()}")
-        
-        print("Making PUT request to GitHub...")
-        response = requests.put(api_url, json=data, headers=headers, timeout=30)
-        print(f"PUT response status: {response.status_code}")
-        print(f"PUT response headers: {dict(response.headers)}")
-        
-        if response.status_code not in [200, 201]:
-            print(f"ERROR: GitHub PUT returned {response.status_code}")
-            print(f"Response text: {response.text}")
-            return False, f"GitHub API error: {response.status_code} - {response.text}"
-        
-        response.raise_for_status()
-        
-        print("GitHub update successful!")
-        return True, "Successfully updated GitHub repository"
+        response = github.put_contents(CSV_FILE_PATH, data)
+    except requests.RequestException as e:
+        github_log.error("PUT %s failed: %s", CSV_FILE_PATH, e)
+        return None, f"Exception in put_github_csv: {str(e)}"
+    
+    if response.status_code not in [200, 201]:
+        github_log.error("GitHub PUT returned %s: %s", response.status_code, response.text[:500])
+        return response.status_code, f"GitHub API error: {response.status_code} - {response.text}"
+    
+    github_log.info("Updated %s (%d characters): %s", CSV_FILE_PATH, len(csv_content), commit_message)
+    try:
+        apply_catalogue_snapshot(csv_content)
+    except Exception:
+        # GitHub has the change; the sync job will bring the mirror up to date
+        db.session.rollback()
+        catalogue_log.exception("Could not update catalogue mirror after write")
+    return response.status_code, "Successfully updated GitHub repository"
+
+def update_github_csv(store, sha, commit_message):
+    """Update CSV file in GitHub repository"""
+    if not GITHUB_TOKEN:
+        error_msg = "GitHub token not configured"
+        github_log.error(error_msg)
+        return False, error_msg
+    
+    try:
+        csv_content = serialize_parts_csv(store)
+        status, message = put_github_csv(csv_content, sha, commit_message)
+        return status in (200, 201), message
         
     except Exception as e:
         error_msg = f"Exception in update_github_csv: {str(e)}"
-        print(f"ERROR: {error_msg}")
-        traceback.print_exc()
+        github_log.exception(error_msg)
         return False, error_msg
 
-# ── Email Functions ───────────────────────────────────────────────────────────
+# ── Batched Catalogue Writes ──────────────────────────────────────────────────
 
-def build_html_email(sent_items, back_orders, dispatch, generated_at=None) -> str:
-    generated_at = generated_at or datetime.utcnow()
+def normalize_catalogue_operation(raw):
+    """Validate one add/update/delete operation; returns (operation, error)"""
+    if not isinstance(raw, dict):
+        return None, "Operation must be an object"
+    op = str(raw.get('op', '')).strip().lower()
+    if op not in ('add', 'update', 'delete'):
+        return None, f"Unknown operation '{raw.get('op')}'"
+    product_code = str(raw.get('product_code') or '').strip()
+    if not product_code:
+        return None, "Product code is required"
+    operation = {'op': op, 'product_code': product_code}
+    if op != 'delete':
+        for field in CATALOGUE_FIELDS:
+            if field in raw and raw[field] is not None:
+                operation[field] = str(raw[field]).strip()
+            elif op == 'add':
+                operation[field] = ''
+    return operation, None
 
-    def esc(s):
-        return s or ""
+def apply_catalogue_operations(store, operations):
+    """Apply operations in order to a CatalogueStore, in place.
 
-    sent_rows = (
-        "".join(
-            f"<tr><td>{esc(s.part_number)}</td>"
-            f"<td>{esc(getattr(s, 'description', ''))}</td>"
-            f"<td style='text-align:right'>{int(s.quantity_sent or 0)}</td></tr>"
-            for s in sent_items
-        )
-        or "<tr><td colspan='3' style='text-align:center; color:#666'>(No items on this dispatch)</td></tr>"
-    )
+    Each operation succeeds or fails on its own; returns one result dict per
+    operation. The store keeps itself sorted by product code, as add_part
+    always did.
+    """
+    results = []
+
+    for operation in operations:
+        op, code = operation['op'], operation['product_code']
+        result = {'op': op, 'product_code': code, 'success': False}
+        if op == 'add':
+            if code in store:
+                result['message'] = f"Part {code} already exists"
+            else:
+                store.append((code,) + tuple(operation.get(f, '') for f in CATALOGUE_FIELDS))
+                result.update(success=True, message=f"Added part: {code}")
+        elif code not in store:
+            result['message'] = f"Part '{code}' not found in {len(store)} parts"
+        elif op == 'delete':
+            store.delete(code)
+            result.update(success=True, message=f"Deleted part: {code}")
+        else:
+            row = store.slot_of[code]
+            for f in CATALOGUE_FIELDS:
+                if f in operation:
+                    store.set(row, f, operation[f])
+            result.update(success=True, message=f"Updated part: {code}")
+        results.append(result)
+
+    return results
+
+def describe_catalogue_operations(operations):
+    """Default commit message for a set of operations"""
+    if len(operations) == 1:
+        verb = {'add': 'Add new part', 'update': 'Update part', 'delete': 'Delete part'}[operations[0]['op']]
+        return f"{verb}: {operations[0]['product_code']}"
+    counts = {}
+    for operation in operations:
+        counts[operation['op']] = counts.get(operation['op'], 0) + 1
+    summary = ", ".join(f"{n} {op}" for op, n in sorted(counts.items()))
+    return f"Batch catalogue update: {len(operations)} changes ({summary})"
+
+def commit_catalogue_operations(operations, commit_message=None):
+    """Apply operations to the current catalogue and write them as one commit.
+
+    If GitHub rejects the write because another commit landed first (409),
+    the operations are re-applied on top of the new content and retried.
+    Returns (success, message, results).
+    """
+    if not GITHUB_TOKEN:
+        return False, "GitHub token not configured", []
 
-    bo_rows = (
-        "".join(
-            f"<tr><td>{esc(bo.part_number)}</td>"
-            f"<td>{esc(bo.description)}</td>"
-            f"<td style='text-align:right'>{int((bo.quantity or 0) - (bo.quantity_sent or 0))}</td>"
-            f"<td>{bo.order.date.strftime('%d %b %Y')}</td></tr>"
-            for bo in back_orders
-            if (bo.quantity or 0) - (bo.quantity_sent or 0) > 0
+    results = []
+    for attempt in range(CATALOGUE_WRITE_RETRIES):
+        csv_content, sha = get_github_file_info()
+        if csv_content is None:
+            return False, "Could not access GitHub API. Check your GITHUB_TOKEN.", results
+
+        store = parse_csv_content(csv_content)
+        results = apply_catalogue_operations(store, operations)
+        if not any(r['success'] for r in results):
+            return False, "; ".join(r['message'] for r in results), results
+
+        status, message = put_github_csv(serialize_parts_csv(store), sha, commit_message or describe_catalogue_operations(operations))
+        if status in (200, 201):
+            return True, message, results
+        if status != 409:
+            return False, message, results
+        catalogue_log.info("SHA conflict writing catalogue (attempt %d), rebasing %d operations", attempt + 1, len(operations))
+
+    return False, "GitHub file kept changing; gave up after repeated SHA conflicts", results
+
+class CatalogueWriteBuffer:
+    """Server-side buffer that group-commits catalogue edits.
+
+    Edits submitted within CATALOGUE_WRITE_WINDOW seconds of each other are
+    applied to one copy of the CSV and written as a single GitHub commit by a
+    background flusher thread. Each submitter gets back the results for its
+    own operations.
+    """
+
+    def __init__(self, flask_app, window):
+        self.app = flask_app
+        self.window = window
+        self._cond = threading.Condition()
+        self._pending = []
+        self._flusher = None
+
+    def submit(self, operations, commit_message=None, wait=True):
+        ticket = SimpleNamespace(
+            operations=operations, commit_message=commit_message, done=threading.Event(),
+            success=None, message=None, results=[],
         )
-        or "<tr><td colspan='4' style='text-align:center; color:#666'>No items on back order.</td></tr>"
-    )
-
-    html = f"""
-    <div style="font-family: system-ui, -apple-system, Segoe UI, Roboto, Arial, sans-serif; color:#111; line-height:1.4">
-      <h2 style="margin:0 0 8px 0">Dispatch Note — {dispatch.date.strftime('%d %b %Y')}</h2>
-      <p style="margin:0 0 12px 0"><strong>Engineer:</strong> {esc(dispatch.engineer_email)}<br>
-      <strong>Picked by:</strong> {esc(dispatch.picker_name or 'Unknown')}<br>
-      <span style="color:#666">Generated at {generated_at.strftime('%d %b %Y %H:%M UTC')}</span></p>
-
-      <h3 style="margin:16px 0 8px 0; font-size:18px">Items Sent</h3>
-      <table width="100%" cellpadding="8" cellspacing="0" border="1" style="border-collapse:collapse; border-color:#ddd">
-        <thead style="background:#f8f9fa">
-          <tr>
-            <th align="left">Part Number</th>
-            <th align="left">Description</th>
-            <th align="right">Quantity Sent</th>
-          </tr>
-        </thead>
-        <tbody>{sent_rows}</tbody>
-      </table>
-
-      <h3 style="margin:16px 0 8px 0; font-size:18px">Still on Back Order</h3>
-      <table width="100%" cellpadding="8" cellspacing="0" border="1" style="border-collapse:collapse; border-color:#ddd">
-        <thead style="background:#f8f9fa">
-          <tr>
-            <th align="left">Part Number</th>
-            <th align="left">Description</th>
-            <th align="right">Qty Remaining</th>
-            <th align="left">Order Date</th>
-          </tr>
-        </thead>
-        <tbody>{bo_rows}</tbody>
-      </table>
-
-      <p style="margin-top:16px">Thank you,<br>Servitech Stock System</p>
-    </div>
+        with self._cond:
+            self._pending.append(ticket)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="catalogue-writer", daemon=True)
+                self._flusher.start()
+            self._cond.notify()
+        if wait:
+            ticket.done.wait()
+        return ticket
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return sum(len(t.operations) for t in self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.window)
+            self.flush()
+
+    def flush(self):
+        with self._cond:
+            tickets, self._pending = self._pending, []
+        if not tickets:
+            return
+
+        operations = [op for t in tickets for op in t.operations]
+        commit_message = tickets[0].commit_message if len(tickets) == 1 else None
+        try:
+            with self.app.app_context():
+                success, message, results = commit_catalogue_operations(operations, commit_message)
+        except Exception as e:
+            catalogue_log.exception("Exception writing catalogue batch")
+            success, message, results = False, f"Exception writing catalogue: {str(e)}", []
+
+        offset = 0
+        for ticket in tickets:
+            ticket.results = results[offset:offset + len(ticket.operations)]
+            offset += len(ticket.operations)
+            # A batch can succeed overall while this submitter's own operations were all rejected
+            own_success = success and any(r['success'] for r in ticket.results)
+            ticket.success = own_success
+            ticket.message = message if success == own_success else "; ".join(
+                r.get('message', '') for r in ticket.results if not r['success']) or message
+            ticket.done.set()
+
+catalogue_write_buffer = CatalogueWriteBuffer(app, CATALOGUE_WRITE_WINDOW)
+
+# ── Catalogue Mirror ──────────────────────────────────────────────────────────
+#
+# GitHub holds the catalogue of record, but reads never go there: the CSV is
+# mirrored into catalogue_part by a background sync job, and writes update the
+# mirror straight after their commit lands. app_state keeps the mirrored
+# content's blob SHA ("catalogue_sha") and the raw file's ETag for polling.
+
+def load_catalogue_mirror():
+    """Load the mirrored parts into a CatalogueStore, ordered by product code"""
+    columns = [getattr(CataloguePart, f) for f in CatalogueStore.FIELDS]
+    rows = db.session.execute(select(*columns).order_by(CataloguePart.product_code))
+    return CatalogueStore.from_rows(rows)
+
+def lookup_catalogue_parts(product_codes):
+    """Map product codes to their mirrored CataloguePart rows, skipping unknown codes"""
+    codes = {c for c in product_codes if c}
+    if not codes:
+        return {}
+    return {p.product_code: p for p in CataloguePart.query.filter(CataloguePart.product_code.in_(codes))}
+
+def apply_catalogue_snapshot(csv_content, etag=None) -> bool:
+    """Bring catalogue_part in line with a CSV revision; returns True if anything changed.
+
+    Only the differences are written: new codes are inserted, changed rows
+    updated and vanished codes deleted.
+    """
+    sha = git_blob_sha(csv_content.encode("utf-8"))
+    if etag:
+        set_app_state("catalogue_etag", etag)
+    if get_app_state("catalogue_sha") == sha:
+        db.session.commit()
+        return False
+
+    incoming = {row[0]: row[1:] for row in parse_csv_content(csv_content).tuples()}
+    columns = [getattr(CataloguePart, f) for f in CATALOGUE_FIELDS]
+    existing = {row[0]: tuple(row[1:]) for row in db.session.execute(select(CataloguePart.product_code, *columns))}
+
+    inserts = [dict(zip(CATALOGUE_FIELDS, values), product_code=code) for code, values in incoming.items() if code not in existing]
+    updates = [
+        dict(zip(CATALOGUE_FIELDS, values), product_code=code)
+        for code, values in incoming.items()
+        if code in existing and existing[code] != values
+    ]
+    removed = [code for code in existing if code not in incoming]
+
+    if inserts:
+        db.session.execute(insert(CataloguePart), inserts)
+    if updates:
+        db.session.execute(update(CataloguePart), updates)
+    for i in range(0, len(removed), 500):
+        db.session.execute(delete(CataloguePart).where(CataloguePart.product_code.in_(removed[i:i + 500])))
+
+    set_app_state("catalogue_sha", sha)
+    set_app_state("catalogue_synced_at", datetime.utcnow().isoformat(timespec="seconds"))
+    db.session.commit()
+    catalogue_cache.invalidate()
+    catalogue_log.info("Catalogue mirror updated to %s: %d added, %d changed, %d removed",
+                       sha[:12], len(inserts), len(updates), len(removed))
+    return True
+
+def sync_catalogue_mirror() -> bool:
+    """Poll GitHub with the stored ETag and mirror the CSV if it changed"""
+    status, csv_content, etag = fetch_csv_from_github_conditional(get_app_state("catalogue_etag"))
+    if status == 304 or csv_content is None:
+        return False
+    try:
+        return apply_catalogue_snapshot(csv_content, etag)
+    except IntegrityError:
+        # Another worker mirrored the same revision at the same moment
+        db.session.rollback()
+        return False
+
+class CatalogueSyncWorker:
+    """Polling loop that keeps catalogue_part in step with GitHub.
+
+    Run it in exactly one process, via `flask catalogue-sync`; web workers
+    never call GitHub to read the catalogue. They only follow edits made
+    through this app, so an empty mirror stays empty, and edits made directly
+    on GitHub are not seen, until this process syncs.
     """
-    return html
 
-def send_dispatch_email(engineer_email: str, dispatch_id: int) -> None:
-    if not app.config["MAIL_PASSWORD"]:
-        print("Warning: Email not configured")
+    def __init__(self, flask_app, interval):
+        self.app = flask_app
+        self.interval = interval
+
+    def run_forever(self) -> None:
+        while True:
+            with self.app.app_context():
+                try:
+                    sync_catalogue_mirror()
+                except Exception:
+                    db.session.rollback()
+                    catalogue_log.exception("Catalogue sync failed")
+                finally:
+                    db.session.remove()
+            time.sleep(self.interval)
+
+catalogue_sync_worker = CatalogueSyncWorker(app, CATALOGUE_SYNC_INTERVAL)
+
+@app.cli.command("catalogue-sync")
+@click.option("--once", is_flag=True, help="Sync a single time and exit")
+def catalogue_sync_command(once):
+    """Mirror the GitHub catalogue CSV into catalogue_part; run in one process only."""
+    if once:
+        changed = sync_catalogue_mirror()
+        click.echo("Catalogue mirror updated" if changed else "Catalogue mirror already current")
         return
-    
-    dispatch = DispatchNote.query.get(dispatch_id)
-    if not dispatch:
+    catalogue_sync_worker.run_forever()
+
+# ── Catalogue Cache ───────────────────────────────────────────────────────────
+
+class CatalogueCache:
+    """In-process copy of the parsed catalogue, served from the local mirror.
+
+    Within the TTL reads are served straight from memory. Once it lapses the
+    next read compares the mirror's stored SHA with the cached one (a single
+    primary-key lookup); if it is unchanged the parsed copy is kept, otherwise
+    the mirror is reloaded. Nothing here talks to GitHub: until the
+    `catalogue-sync` process has filled the mirror, reads get None.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._csv_content = None
+        self._parts = None
+        self._version = None
+        self._expires_at = 0.0
+        self._index = None
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.errors = 0
+
+    def get_parts(self):
+        """Return the CatalogueStore, or None if the catalogue has never been loaded.
+
+        The store is shared between requests, so callers must not mutate it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._parts is not None and now < self._expires_at:
+                self.hits += 1
+                return self._parts
+
+            version = get_app_state("catalogue_sha")
+            if version is None:
+                self.errors += 1
+                return self._parts
+
+            if self._parts is not None and version == self._version:
+                self.revalidations += 1
+                self._expires_at = now + self.ttl
+                return self._parts
+
+            self.misses += 1
+            self._parts = load_catalogue_mirror()
+            self._csv_content = None
+            self._version = version
+            self._expires_at = now + self.ttl
+            return self._parts
+
+    def get_csv(self):
+        """Return the catalogue as CSV text, rendered once per catalogue version"""
+        parts = self.get_parts()
+        if parts is None:
+            return None
+        with self._lock:
+            if self._csv_content is None or self._parts is not parts:
+                self._csv_content = serialize_parts_csv(parts)
+            return self._csv_content
+
+    def get_index(self):
+        """Return the search index for the current catalogue, or None if nothing could be loaded.
+
+        The index is only rebuilt when a new catalogue version has been loaded.
+        """
+        parts = self.get_parts()
+        if parts is None:
+            return None
+        with self._lock:
+            if self._index is None or self._index.parts is not parts:
+                self._index = CatalogueSearchIndex(parts)
+            return self._index
+
+    @property
+    def version(self):
+        """Blob SHA of the catalogue currently held, or None before the first load"""
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._csv_content = None
+            self._parts = None
+            self._index = None
+            self._version = None
+            self._expires_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "errors": self.errors,
+                "cached_parts": len(self._parts) if self._parts is not None else 0,
+                "version": self._version,
+                "ttl_seconds": self.ttl,
+            }
+
+catalogue_cache = CatalogueCache(CATALOGUE_CACHE_TTL)
+
+# ── Catalogue Search Index ────────────────────────────────────────────────────
+
+class CatalogueSearchIndex:
+    """Prebuilt search structures over a CatalogueStore.
+
+    Each part's searchable fields (product code, description, make,
+    manufacturer) are lowercased once into a single haystack string, and every
+    trigram in them maps to the rows containing it. A query only verifies the
+    rows in its rarest trigram's posting list; one- and two-character queries
+    fall back to scanning the prebuilt haystacks. Categories are kept as an
+    inverted index from lowercased name to rows.
+    """
+
+    NGRAM = 3
+    SEARCH_FIELDS = ('product_code', 'description', 'make', 'manufacturer')
+
+    def __init__(self, parts):
+        self.parts = parts
+        grams = {}
+        category_rows = {}
+
+        # Positions here are places in catalogue order; _rows maps them to store rows
+        self._rows = parts.live_rows()
+        search_columns = [parts.columns[f] for f in self.SEARCH_FIELDS]
+        # \x00 separates fields so a match can never straddle two of them
+        self._haystacks = [
+            "\x00".join(column[row] for column in search_columns).lower()
+            for row in self._rows
+        ]
+        for row, haystack in enumerate(self._haystacks):
+            for gram in {haystack[i:i + self.NGRAM] for i in range(len(haystack) - self.NGRAM + 1)}:
+                grams.setdefault(gram, []).append(row)
+
+        # Categories are interned, so this groups by a handful of distinct strings
+        categories = parts.columns['category']
+        for position, row in enumerate(self._rows):
+            category = categories[row]
+            if category:
+                category_rows.setdefault(category, []).append(position)
+
+        by_lower = {}
+        for category, rows in category_rows.items():
+            by_lower.setdefault(category.lower(), []).extend(rows)
+        self._grams = {gram: array('I', rows) for gram, rows in grams.items()}
+        self._category_rows = {cat: array('I', sorted(rows)) for cat, rows in by_lower.items()}
+        self.categories = sorted(category_rows)
+
+    def _search_rows(self, query):
+        if len(query) < self.NGRAM:
+            return [row for row, haystack in enumerate(self._haystacks) if query in haystack]
+
+        postings = None
+        for i in range(len(query) - self.NGRAM + 1):
+            rows = self._grams.get(query[i:i + self.NGRAM])
+            if rows is None:
+                return []
+            if postings is None or len(rows) < len(postings):
+                postings = rows
+        return [row for row in postings if query in self._haystacks[row]]
+
+    def _category_rows_matching(self, category):
+        # Matches the old substring filter; there are few enough distinct categories to scan them
+        rows = set()
+        for name, cat_rows in self._category_rows.items():
+            if category in name:
+                rows.update(cat_rows)
+        return rows
+
+    def search(self, query='', category=''):
+        """Return parts matching the search text and category filter, in catalogue order"""
+        query = (query or '').lower()
+        category = (category or '').lower()
+
+        if not query and not category:
+            return list(self.parts)
+
+        if query:
+            rows = self._search_rows(query)
+            if category:
+                allowed = self._category_rows_matching(category)
+                rows = [row for row in rows if row in allowed]
+        else:
+            rows = sorted(self._category_rows_matching(category))
+
+        return [PartRow(self.parts, self._rows[position]) for position in rows]
+
+# ── Catalogue Thumbnails ──────────────────────────────────────────────────────
+#
+# Catalogue images live on an external host. /catalogue/thumbnail/<code>
+# fetches a part's image once, shrinks it to THUMBNAIL_SIZE pixels (when
+# Pillow is installed; otherwise the original is cached as-is) and keeps it
+# in a size-bounded directory, evicting least recently used files first.
+# Thumbnail URLs carry a version derived from the image URL, so browsers
+# may cache them for a year.
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def image_mimetype(head: bytes):
+    """Mimetype from an image's leading bytes; None if it is not an image we serve"""
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def resolve_image_url(image: str):
+    """Absolute URL for a catalogue image value; None if it is blank or relative with no IMAGE_BASE_URL"""
+    image = (image or "").strip()
+    if not image:
+        return None
+    if urlsplit(image).scheme in ("http", "https"):
+        return image
+    if not IMAGE_BASE_URL:
+        return None
+    return f"{IMAGE_BASE_URL}/{quote(image.lstrip('/'))}"
+
+def make_thumbnail(data: bytes, size: int) -> bytes:
+    """Shrink an image to fit size x size and re-encode it as JPEG"""
+    with Image.open(io.BytesIO(data)) as source:
+        source.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((size, size))
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            flattened = Image.new("RGB", image.size, (255, 255, 255))
+            flattened.paste(image, mask=image.getchannel("A"))
+            image = flattened
+        else:
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=85, optimize=True)
+    return out.getvalue()
+
+THUMBNAIL_ERRORS = (requests.RequestException, ValueError, OSError) + (
+    (Image.DecompressionBombError,) if Image is not None else ()
+)
+
+class ThumbnailCache:
+    """Thumbnails on disk, named by a hash of the source URL and size.
+
+    A hit bumps the file's mtime and eviction deletes the oldest mtimes until
+    the directory is back under 90% of max_bytes. The running size total is
+    per process and re-measured from the directory at each eviction, so
+    several workers sharing the directory still stay within bounds.
+    """
+
+    # Concurrent misses for one key share a lock so the image is fetched once;
+    # a fixed set of locks keeps memory flat however many URLs are requested
+    FETCH_LOCK_STRIPES = 64
+
+    def __init__(self, directory: str, max_bytes: int, size: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=THUMBNAIL_WARM_WORKERS, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._fetch_locks = [threading.Lock() for _ in range(self.FETCH_LOCK_STRIPES)]
+        # key -> monotonic time before which it is not refetched; insertion order is expiry order
+        self._failed_until = {}
+        self._total_bytes = None
+        self._evicting = False
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+
+    def key(self, url: str) -> str:
+        return hashlib.sha256(f"{self.size}:{url}".encode("utf-8")).hexdigest()
+
+    def get(self, url: str):
+        """Path of url's cached thumbnail, fetching it on a miss; None if the image cannot be fetched"""
+        key = self.key(url)
+        path = os.path.join(self.directory, key)
+        if self._touch(path):
+            with self._lock:
+                self.hits += 1
+            return path
+
+        with self._fetch_locks[int(key[:8], 16) % self.FETCH_LOCK_STRIPES]:
+            if self._touch(path):
+                # Fetched by another request while this one waited
+                return path
+            if self._failed_until.get(key, 0) > time.monotonic():
+                return None
+            with self._lock:
+                self.misses += 1
+            try:
+                data = self._fetch(url)
+            except THUMBNAIL_ERRORS as e:
+                catalogue_log.warning("Thumbnail fetch failed for %s: %s", url, e)
+                with self._lock:
+                    self.errors += 1
+                self._note_failure(key)
+                return None
+            self._store(path, data)
+            return path
+
+    def _note_failure(self, key: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._failed_until.pop(key, None)
+            self._failed_until[key] = now + THUMBNAIL_RETRY_AFTER
+            # Every entry gets the same delay, so expired ones are all at the front
+            while self._failed_until:
+                oldest = next(iter(self._failed_until))
+                if self._failed_until[oldest] > now:
+                    break
+                del self._failed_until[oldest]
+
+    def _touch(self, path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _fetch(self, url: str) -> bytes:
+        with self.session.get(url, timeout=THUMBNAIL_FETCH_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            chunks, received = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                received += len(chunk)
+                if received > THUMBNAIL_MAX_SOURCE_BYTES:
+                    raise ValueError(f"image is larger than {THUMBNAIL_MAX_SOURCE_BYTES} bytes")
+                chunks.append(chunk)
+        data = b"".join(chunks)
+        if image_mimetype(data[:16]) is None:
+            raise ValueError(f"not an image ({response.headers.get('Content-Type', 'unknown type')})")
+        return make_thumbnail(data, self.size) if Image is not None else data
+
+    def _store(self, path: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += len(data)
+            due = not self._evicting and (self._total_bytes is None or self._total_bytes > self.max_bytes)
+            self._evicting = self._evicting or due
+        if due:
+            self._evict()
+
+    def _scan(self):
+        """(mtime, size, path) for every cached thumbnail"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self) -> None:
+        """Re-measure the directory and delete the oldest thumbnails if it is over max_bytes.
+
+        One thread at a time runs this, and the scan and deletes happen
+        outside self._lock so other requests are not held up behind them.
+        """
+        with self._lock:
+            counted_before = self._total_bytes
+        total, evicted = None, 0
+        try:
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                target = self.max_bytes * 0.9
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    evicted += 1
+        finally:
+            with self._lock:
+                if total is not None:
+                    if counted_before is not None:
+                        # Thumbnails stored while the scan ran; some may be counted twice until the next scan
+                        total += self._total_bytes - counted_before
+                    self._total_bytes = total
+                self.evictions += evicted
+                self._evicting = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "thumbnail_size": self.size,
+                "resizing": Image is not None,
+            }
+
+thumbnail_cache = ThumbnailCache(
+    THUMBNAIL_CACHE_DIR or os.path.join(app.instance_path, "thumbnails"),
+    THUMBNAIL_CACHE_MAX_MB * 1024 * 1024,
+    THUMBNAIL_SIZE,
+)
+
+@app.template_global()
+def thumbnail_url(part):
+    """URL of a part's thumbnail, versioned by its image URL; None if the part has no usable image"""
+    image_url = resolve_image_url(part.image)
+    if image_url is None:
+        return None
+    return url_for("catalogue_thumbnail", product_code=part.product_code, v=thumbnail_cache.key(image_url)[:16])
+
+@app.route("/catalogue/thumbnail/<path:product_code>")
+def catalogue_thumbnail(product_code):
+    part = lookup_catalogue_parts([unquote(product_code)]).get(unquote(product_code))
+    image_url = resolve_image_url(part.image) if part else None
+    if image_url is None:
+        abort(404)
+
+    key = thumbnail_cache.key(image_url)
+    # A stale ?v= means the page was rendered before the image changed; don't let that stick
+    max_age = THUMBNAIL_MAX_AGE if request.args.get("v") == key[:16] else 300
+    if request.if_none_match.contains(key):
+        response = Response(status=304)
+    else:
+        path = thumbnail_cache.get(image_url)
+        if path is None:
+            abort(404)
+        with open(path, "rb") as f:
+            mimetype = image_mimetype(f.read(16)) or "application/octet-stream"
+        response = send_file(path, mimetype=mimetype, etag=key, max_age=max_age, conditional=True)
+    response.set_etag(key)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if max_age == THUMBNAIL_MAX_AGE:
+        response.cache_control.immutable = True
+    return response
+
+@app.route("/admin/catalogue/thumbnail_stats")
+def thumbnail_stats():
+    return jsonify(thumbnail_cache.stats())
+
+@app.cli.command("thumbnails-warm")
+@click.option("--workers", type=int, default=THUMBNAIL_WARM_WORKERS, help="Images fetched in parallel")
+def thumbnails_warm_command(workers):
+    """Fetch and cache the thumbnail of every catalogue part with an image."""
+    images = db.session.execute(select(CataloguePart.image).where(CataloguePart.image != "")).scalars()
+    urls = sorted({url for url in map(resolve_image_url, images) if url})
+    if not urls:
+        click.echo("No catalogue images to fetch (is IMAGE_BASE_URL set?)")
         return
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        cached = sum(path is not None for path in pool.map(thumbnail_cache.get, urls))
+    click.echo(
+        f"Cached {cached} of {len(urls)} thumbnails in {time.perf_counter() - started:.1f}s "
+        f"({len(urls) - cached} failed)"
+    )
 
-    sent_items = DispatchItem.query.filter_by(dispatch_note_id=dispatch_id).all()
-    back_orders = get_back_orders(engineer_email)
+# ── Dispatch Documents ────────────────────────────────────────────────────────
+#
+# A dispatch note never changes once recorded, so its header and items are
+# rendered (HTML and plain text) in the dispatch transaction and stored in
+# dispatch_document. The page, reprints and the email all reuse that copy. The
+# "still on back order" section is live, so it is rendered separately and
+# cached per engineer for BACK_ORDER_CACHE_TTL seconds.
 
-    subject = f"Dispatch Note - {dispatch.date.strftime('%d %b %Y')}"
-    
+def render_dispatch_document(dispatch, sent_items):
+    """Build the DispatchDocument for a note; sent_items need part_number, description and quantity_sent"""
     lines = []
-    lines.append("Hello,\n")
-    lines.append("Your dispatch has been processed.")
     if dispatch.picker_name:
         lines.append(f"Picker: {dispatch.picker_name}")
-    lines.append("")
-
+        lines.append("")
     lines.append("Items Sent:")
     if sent_items:
         for s in sent_items:
@@ -394,21 +2123,752 @@ def send_dispatch_email(engineer_email: str, dispatch_id: int) -> None:
     else:
         lines.append("- (No items recorded on this dispatch)")
 
-    if back_orders:
-        lines.append("\nItems Still on Back Order:")
-        for bo in back_orders:
-            remaining = (bo.quantity or 0) - (bo.quantity_sent or 0)
-            if remaining > 0:
-                lines.append(f"- {bo.part_number} ({bo.description or ''}): {remaining}")
+    return DispatchDocument(
+        dispatch_note_id=dispatch.id,
+        engineer_email=dispatch.engineer_email,
+        subject=f"Dispatch Note - {dispatch.date.strftime('%d %b %Y')}",
+        html=render_template("_dispatch_document.html", dispatch=dispatch, sent_items=sent_items),
+        text="\n".join(lines),
+    )
+
+def get_dispatch_document(dispatch_id: int):
+    """Return a note's stored document, rendering it first for notes recorded before documents existed.
+
+    Archived notes are found too. Returns None if there is no such dispatch note.
+    """
+    document = db.session.get(DispatchDocument, dispatch_id)
+    if document is not None:
+        return document
+
+    dispatch = db.session.get(DispatchNote, dispatch_id)
+    if dispatch is None:
+        return db.session.get(DispatchDocumentArchive, dispatch_id)
+    sent_items = DispatchItem.query.filter_by(dispatch_note_id=dispatch_id).order_by(DispatchItem.id).all()
+    db.session.add(render_dispatch_document(dispatch, sent_items))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Rendered by another request at the same time
+        db.session.rollback()
+    return db.session.get(DispatchDocument, dispatch_id)
+
+def load_dispatch_documents(notes_query, limit=None):
+    """Documents for the notes an ordered DispatchNote query selects, at most `limit` of them.
+
+    One query loads the notes with their documents. Notes recorded before
+    documents existed have their items loaded in one more query and their
+    documents rendered and stored in one batch.
+    """
+    rows = notes_query.outerjoin(
+        DispatchDocument, DispatchDocument.dispatch_note_id == DispatchNote.id
+    ).add_entity(DispatchDocument).limit(limit).all()
+
+    missing = [note for note, document in rows if document is None]
+    if not missing:
+        return [document for _, document in rows]
+
+    items_by_note = {note.id: [] for note in missing}
+    for item in DispatchItem.query.filter(DispatchItem.dispatch_note_id.in_(items_by_note)).order_by(DispatchItem.id):
+        items_by_note[item.dispatch_note_id].append(item)
+    rendered = {note.id: render_dispatch_document(note, items_by_note[note.id]) for note in missing}
+
+    # Detached copies, so the commit below cannot expire them into one reload per note
+    documents = [
+        SimpleNamespace(
+            dispatch_note_id=d.dispatch_note_id, engineer_email=d.engineer_email,
+            subject=d.subject, html=d.html, text=d.text,
+        )
+        for d in (document if document is not None else rendered[note.id] for note, document in rows)
+    ]
+    db.session.add_all(rendered.values())
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Some were stored by another request meanwhile; the rendered copies are identical
+        db.session.rollback()
+    return documents
+
+def render_back_order_section(engineer_email: str, items=None):
+    """Render the engineer's current back orders as HTML and plain text.
+
+    `items` takes back orders already loaded with get_back_orders_by_engineer().
+    """
+    generated_at = datetime.utcnow()
+    if items is None:
+        items = get_back_orders(engineer_email)
+    back_orders = [
+        SimpleNamespace(part_number=bo.part_number, description=bo.description,
+                        remaining=bo.qty_remaining, order_date=bo.order.date)
+        for bo in items
+    ]
+    lines = []
+    if back_orders:
+        lines.append("Items Still on Back Order:")
+        for bo in back_orders:
+            lines.append(f"- {bo.part_number} ({bo.description or ''}): {bo.remaining}")
+    return SimpleNamespace(
+        html=render_template("_dispatch_back_orders.html", back_orders=back_orders, generated_at=generated_at),
+        text="\n".join(lines),
+        generated_at=generated_at,
+    )
+
+class BackOrderSectionCache:
+    """Rendered back-order sections per engineer, reused for `ttl` seconds.
+
+    Dispatches and cancellations invalidate the engineer's entry in this
+    process; other workers pick the change up once their copy expires.
+    """
+
+    MAX_ENTRIES = 2000
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sections = {}
+
+    def get(self, engineer_email: str):
+        with self._lock:
+            entry = self._sections.get(engineer_email)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        return self.refresh(engineer_email)
+
+    def get_many(self, engineer_emails):
+        """Sections for several engineers; all the misses are loaded with a single query"""
+        sections, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for email in set(engineer_emails):
+                entry = self._sections.get(email)
+                if entry is not None and entry[0] > now:
+                    sections[email] = entry[1]
+                else:
+                    missing.append(email)
+        for email, items in get_back_orders_by_engineer(missing).items():
+            sections[email] = self._store(email, render_back_order_section(email, items))
+        return sections
+
+    def refresh(self, engineer_email: str):
+        """Render the section now and keep it for later reads"""
+        return self._store(engineer_email, render_back_order_section(engineer_email))
+
+    def _store(self, engineer_email, section):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._sections) >= self.MAX_ENTRIES:
+                self._sections = {k: v for k, v in self._sections.items() if v[0] > now}
+            self._sections[engineer_email] = (now + self.ttl, section)
+        return section
+
+    def invalidate(self, engineer_email: str) -> None:
+        with self._lock:
+            self._sections.pop(engineer_email, None)
+
+back_order_sections = BackOrderSectionCache(BACK_ORDER_CACHE_TTL)
+
+# ── Email Functions ───────────────────────────────────────────────────────────
+
+def build_dispatch_message(engineer_email: str, dispatch_id: int):
+    """Build the dispatch notification for a note; returns None if the note no longer exists"""
+    document = get_dispatch_document(dispatch_id)
+    if document is None:
+        return None
+
+    # Always current when sent; this also refreshes the cached section for the page
+    back_orders = back_order_sections.refresh(engineer_email)
+
+    lines = ["Hello,\n", "Your dispatch has been processed.", document.text]
+    if back_orders.text:
+        lines.append("\n" + back_orders.text)
+    lines.append("\nThank you,\nServitech Stock System")
+
+    msg = Message(subject=document.subject, recipients=[engineer_email], body="\n".join(lines))
+    msg.html = render_template("email_dispatch.html", document=document, back_orders=back_orders)
+    return msg
+
+def queue_dispatch_email(engineer_email: str, dispatch) -> None:
+    """Add a dispatch notification to the outbox as part of the caller's transaction"""
+    if not app.config["MAIL_ENABLED"]:
+        mail_log.warning("Email not configured; dispatch notification for %s not queued", engineer_email)
+        return
+    db.session.add(EmailOutbox(recipient=engineer_email, dispatch_note=dispatch))
+
+# ── Email Outbox Worker ───────────────────────────────────────────────────────
+
+def outbox_retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, capped at an hour"""
+    base = app.config["MAIL_OUTBOX_RETRY_BASE"]
+    return min(3600, base * 2 ** max(0, attempts - 1)) + random.uniform(0, base)
+
+def claim_outbox_batch(limit: int):
+    """Lease up to `limit` due messages to this worker.
+
+    Rows are locked with SKIP LOCKED (on Postgres) while their lease is taken,
+    so several workers can drain the outbox without sending anything twice. A
+    worker that dies mid-batch leaves its rows to be re-claimed once the lease
+    runs out.
+    """
+    now = datetime.utcnow()
+    rows = (
+        db.session.query(EmailOutbox)
+        .filter(EmailOutbox.status.in_(("pending", "sending")), EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.id.asc())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    lease_until = now + timedelta(seconds=app.config["MAIL_OUTBOX_LEASE_SECONDS"])
+    for row in rows:
+        row.status = "sending"
+        row.next_attempt_at = lease_until
+    db.session.commit()
+    return rows
+
+def build_outbox_message(row):
+    if row.dispatch_note_id is not None:
+        return build_dispatch_message(row.recipient, row.dispatch_note_id)
+    msg = Message(subject=row.subject or "", recipients=[row.recipient], body=row.body or "")
+    if row.html:
+        msg.html = row.html
+    return msg
+
+def record_outbox_failure(row, error) -> None:
+    row.attempts = (row.attempts or 0) + 1
+    row.last_error = str(error)[:2000]
+    if row.attempts >= app.config["MAIL_OUTBOX_MAX_ATTEMPTS"]:
+        row.status = "failed"
+    else:
+        row.status = "pending"
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=outbox_retry_delay(row.attempts))
+
+def send_outbox_batch(rows) -> None:
+    """Send a claimed batch over a single SMTP connection"""
+    try:
+        connection = mail.connect()
+        connection.__enter__()
+    except Exception as e:
+        mail_log.error("Error connecting to mail server: %s", e)
+        for row in rows:
+            record_outbox_failure(row, e)
+        db.session.commit()
+        return
+
+    try:
+        for row in rows:
+            try:
+                msg = build_outbox_message(row)
+                if msg is not None:
+                    connection.send(msg)
+                row.status = "sent"
+                row.sent_at = datetime.utcnow()
+            except Exception as e:
+                mail_log.warning("Error sending email %s (attempt %d): %s", row.id, (row.attempts or 0) + 1, e)
+                record_outbox_failure(row, e)
+            db.session.commit()
+    finally:
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            pass
+
+def drain_outbox_once() -> int:
+    """Claim and send one batch; returns the number of messages handled"""
+    rows = claim_outbox_batch(app.config["MAIL_OUTBOX_BATCH_SIZE"])
+    if rows:
+        send_outbox_batch(rows)
+    return len(rows)
+
+class OutboxWorker:
+    """Pool of daemon threads draining email_outbox.
+
+    Threads wake when notify() is called after a commit, or every poll
+    interval to pick up retries and rows queued by other processes.
+    """
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    @property
+    def started(self) -> bool:
+        return bool(self._threads)
+
+    def start(self, threads=None) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for n in range(threads or self.app.config["MAIL_OUTBOX_WORKERS"]):
+                thread = threading.Thread(target=self.run_forever, name=f"mail-outbox-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self) -> None:
+        if self.app.config["MAIL_ENABLED"] and self.app.config["MAIL_OUTBOX_RUN_IN_APP"]:
+            self.start()
+        self._wake.set()
+
+    def run_forever(self) -> None:
+        while True:
+            self._wake.wait(self.app.config["MAIL_OUTBOX_POLL_INTERVAL"])
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    while drain_outbox_once():
+                        pass
+                except Exception as e:
+                    mail_log.exception("Error draining email outbox: %s", e)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+outbox_worker = OutboxWorker(app)
+
+@app.before_request
+def start_outbox_worker():
+    if app.config["MAIL_ENABLED"] and app.config["MAIL_OUTBOX_RUN_IN_APP"] and not outbox_worker.started:
+        outbox_worker.start()
+
+@app.cli.command("mail-worker")
+@click.option("--threads", default=None, type=int, help="Worker threads (defaults to MAIL_OUTBOX_WORKERS)")
+def mail_worker_command(threads):
+    """Drain the email outbox in this process until interrupted."""
+    outbox_worker.start(threads)
+    click.echo(f"Draining email outbox with {len(outbox_worker._threads)} worker thread(s)")
+    while True:
+        time.sleep(3600)
+
+# ── Inventory Ledger ──────────────────────────────────────────────────────────
+#
+# Every change to stock is a row in stock_movement: receipts and positive
+# adjustments add, dispatches and negative adjustments subtract. stock_balance
+# holds each part's running on-hand figure and is upserted in the same
+# transaction as the movements, so reading a balance is one primary-key
+# lookup. stock_snapshot rolls the ledger up periodically; replaying a part's
+# history starts from the latest snapshot instead of the first movement.
+#
+# Balances may go negative: receipts are only recorded from the CLI, and a
+# picker holding the part is better evidence than the ledger, so dispatches
+# are never refused for stock. A dispatch that takes a part below zero is
+# logged and flagged to the picker instead.
+
+def dialect_insert(model):
+    """An INSERT for the session's database that supports on_conflict_do_update"""
+    if db.session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model)
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    return sqlite_insert(model)
+
+def record_stock_movements(movements) -> dict:
+    """Append movements to the ledger and apply them to stock_balance, within the caller's transaction.
+
+    Each movement is a dict with part_number, quantity (signed), kind and
+    optionally dispatch_note_id, reference and note. Returns {part_number:
+    on_hand} for the parts these movements took or left below zero.
+    """
+    movements = [m for m in movements if m.get("quantity")]
+    if not movements:
+        return {}
+    now = datetime.utcnow()
+    db.session.execute(insert(StockMovement), [
+        {
+            "part_number": m["part_number"], "quantity": m["quantity"], "kind": m["kind"],
+            "dispatch_note_id": m.get("dispatch_note_id"), "reference": m.get("reference"),
+            "note": m.get("note"), "created_at": now,
+        }
+        for m in movements
+    ])
+
+    deltas = {}
+    for m in movements:
+        deltas[m["part_number"]] = deltas.get(m["part_number"], 0) + m["quantity"]
+    stmt = dialect_insert(StockBalance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StockBalance.part_number],
+        set_={"on_hand": StockBalance.on_hand + stmt.excluded.on_hand, "updated_at": stmt.excluded.updated_at},
+    )
+    # Sorted so concurrent transactions lock balance rows in the same order and cannot deadlock
+    db.session.execute(stmt, [
+        {"part_number": part, "on_hand": delta, "updated_at": now}
+        for part, delta in sorted(deltas.items())
+    ])
+    reduced = [part for part, delta in deltas.items() if delta < 0]
+    if not reduced:
+        return {}
+    return dict(db.session.execute(
+        select(StockBalance.part_number, StockBalance.on_hand)
+        .where(StockBalance.part_number.in_(reduced), StockBalance.on_hand < 0)
+    ).all())
+
+def get_stock_balances(part_numbers):
+    """{part_number: on_hand} for the given parts; parts with no movements are left out"""
+    parts = {p for p in part_numbers if p}
+    if not parts:
+        return {}
+    rows = db.session.execute(
+        select(StockBalance.part_number, StockBalance.on_hand).where(StockBalance.part_number.in_(parts))
+    )
+    return dict(rows.all())
+
+def latest_stock_snapshot():
+    return db.session.query(StockSnapshot).order_by(StockSnapshot.id.desc()).first()
+
+def take_stock_snapshot():
+    """Roll movements up into a new snapshot; returns it, or None if nothing has happened since the last one.
+
+    The new snapshot is the previous one plus the movements after it. Only
+    movements older than STOCK_SNAPSHOT_SETTLE_SECONDS are included, so a
+    transaction that took a lower id but committed late is never skipped.
+    """
+    previous = latest_stock_snapshot()
+    after_id = previous.last_movement_id if previous else 0
+    settled_before = datetime.utcnow() - timedelta(seconds=STOCK_SNAPSHOT_SETTLE_SECONDS)
+    upto_id = db.session.query(func.max(StockMovement.id)).filter(
+        StockMovement.id > after_id, StockMovement.created_at < settled_before
+    ).scalar()
+    if upto_id is None:
+        return None
+
+    totals = {}
+    if previous:
+        totals.update(db.session.execute(
+            select(StockSnapshotLine.part_number, StockSnapshotLine.on_hand)
+            .where(StockSnapshotLine.snapshot_id == previous.id)
+        ).all())
+    deltas = db.session.execute(
+        select(StockMovement.part_number, func.sum(StockMovement.quantity))
+        .where(StockMovement.id > after_id, StockMovement.id <= upto_id)
+        .group_by(StockMovement.part_number)
+    )
+    for part, delta in deltas:
+        totals[part] = totals.get(part, 0) + int(delta)
+
+    snapshot = StockSnapshot(last_movement_id=upto_id, taken_at=datetime.utcnow())
+    db.session.add(snapshot)
+    db.session.flush()
+    if totals:
+        db.session.execute(insert(StockSnapshotLine), [
+            {"snapshot_id": snapshot.id, "part_number": part, "on_hand": qty} for part, qty in totals.items()
+        ])
+    db.session.commit()
+    return snapshot
+
+def replay_stock_balances(part_numbers=None):
+    """Recompute on-hand figures from the latest snapshot plus later movements, as {part_number: on_hand}"""
+    snapshot = latest_stock_snapshot()
+    after_id = snapshot.last_movement_id if snapshot else 0
+
+    totals = {}
+    if snapshot:
+        lines = select(StockSnapshotLine.part_number, StockSnapshotLine.on_hand).where(StockSnapshotLine.snapshot_id == snapshot.id)
+        if part_numbers is not None:
+            lines = lines.where(StockSnapshotLine.part_number.in_(part_numbers))
+        totals.update(db.session.execute(lines).all())
+    deltas = (
+        select(StockMovement.part_number, func.sum(StockMovement.quantity))
+        .where(StockMovement.id > after_id)
+        .group_by(StockMovement.part_number)
+    )
+    if part_numbers is not None:
+        deltas = deltas.where(StockMovement.part_number.in_(part_numbers))
+    for part, delta in db.session.execute(deltas):
+        totals[part] = totals.get(part, 0) + int(delta)
+    return totals
+
+@app.cli.command("stock-receive")
+@click.argument("part_number")
+@click.argument("quantity", type=int)
+@click.option("--reference", help="Delivery note or PO number")
+def stock_receive_command(part_number, quantity, reference):
+    """Record QUANTITY of PART_NUMBER received into stock."""
+    if quantity <= 0:
+        raise click.BadParameter("quantity must be positive", param_hint="QUANTITY")
+    record_stock_movements([{"part_number": part_number, "quantity": quantity, "kind": "receipt", "reference": reference}])
+    db.session.commit()
+    click.echo(f"{part_number}: {get_stock_balances([part_number]).get(part_number, 0)} on hand")
+
+@app.cli.command("stock-adjust", context_settings={"ignore_unknown_options": True})
+@click.argument("part_number")
+@click.argument("quantity", type=int)
+@click.option("--note", required=True, help="Reason for the adjustment, e.g. stock count")
+def stock_adjust_command(part_number, quantity, note):
+    """Adjust PART_NUMBER's stock by QUANTITY (negative to write stock off)."""
+    record_stock_movements([{"part_number": part_number, "quantity": quantity, "kind": "adjustment", "note": note}])
+    db.session.commit()
+    click.echo(f"{part_number}: {get_stock_balances([part_number]).get(part_number, 0)} on hand")
+
+@app.cli.command("stock-snapshot")
+@click.option("--interval", type=int, default=0, help="Keep running, taking a snapshot every INTERVAL seconds")
+def stock_snapshot_command(interval):
+    """Roll the stock ledger up into a snapshot."""
+    while True:
+        snapshot = take_stock_snapshot()
+        if snapshot is None:
+            click.echo("No new stock movements to snapshot")
+        else:
+            click.echo(f"Snapshot {snapshot.id} taken up to movement {snapshot.last_movement_id}")
+        if not interval:
+            return
+        db.session.remove()
+        time.sleep(interval)
+
+@app.cli.command("stock-check")
+@click.option("--fix", is_flag=True, help="Overwrite stock_balance with the replayed figures")
+def stock_check_command(fix):
+    """Replay the ledger from the latest snapshot and compare with stock_balance."""
+    replayed = replay_stock_balances()
+    balances = dict(db.session.execute(select(StockBalance.part_number, StockBalance.on_hand)).all())
+    mismatched = sorted(
+        part for part in set(replayed) | set(balances)
+        if replayed.get(part, 0) != balances.get(part, 0)
+    )
+    for part in mismatched:
+        click.echo(f"{part}: balance {balances.get(part, 0)}, ledger {replayed.get(part, 0)}")
+    if mismatched and fix:
+        stmt = dialect_insert(StockBalance)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StockBalance.part_number],
+            set_={"on_hand": stmt.excluded.on_hand, "updated_at": stmt.excluded.updated_at},
+        )
+        now = datetime.utcnow()
+        db.session.execute(stmt, [{"part_number": p, "on_hand": replayed.get(p, 0), "updated_at": now} for p in mismatched])
+        db.session.commit()
+        click.echo(f"Fixed {len(mismatched)} balances")
+    elif not mismatched:
+        click.echo(f"All {len(balances)} balances match the ledger")
+
+# ── Dispatch Service ──────────────────────────────────────────────────────────
+
+def parse_dispatch_form(form):
+    """Pull per-line send quantities and back-order flags out of the dispatch form.
+
+    Only lines rendered on the page (those with a send_<id> field) are
+    considered, so lines added since the page loaded are left untouched.
+    Returns {item_id: (raw_qty, back_order)}.
+    """
+    lines = {}
+    for key, raw_qty in form.items():
+        if not key.startswith("send_"):
+            continue
+        try:
+            item_id = int(key[len("send_"):])
+        except ValueError:
+            continue
+        lines[item_id] = (raw_qty, form.get(f"back_order_{item_id}") == "on")
+    return lines
+
+def dispatch_items(engineer_email: str, picker_name: str, form):
+    """Validate and record one dispatch submission in a single transaction.
+
+    The engineer's outstanding lines are locked (SELECT ... FOR UPDATE) so two
+    pickers submitting the same screen cannot both send the same stock. If any
+    line fails validation nothing is written. Otherwise dispatch items go in as
+    one executemany INSERT and only the lines whose quantity_sent or back_order
+    actually changed get a bulk UPDATE.
+
+    Returns a namespace with errors, dispatch (None if nothing was sent),
+    lines_sent, flags_changed and negative_stock ({part_number: on_hand} for
+    parts this dispatch left below zero on hand).
+    """
+    result = SimpleNamespace(errors=[], dispatch=None, lines_sent=0, flags_changed=0, negative_stock={})
+    submitted = parse_dispatch_form(form)
+
+    items = {
+        item.id: item
+        for item in outstanding_items_query(engineer_email).with_for_update(of=PartsOrderItem).all()
+    }
+
+    sends, changes, raised = [], [], []
+    for item_id, (raw_qty, back_order) in submitted.items():
+        item = items.get(item_id)
+        try:
+            to_send = int(raw_qty or 0)
+        except (TypeError, ValueError):
+            result.errors.append(f"Invalid quantity '{raw_qty}' for {item.part_number if item else f'line {item_id}'}.")
+            continue
+        if item is None:
+            if to_send > 0:
+                result.errors.append(f"Line {item_id} is no longer outstanding; it may already have been dispatched.")
+            continue
+        if to_send < 0:
+            result.errors.append(f"Quantity for {item.part_number} cannot be negative.")
+            continue
+        if to_send > item.qty_remaining:
+            result.errors.append(f"Only {item.qty_remaining} of {item.part_number} remain to be sent.")
+            continue
+
+        if to_send > 0:
+            sends.append((item, to_send))
+        if to_send > 0 or bool(item.back_order) != back_order:
+            changes.append({
+                "id": item.id,
+                "quantity_sent": (item.quantity_sent or 0) + to_send,
+                "back_order": back_order,
+            })
+            result.flags_changed += bool(item.back_order) != back_order
+            if back_order and not item.back_order:
+                raised.append(item)
+
+    if result.errors or not changes:
+        db.session.rollback()
+        return result
+
+    if sends:
+        dispatch = DispatchNote(engineer_email=engineer_email, picker_name=picker_name)
+        db.session.add(dispatch)
+        db.session.flush()
+        db.session.execute(insert(DispatchItem), [
+            {
+                "dispatch_note_id": dispatch.id,
+                "part_number": item.part_number,
+                "description": item.description,
+                "quantity_sent": to_send,
+            }
+            for item, to_send in sends
+        ])
+        result.negative_stock = record_stock_movements([
+            {"part_number": item.part_number, "quantity": -to_send, "kind": "dispatch",
+             "dispatch_note_id": dispatch.id, "reference": picker_name}
+            for item, to_send in sends
+        ])
+        db.session.add(render_dispatch_document(dispatch, [
+            SimpleNamespace(part_number=item.part_number, description=item.description, quantity_sent=to_send)
+            for item, to_send in sends
+        ]))
+        result.dispatch = dispatch
+        result.lines_sent = len(sends)
+
+    db.session.execute(update(PartsOrderItem), changes)
+    record_demand(
+        [{"part_number": item.part_number, "engineer_email": engineer_email,
+          "qty_dispatched": to_send, "dispatch_lines": 1} for item, to_send in sends]
+        + [{"part_number": item.part_number, "engineer_email": engineer_email,
+            "back_orders_raised": 1} for item in raised]
+    )
+    for item in items.values():
+        db.session.expire(item)
+
+    if result.dispatch is not None:
+        queue_dispatch_email(engineer_email, result.dispatch)
+    refresh_engineer_summaries([engineer_email])
+    db.session.commit()
+    back_order_sections.invalidate(engineer_email)
+    for part, on_hand in sorted(result.negative_stock.items()):
+        dispatch_log.warning("Stock of %s is negative after dispatch %s: %d on hand",
+                             part, result.dispatch.id, on_hand)
+    return result
+
+# ── Archiving ─────────────────────────────────────────────────────────────────
+#
+# Orders whose every line has been sent, and dispatch notes, move to the
+# *_archive tables once they are ARCHIVE_AFTER_DAYS old, keeping their ids.
+# Live screens and aggregates only ever read the live tables; history lookups
+# take include_archived=1 to read both. Run `flask archive` from cron.
+
+def include_archived_arg() -> bool:
+    return request.args.get("include_archived", "").strip().lower() in ("1", "true", "on", "yes")
+
+def newest_parent_ids(parent, child, parent_id_column):
+    """Ids of the newest parent row and of the parent of the newest child row, on SQLite.
+
+    These are never archived there: SQLite hands new rows max(id) + 1, so
+    deleting the newest row would let the next live row reuse an id the
+    archive holds. Other databases draw ids from a sequence that never goes
+    back, so nothing needs keeping and the set is empty.
+    """
+    if db.session.get_bind().dialect.name != "sqlite":
+        return set()
+    ids = {db.session.query(func.max(parent.id)).scalar()}
+    newest_child = db.session.query(func.max(child.id)).scalar()
+    if newest_child is not None:
+        ids.add(db.session.query(parent_id_column).filter(child.id == newest_child).scalar())
+    ids.discard(None)
+    return ids
+
+def copy_rows(source, target, where, archived_at) -> None:
+    """INSERT INTO target SELECT the columns target shares with source FROM source WHERE `where`"""
+    source_columns = source.__table__.c
+    names = [c.name for c in target.__table__.columns if c.name in source_columns]
+    columns = [source_columns[name] for name in names]
+    if "archived_at" in target.__table__.c:
+        names.append("archived_at")
+        columns.append(literal(archived_at, db.DateTime))
+    db.session.execute(insert(target).from_select(names, select(*columns).where(where)))
+
+def archive_orders(cutoff, batch_size=ARCHIVE_BATCH_SIZE) -> int:
+    """Move orders placed before cutoff with nothing left to send; returns how many moved"""
+    still_open = (
+        select(PartsOrderItem.id)
+        .where(PartsOrderItem.order_id == PartsOrder.id, PartsOrderItem.qty_remaining > 0)
+        .exists()
+    )
+    query = db.session.query(PartsOrder.id, PartsOrder.email).filter(PartsOrder.date < cutoff, ~still_open)
+    keep = newest_parent_ids(PartsOrder, PartsOrderItem, PartsOrderItem.order_id)
+    if keep:
+        query = query.filter(PartsOrder.id.notin_(keep))
+
+    moved = 0
+    while True:
+        batch = query.order_by(PartsOrder.id).limit(batch_size).all()
+        if not batch:
+            return moved
+        ids = [order_id for order_id, _ in batch]
+        now = datetime.utcnow()
+        copy_rows(PartsOrder, PartsOrderArchive, PartsOrder.id.in_(ids), now)
+        copy_rows(PartsOrderItem, PartsOrderItemArchive, PartsOrderItem.order_id.in_(ids), now)
+        db.session.execute(delete(PartsOrderItem).where(PartsOrderItem.order_id.in_(ids)))
+        db.session.execute(delete(PartsOrder).where(PartsOrder.id.in_(ids)))
+        refresh_engineer_summaries({email for _, email in batch})
+        db.session.commit()
+        moved += len(ids)
 
-    lines.append("\nThank you,\nServitech Stock System")
+def archive_dispatch_notes(cutoff, batch_size=ARCHIVE_BATCH_SIZE) -> int:
+    """Move dispatch notes recorded before cutoff, with their items and documents; returns how many moved.
 
-    try:
-        msg = Message(subject=subject, recipients=[engineer_email], body="\n".join(lines))
-        msg.html = build_html_email(sent_items, back_orders, dispatch)
-        mail.send(msg)
-    except Exception as e:
-        print(f"Error sending email: {e}")
+    Notes whose dispatch email has not gone yet stay live: the outbox renders
+    that email from the note.
+    """
+    unsent_email = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.dispatch_note_id == DispatchNote.id, EmailOutbox.status != "sent")
+        .exists()
+    )
+    query = db.session.query(DispatchNote).filter(DispatchNote.date < cutoff, ~unsent_email)
+    keep = newest_parent_ids(DispatchNote, DispatchItem, DispatchItem.dispatch_note_id)
+    if keep:
+        query = query.filter(DispatchNote.id.notin_(keep))
+
+    moved = 0
+    while True:
+        # Renders any missing documents first, so every archived note has one
+        documents = load_dispatch_documents(query.order_by(DispatchNote.id), limit=batch_size)
+        if not documents:
+            return moved
+        ids = [d.dispatch_note_id for d in documents]
+        now = datetime.utcnow()
+        copy_rows(DispatchNote, DispatchNoteArchive, DispatchNote.id.in_(ids), now)
+        copy_rows(DispatchItem, DispatchItemArchive, DispatchItem.dispatch_note_id.in_(ids), now)
+        copy_rows(DispatchDocument, DispatchDocumentArchive, DispatchDocument.dispatch_note_id.in_(ids), now)
+        db.session.execute(
+            update(EmailOutbox).where(EmailOutbox.dispatch_note_id.in_(ids)).values(dispatch_note_id=None)
+        )
+        db.session.execute(delete(DispatchDocument).where(DispatchDocument.dispatch_note_id.in_(ids)))
+        db.session.execute(delete(DispatchItem).where(DispatchItem.dispatch_note_id.in_(ids)))
+        db.session.execute(delete(DispatchNote).where(DispatchNote.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+
+@app.cli.command("archive")
+@click.option("--days", type=int, default=None, help="Archive records older than this (defaults to ARCHIVE_AFTER_DAYS)")
+@click.option("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Rows moved per transaction")
+def archive_command(days, batch_size):
+    """Move fully sent orders and old dispatch notes to the archive tables."""
+    cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS if days is None else days)
+    orders = archive_orders(cutoff, batch_size)
+    notes = archive_dispatch_notes(cutoff, batch_size)
+    click.echo(f"Archived {orders} orders and {notes} dispatch notes from before {cutoff:%Y-%m-%d}")
 
 # ── Main Routes ───────────────────────────────────────────────────────────────
 
@@ -420,29 +2880,30 @@ def home():
 
 @app.route('/admin/parts_orders_list')
 def parts_orders_list():
+    sync_engineer_summaries()
     outstanding_data = (
-        db.session.query(
-            PartsOrder.email,
-            func.coalesce(func.sum(PartsOrderItem.quantity - PartsOrderItem.quantity_sent), 0).label("outstanding_total")
-        )
-        .join(PartsOrderItem)
-        .group_by(PartsOrder.email)
-        .order_by(func.coalesce(func.sum(PartsOrderItem.quantity - PartsOrderItem.quantity_sent), 0).desc())
+        db.session.query(EngineerOutstandingSummary)
+        .order_by(EngineerOutstandingSummary.outstanding_qty.desc(), EngineerOutstandingSummary.email.asc())
         .all()
     )
     return render_template('parts_orders_list.html', data=outstanding_data)
 
-@app.route("/admin/parts_order_detail/<email>", methods=["GET", "POST"])
-def parts_order_detail(email):
-    outstanding_items = get_outstanding_items(email)
-    back_orders = get_back_orders(email)
-    engineer_dispatches = (
-        db.session.query(DispatchNote)
-        .filter(DispatchNote.engineer_email == email)
-        .order_by(DispatchNote.date.desc())
-        .all()
+def render_parts_order_detail(email):
+    history_cursor = request.args.get("history_cursor", "").strip() or None
+    detail = load_engineer_detail(email, history_cursor)
+    return render_template(
+        "parts_order_detail.html",
+        email=email,
+        outstanding_items=detail.outstanding_items,
+        back_orders=detail.back_orders,
+        stock_on_hand=detail.stock_on_hand,
+        engineer_dispatches=detail.engineer_dispatches,
+        history_next_cursor=detail.history_next_cursor,
+        history_is_first_page=history_cursor is None,
     )
 
+@app.route("/admin/parts_order_detail/<email>", methods=["GET", "POST"])
+def parts_order_detail(email):
     if request.method == "POST":
         picker_name = request.form.get("picker_name", "").strip()
         custom_picker_name = request.form.get("custom_picker_name", "").strip()
@@ -453,51 +2914,28 @@ def parts_order_detail(email):
             final_picker_name = picker_name
         else:
             flash("Please select or enter a picker name.", "error")
-            return render_template("parts_order_detail.html", email=email, outstanding_items=outstanding_items, back_orders=back_orders, engineer_dispatches=engineer_dispatches)
-
-        dispatch = None
-        dispatch_created = False
-        flags_changed = False
-
-        for item in outstanding_items:
-            to_send = int(request.form.get(f"send_{item.id}", 0) or 0)
-            max_send = getattr(item, "qty_remaining", item.quantity - (item.quantity_sent or 0))
-
-            if 0 < to_send <= max_send:
-                if dispatch is None:
-                    dispatch = DispatchNote(engineer_email=email, picker_name=final_picker_name)
-                    db.session.add(dispatch)
-
-                db.session.add(DispatchItem(
-                    dispatch_note=dispatch,
-                    part_number=item.part_number,
-                    description=item.description,
-                    quantity_sent=to_send,
-                ))
-                item.quantity_sent = (item.quantity_sent or 0) + to_send
-                dispatch_created = True
-
-            desired_flag = (request.form.get(f"back_order_{item.id}") == "on")
-            if getattr(item, "back_order", False) != desired_flag:
-                item.back_order = desired_flag
-                flags_changed = True
+            return render_parts_order_detail(email)
 
-            db.session.add(item)
+        result = dispatch_items(email, final_picker_name, request.form)
 
-        if dispatch_created:
-            db.session.commit()
+        if result.errors:
+            for error in result.errors:
+                flash(error, "error")
+            flash("Nothing was dispatched. Please correct the quantities and submit again.", "warning")
+        elif result.dispatch is not None:
+            outbox_worker.notify()
             flash(f"Dispatch recorded successfully. Picked by: {final_picker_name}", "success")
-            send_dispatch_email(email, dispatch.id)
-        elif flags_changed:
-            db.session.commit()
+            if result.negative_stock:
+                parts = ", ".join(f"{part} ({on_hand})" for part, on_hand in sorted(result.negative_stock.items()))
+                flash(f"Stock on hand is now below zero for {parts}. Record any missing receipts with `flask stock-receive`.", "warning")
+        elif result.flags_changed:
             flash("Back order flags updated.", "info")
         else:
-            db.session.rollback()
             flash("No items were dispatched and no changes were made.", "warning")
 
         return redirect(url_for("parts_order_detail", email=email))
 
-    return render_template("parts_order_detail.html", email=email, outstanding_items=outstanding_items, back_orders=back_orders, engineer_dispatches=engineer_dispatches)
+    return render_parts_order_detail(email)
 
 @app.route('/admin/cancel_order_item/<int:item_id>', methods=['POST'])
 def cancel_order_item(item_id: int):
@@ -505,6 +2943,8 @@ def cancel_order_item(item_id: int):
     engineer_email = item.order.email if item.order else request.form.get('email', '')
     part_num = item.part_number
     parent_order = item.order
+    if item.qty_remaining and item.qty_remaining > 0:
+        record_demand([{"part_number": part_num, "engineer_email": engineer_email, "qty_cancelled": item.qty_remaining}])
 
     db.session.delete(item)
     db.session.flush()
@@ -512,7 +2952,9 @@ def cancel_order_item(item_id: int):
     if parent_order and len(parent_order.items) == 0:
         db.session.delete(parent_order)
 
+    refresh_engineer_summaries([engineer_email])
     db.session.commit()
+    back_order_sections.invalidate(engineer_email)
     flash(f"Removed item {part_num} from the order.", "success")
     return redirect(url_for('parts_order_detail', email=engineer_email))
 
@@ -520,15 +2962,913 @@ def cancel_order_item(item_id: int):
 
 @app.route("/admin/dispatched_orders")
 def dispatched_orders():
-    dispatches = db.session.query(DispatchNote).order_by(DispatchNote.date.desc()).all()
-    return render_template("dispatched_orders.html", dispatches=dispatches)
+    engineer = request.args.get("engineer", "").strip()
+    date_from = request.args.get("date_from", "").strip()
+    date_to = request.args.get("date_to", "").strip()
+    cursor = request.args.get("cursor", "").strip()
+    per_page = clamp_per_page(request.args.get("per_page"))
+
+    include_archived = include_archived_arg()
+
+    start = parse_date_arg(date_from)
+    end = parse_date_arg(date_to, end_of_day=True)
+    query = dispatch_history_query(DispatchNote, engineer, start, end)
+    archived_query = dispatch_history_query(DispatchNoteArchive, engineer, start, end) if include_archived else None
+
+    dispatches, next_cursor = paginate_dispatch_notes(query, cursor or None, per_page, archived_query=archived_query)
+    filters = {k: v for k, v in (("engineer", engineer), ("date_from", date_from), ("date_to", date_to)) if v}
+    if include_archived:
+        filters["include_archived"] = 1
+    if per_page != DISPATCH_HISTORY_PER_PAGE:
+        filters["per_page"] = per_page
+
+    return render_template(
+        "dispatched_orders.html",
+        dispatches=dispatches,
+        next_cursor=next_cursor,
+        is_first_page=not cursor,
+        filters=filters,
+    )
 
 @app.route("/admin/dispatch_note/<int:dispatch_id>")
 def view_dispatch_note(dispatch_id: int):
-    dispatch = DispatchNote.query.get_or_404(dispatch_id)
-    sent_items = DispatchItem.query.filter_by(dispatch_note_id=dispatch_id).all()
-    back_orders = get_back_orders(dispatch.engineer_email)
-    return render_template("dispatch_note.html", dispatch=dispatch, sent_items=sent_items, back_orders=back_orders)
+    document = get_dispatch_document(dispatch_id)
+    if document is None:
+        abort(404)
+    back_orders = back_order_sections.get(document.engineer_email)
+    return render_template("dispatch_note.html", document=document, back_orders=back_orders)
+
+def parse_dispatch_ids(raw: str):
+    """Parse "1,2,3" into a set of ids; returns None if any part is not a number"""
+    try:
+        return {int(part) for part in raw.split(",") if part.strip()}
+    except ValueError:
+        return None
+
+@app.route("/admin/dispatch_notes/print")
+def print_dispatch_notes():
+    """Every selected dispatch note as one printable page, one note per sheet.
+
+    Select notes with ?ids=1,2,3, or with a date_from/date_to range (optionally
+    with engineer). Notes, documents and back orders load in a fixed number
+    of queries however many notes there are, and the page is streamed.
+    """
+    raw_ids = request.args.get("ids", "").strip()
+    if raw_ids:
+        ids = parse_dispatch_ids(raw_ids)
+        if not ids:
+            flash("Invalid dispatch note ids.", "error")
+            return redirect(url_for("dispatched_orders"))
+        selected = lambda note: db.session.query(note).filter(note.id.in_(ids))
+    else:
+        engineer, start, end = export_filters()
+        if not (start or end):
+            flash("Choose a date range or dispatch notes to print.", "warning")
+            return redirect(url_for("dispatched_orders"))
+        selected = lambda note: dispatch_history_query(note, engineer, start, end)
+
+    query = selected(DispatchNote).order_by(DispatchNote.date.asc(), DispatchNote.id.asc())
+    documents = load_dispatch_documents(query, limit=BATCH_PRINT_MAX_NOTES + 1)
+    if raw_ids or include_archived_arg():
+        archived = (
+            selected(DispatchNoteArchive)
+            .join(DispatchDocumentArchive, DispatchDocumentArchive.dispatch_note_id == DispatchNoteArchive.id)
+            .with_entities(DispatchDocumentArchive)
+            .order_by(DispatchNoteArchive.date.asc(), DispatchNoteArchive.id.asc())
+            .limit(BATCH_PRINT_MAX_NOTES + 1)
+            .all()
+        )
+        # Archived notes all predate the live ones, so they print first
+        documents = archived + documents
+    if len(documents) > BATCH_PRINT_MAX_NOTES:
+        flash(f"More than {BATCH_PRINT_MAX_NOTES} dispatch notes selected; narrow the range and try again.", "warning")
+        return redirect(url_for("dispatched_orders", **request.args))
+
+    back_orders = back_order_sections.get_many(d.engineer_email for d in documents)
+    notes = (SimpleNamespace(document=d, back_orders=back_orders[d.engineer_email]) for d in documents)
+    return Response(stream_template("dispatch_notes_print.html", notes=notes, note_count=len(documents)))
+
+# ── Part History Search ───────────────────────────────────────────────────────
+#
+# "Who has part X outstanding, and when was it last sent?" Matching lines are
+# found through an index on part_number and description: pg_trgm GIN indexes
+# on Postgres, FTS5 trigram tables kept in step by triggers on SQLite (both
+# created by migration 0008_part_search_indexes). Both answer substring
+# matches of PART_SEARCH_MIN_LENGTH characters or more without a table scan.
+
+PART_SEARCH_TABLES = ("parts_order_item", "dispatch_item", "dispatch_item_archive")
+
+def part_search_match_ids(table, term: str):
+    """A SELECT of the ids in `table` whose part_number or description contains term"""
+    if db.session.get_bind().dialect.name == "postgresql":
+        pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return select(table.c.id).where(or_(
+            table.c.part_number.ilike(pattern, escape="\\"),
+            table.c.description.ilike(pattern, escape="\\"),
+        ))
+    search_table = f"{table.name}_search"
+    return text(f"SELECT rowid FROM {search_table} WHERE {search_table} MATCH :term").bindparams(
+        term='"' + term.replace('"', '""') + '"'
+    ).columns(rowid=db.Integer)
+
+def encode_part_search_cursor(row) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row.part_number, row.engineer_email]).encode()).decode()
+
+def decode_part_search_cursor(cursor):
+    """Turn a cursor from encode_part_search_cursor back into (part_number, engineer_email); None if invalid"""
+    try:
+        part_number, engineer_email = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not (isinstance(part_number, str) and isinstance(engineer_email, str)):
+        return None
+    return part_number, engineer_email
+
+def search_part_history(term: str, cursor=None, per_page=PART_SEARCH_PER_PAGE, include_archived=False):
+    """One row per (part_number, engineer) whose order or dispatch lines match term.
+
+    Each row has the part's description, the engineer's outstanding quantity
+    and line count, when they last ordered it with lines still open, and when
+    it was last sent to them and how many in total. Rows come in
+    (part_number, engineer_email) order and are keyset-paginated on that
+    pair; returns (rows, next_cursor).
+    """
+    position = decode_part_search_cursor(cursor) if cursor else None
+
+    def after_cursor(part_column, email_column):
+        if not position:
+            return part_column.isnot(None)
+        return or_(part_column > position[0], and_(part_column == position[0], email_column > position[1]))
+
+    no_date = cast(null(), db.DateTime)
+    order_item = PartsOrderItem.__table__
+    branches = [
+        select(
+            PartsOrderItem.part_number.label("part_number"),
+            PartsOrder.email.label("engineer_email"),
+            PartsOrderItem.description.label("description"),
+            PartsOrderItem.qty_remaining.label("outstanding_qty"),
+            literal(1).label("outstanding_lines"),
+            PartsOrder.date.label("last_ordered"),
+            no_date.label("last_sent"),
+            literal(0).label("sent_qty"),
+        )
+        .join(PartsOrder, PartsOrder.id == PartsOrderItem.order_id)
+        .where(
+            PartsOrderItem.id.in_(part_search_match_ids(order_item, term)),
+            PartsOrderItem.qty_remaining > 0,
+            after_cursor(PartsOrderItem.part_number, PartsOrder.email),
+        )
+    ]
+    sources = [(DispatchNote, DispatchItem)]
+    if include_archived:
+        sources.append((DispatchNoteArchive, DispatchItemArchive))
+    for note, item in sources:
+        branches.append(
+            select(
+                item.part_number, note.engineer_email, item.description,
+                literal(0), literal(0), no_date, note.date, item.quantity_sent,
+            )
+            .join(note, note.id == item.dispatch_note_id)
+            .where(
+                item.id.in_(part_search_match_ids(item.__table__, term)),
+                after_cursor(item.part_number, note.engineer_email),
+            )
+        )
+
+    lines = union_all(*branches).subquery()
+    rows = db.session.execute(
+        select(
+            lines.c.part_number,
+            lines.c.engineer_email,
+            func.max(lines.c.description).label("description"),
+            func.sum(lines.c.outstanding_qty).label("outstanding_qty"),
+            func.sum(lines.c.outstanding_lines).label("outstanding_lines"),
+            func.max(lines.c.last_ordered).label("last_ordered"),
+            func.max(lines.c.last_sent).label("last_sent"),
+            func.sum(lines.c.sent_qty).label("sent_qty"),
+        )
+        .group_by(lines.c.part_number, lines.c.engineer_email)
+        .order_by(lines.c.part_number, lines.c.engineer_email)
+        .limit(per_page + 1)
+    ).all()
+    if len(rows) > per_page:
+        return rows[:per_page], encode_part_search_cursor(rows[per_page - 1])
+    return rows, None
+
+@app.route("/admin/part_search")
+def part_search():
+    term = request.args.get("q", "").strip()
+    cursor = request.args.get("cursor", "").strip()
+    include_archived = include_archived_arg()
+    per_page = clamp_per_page(request.args.get("per_page"), default=PART_SEARCH_PER_PAGE)
+
+    rows, next_cursor = [], None
+    if len(term) >= PART_SEARCH_MIN_LENGTH:
+        rows, next_cursor = search_part_history(term, cursor or None, per_page, include_archived)
+    elif term:
+        flash(f"Enter at least {PART_SEARCH_MIN_LENGTH} characters to search.", "warning")
+
+    filters = {"q": term} if term else {}
+    if include_archived:
+        filters["include_archived"] = 1
+    if per_page != PART_SEARCH_PER_PAGE:
+        filters["per_page"] = per_page
+
+    return render_template(
+        "part_search.html",
+        rows=rows,
+        next_cursor=next_cursor,
+        is_first_page=not cursor,
+        filters=filters,
+    )
+
+# ── Demand Rollups ────────────────────────────────────────────────────────────
+#
+# Daily totals per part and per engineer, so purchasing reports never scan
+# the order or dispatch tables. dispatch_items and cancel_order_item add to
+# the current UTC day's rows in their own transaction; `flask demand-backfill`
+# recomputes the dispatch figures from history.
+
+DEMAND_MEASURES = ("qty_dispatched", "dispatch_lines", "qty_cancelled", "back_orders_raised")
+
+def record_demand(events, day=None) -> None:
+    """Add events to the day's rollups, within the caller's transaction.
+
+    Each event is a dict with part_number, engineer_email and any of the
+    DEMAND_MEASURES as increments.
+    """
+    if not events:
+        return
+    day = day or datetime.utcnow().date()
+    for model, key in ((DemandPartDaily, "part_number"), (DemandEngineerDaily, "engineer_email")):
+        totals = {}
+        for event in events:
+            row = totals.setdefault(event[key], dict.fromkeys(DEMAND_MEASURES, 0))
+            for measure in DEMAND_MEASURES:
+                row[measure] += event.get(measure, 0)
+        stmt = dialect_insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[model.day, getattr(model, key)],
+            set_={m: getattr(model, m) + getattr(stmt.excluded, m) for m in DEMAND_MEASURES},
+        )
+        # Sorted so concurrent transactions lock rollup rows in the same order
+        db.session.execute(stmt, [{"day": day, key: k, **row} for k, row in sorted(totals.items())])
+
+def as_date(value):
+    """func.date() gives a date on Postgres and an ISO string on SQLite"""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def backfill_demand(since=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """Recompute qty_dispatched and dispatch_lines from dispatch history, live and archived.
+
+    Cancellations and back-order flags are not kept in history, so those
+    columns are left as recorded. Returns the number of rollup rows written.
+    """
+    written = 0
+    for model, key in ((DemandPartDaily, "part_number"), (DemandEngineerDaily, "engineer_email")):
+        reset = update(model).values(qty_dispatched=0, dispatch_lines=0)
+        if since:
+            reset = reset.where(model.day >= since.date())
+        db.session.execute(reset)
+
+        branches = []
+        for note, item in ((DispatchNote, DispatchItem), (DispatchNoteArchive, DispatchItemArchive)):
+            group = item.part_number if key == "part_number" else note.engineer_email
+            branch = (
+                select(
+                    func.date(note.date).label("day"), group.label("key"),
+                    item.quantity_sent.label("qty"),
+                )
+                .join(note, note.id == item.dispatch_note_id)
+                .where(group.isnot(None))
+            )
+            if since:
+                branch = branch.where(note.date >= since)
+            branches.append(branch)
+        lines = union_all(*branches).subquery()
+        totals = db.session.execute(
+            select(lines.c.day, lines.c.key, func.coalesce(func.sum(lines.c.qty), 0), func.count())
+            .group_by(lines.c.day, lines.c.key)
+        ).all()
+
+        stmt = dialect_insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[model.day, getattr(model, key)],
+            set_={"qty_dispatched": stmt.excluded.qty_dispatched, "dispatch_lines": stmt.excluded.dispatch_lines},
+        )
+        for start in range(0, len(totals), batch_size):
+            db.session.execute(stmt, [
+                {"day": as_date(day), key: k, "qty_dispatched": int(qty), "dispatch_lines": int(count),
+                 "qty_cancelled": 0, "back_orders_raised": 0}
+                for day, k, qty, count in totals[start:start + batch_size]
+            ])
+        written += len(totals)
+    db.session.commit()
+    return written
+
+@app.cli.command("demand-backfill")
+@click.option("--since", help="Only recompute days from this date (YYYY-MM-DD); default is all history")
+def demand_backfill_command(since):
+    """Rebuild the dispatch figures in the demand rollups from dispatch history."""
+    since_date = parse_date_arg(since) if since else None
+    if since and since_date is None:
+        raise click.BadParameter("expected YYYY-MM-DD", param_hint="--since")
+    written = backfill_demand(since_date)
+    click.echo(f"Wrote {written} demand rollup rows")
+
+def load_demand_report(start, end, top=DEMAND_TOP_PARTS):
+    """Top dispatched parts, most back-ordered parts and weekly consumption per engineer for [start, end).
+
+    Reads only the rollup tables; weeks start on Monday.
+    """
+    def top_parts(measure):
+        total = func.sum(getattr(DemandPartDaily, measure))
+        return [
+            SimpleNamespace(part_number=part, total=int(value))
+            for part, value in db.session.query(DemandPartDaily.part_number, total)
+            .filter(DemandPartDaily.day >= start, DemandPartDaily.day < end)
+            .group_by(DemandPartDaily.part_number)
+            .having(total > 0)
+            .order_by(total.desc(), DemandPartDaily.part_number)
+            .limit(top)
+        ]
+
+    weeks = []
+    week = start - timedelta(days=start.weekday())
+    while week < end:
+        weeks.append(week)
+        week += timedelta(days=7)
+    consumption = {}
+    rows = (
+        db.session.query(DemandEngineerDaily.engineer_email, DemandEngineerDaily.day, DemandEngineerDaily.qty_dispatched)
+        .filter(DemandEngineerDaily.day >= start, DemandEngineerDaily.day < end, DemandEngineerDaily.qty_dispatched > 0)
+    )
+    for email, day, qty in rows:
+        by_week = consumption.setdefault(email, dict.fromkeys(weeks, 0))
+        by_week[day - timedelta(days=day.weekday())] += qty
+
+    return SimpleNamespace(
+        start=start,
+        end=end,
+        weeks=weeks,
+        top_dispatched=top_parts("qty_dispatched"),
+        top_back_ordered=top_parts("back_orders_raised"),
+        engineer_weekly=[
+            SimpleNamespace(engineer_email=email, weeks=[by_week[w] for w in weeks], total=sum(by_week.values()))
+            for email, by_week in sorted(consumption.items(), key=lambda kv: (-sum(kv[1].values()), kv[0]))
+        ],
+    )
+
+def demand_report_range():
+    """[start, end) dates from date_from/date_to, defaulting to the last DEMAND_REPORT_WEEKS weeks"""
+    today = datetime.utcnow().date()
+    start = parse_date_arg(request.args.get("date_from", ""))
+    end = parse_date_arg(request.args.get("date_to", ""), end_of_day=True)
+    end = end.date() if end else today + timedelta(days=1)
+    start = start.date() if start else end - timedelta(weeks=DEMAND_REPORT_WEEKS)
+    return start, max(start, end)
+
+@app.route("/admin/demand")
+def demand_report():
+    start, end = demand_report_range()
+    report = load_demand_report(start, end)
+    return render_template(
+        "demand_report.html",
+        report=report,
+        date_from=start.isoformat(),
+        date_to=(end - timedelta(days=1)).isoformat(),
+    )
+
+# ── Streaming Exports ─────────────────────────────────────────────────────────
+
+def stream_query_rows(stmt):
+    """Yield result rows from a server-side cursor, EXPORT_FETCH_SIZE at a time"""
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_FETCH_SIZE))
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+def export_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+def stream_csv(header, rows):
+    """Yield CSV text in chunks of EXPORT_CHUNK_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for n, row in enumerate(rows, 1):
+        writer.writerow([export_cell(v) for v in row])
+        if n % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        if chunks:
+            yield b"".join(chunks)
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_XML_ILLEGAL = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
+def xlsx_cell(value) -> str:
+    value = export_cell(value)
+    if isinstance(value, (int, float)):
+        return f'<c t="n"><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{xml_escape(str(value).translate(_XML_ILLEGAL))}</t></is></c>'
+
+def stream_xlsx(sheet_name, header, rows):
+    """Yield a single-sheet XLSX workbook as it is built.
+
+    The worksheet is deflated straight into the zip stream with inline
+    strings, so memory stays flat however many rows there are.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", XLSX_CONTENT_TYPES)
+        zf.writestr("_rels/.rels", XLSX_ROOT_RELS)
+        zf.writestr("xl/_rels/workbook.xml.rels", XLSX_WORKBOOK_RELS)
+        zf.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{xml_escape(sheet_name)}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        yield from sink.drain()
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                '<row>' + "".join(xlsx_cell(h) for h in header) + '</row>'
+            ).encode("utf-8"))
+            for n, row in enumerate(rows, 1):
+                sheet.write(('<row>' + "".join(xlsx_cell(v) for v in row) + '</row>').encode("utf-8"))
+                if n % EXPORT_CHUNK_ROWS == 0:
+                    yield from sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield from sink.drain()
+
+def export_response(basename, sheet_name, header, rows, fmt):
+    """Stream rows as CSV (optionally gzipped) or XLSX"""
+    if fmt == "xlsx":
+        return Response(
+            stream_with_context(stream_xlsx(sheet_name, header, rows)),
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f"attachment; filename={basename}.xlsx"},
+        )
+
+    chunks = stream_csv(header, rows)
+    headers = {"Content-Disposition": f"attachment; filename={basename}.csv", "X-Accel-Buffering": "no"}
+    if request.args.get("gzip") == "1":
+        headers["Content-Disposition"] = f"attachment; filename={basename}.csv.gz"
+        return Response(stream_with_context(gzip_chunks(chunks)), mimetype="application/gzip", headers=headers)
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+        return Response(stream_with_context(gzip_chunks(chunks)), mimetype="text/csv", headers=headers)
+    return Response(stream_with_context(chunks), mimetype="text/csv", headers=headers)
+
+def export_filters():
+    return (
+        request.args.get("engineer", "").strip(),
+        parse_date_arg(request.args.get("date_from", "")),
+        parse_date_arg(request.args.get("date_to", ""), end_of_day=True),
+    )
+
+@app.route("/admin/export/dispatches.<any(csv, xlsx):fmt>")
+def export_dispatches(fmt):
+    engineer, start, end = export_filters()
+
+    def dispatch_rows(note, item):
+        stmt = (
+            select(
+                note.id, note.date, note.engineer_email, note.picker_name,
+                item.part_number, item.description, item.quantity_sent, item.id.label("item_id"),
+            )
+            .join(item, item.dispatch_note_id == note.id)
+        )
+        if engineer:
+            stmt = stmt.where(note.engineer_email == engineer)
+        if start:
+            stmt = stmt.where(note.date >= start)
+        if end:
+            stmt = stmt.where(note.date < end)
+        return stmt
+
+    rows = dispatch_rows(DispatchNote, DispatchItem)
+    if include_archived_arg():
+        rows = union_all(rows, dispatch_rows(DispatchNoteArchive, DispatchItemArchive))
+    rows = rows.subquery()
+    stmt = (
+        select(*(c for c in rows.c if c.name != "item_id"))
+        .order_by(rows.c.date.asc(), rows.c.id.asc(), rows.c.item_id.asc())
+    )
+
+    header = ["Dispatch ID", "Dispatch Date", "Engineer", "Picked By", "Part Number", "Description", "Quantity Sent"]
+    return export_response("dispatch_history", "Dispatches", header, stream_query_rows(stmt), fmt)
+
+@app.route("/admin/export/outstanding.<any(csv, xlsx):fmt>")
+def export_outstanding(fmt):
+    engineer, start, end = export_filters()
+    stmt = (
+        select(
+            PartsOrder.id, PartsOrder.date, PartsOrder.email,
+            PartsOrderItem.part_number, PartsOrderItem.description, PartsOrderItem.quantity,
+            func.coalesce(PartsOrderItem.quantity_sent, 0), PartsOrderItem.qty_remaining, PartsOrderItem.back_order,
+        )
+        .join(PartsOrderItem, PartsOrderItem.order_id == PartsOrder.id)
+        .where(PartsOrderItem.qty_remaining > 0)
+        .order_by(PartsOrder.email.asc(), PartsOrderItem.id.asc())
+    )
+    if engineer:
+        stmt = stmt.where(PartsOrder.email == engineer)
+    if start:
+        stmt = stmt.where(PartsOrder.date >= start)
+    if end:
+        stmt = stmt.where(PartsOrder.date < end)
+
+    header = ["Order ID", "Order Date", "Engineer", "Part Number", "Description", "Qty Ordered", "Qty Sent", "Qty Remaining", "Back Order"]
+    return export_response("outstanding_orders", "Outstanding", header, stream_query_rows(stmt), fmt)
+
+# ── JSON API (v1) ─────────────────────────────────────────────────────────────
+#
+# Read-only JSON over orders, order lines, dispatch notes and the catalogue.
+# Lists return {"data": [...], "next_cursor": ...}; pass next_cursor back as
+# ?cursor= for the next page and ?limit= to size pages. ?fields=a,b returns
+# only those fields (and skips loading nested items unless asked for). Every
+# response carries an ETag, so polling clients get 304 Not Modified while
+# nothing has changed, and bodies are gzipped for clients that accept it.
+#
+# The order, order line and dispatch lists take their ETag from aggregates
+# over the page's rows (count, id range, quantities) plus the query string,
+# worked out before any row is loaded, so a 304 costs one small query. Only
+# numbers feed it: a text-only edit to a line already on the page shows up
+# once anything else on that page changes.
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+@app.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({"error": error.message}), error.status
+
+def api_fields(allowed, default=None):
+    """Fields requested with ?fields=, validated against `allowed`"""
+    raw = request.args.get("fields", "").strip()
+    if not raw:
+        return default or allowed
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(allowed)}")
+    return fields
+
+def api_limit():
+    return clamp_per_page(request.args.get("limit"), API_PAGE_SIZE, API_MAX_PAGE_SIZE)
+
+def api_int_cursor():
+    cursor = request.args.get("cursor", "").strip()
+    if not cursor:
+        return None
+    if not cursor.isdigit():
+        raise ApiError("Invalid cursor")
+    return int(cursor)
+
+def api_not_modified(etag):
+    """A 304 response if the client already holds `etag`, else None"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return None
+
+def api_version_etag(*versions):
+    """Weak ETag for a list page from its version aggregates and the request's path and query string"""
+    key = "|".join([request.path, request.query_string.decode()] + [repr(tuple(v)) for v in versions])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def page_version(window, id_column, *summed):
+    """(count, min id, max id, sums of `summed`) over the rows of a limited query, without loading them"""
+    page = window.with_entities(id_column.label("id"), *(c.label(f"sum_{i}") for i, c in enumerate(summed))).subquery()
+    return db.session.query(
+        func.count(), func.min(page.c.id), func.max(page.c.id),
+        *(func.sum(page.c[f"sum_{i}"]) for i in range(len(summed))),
+    ).one()
+
+def api_response(payload, etag=None):
+    """Serialise payload with an ETag (hash of the body unless given), honouring If-None-Match and gzip"""
+    body = json.dumps(payload, separators=(",", ":"), default=api_value).encode("utf-8")
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag or hashlib.sha1(body).hexdigest(), weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    response.make_conditional(request)
+    if response.status_code != 200:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if len(body) >= API_GZIP_MIN_BYTES and "gzip" in request.headers.get("Accept-Encoding", ""):
+        response.set_data(b"".join(gzip_chunks([body])))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+def api_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+def api_record(values, fields):
+    return {f: values[f]() for f in fields}
+
+ORDER_FIELDS = ("id", "email", "date", "status", "items")
+ORDER_ITEM_FIELDS = ("id", "order_id", "email", "order_date", "part_number", "description",
+                     "quantity", "quantity_sent", "qty_remaining", "back_order")
+DISPATCH_FIELDS = ("id", "engineer_email", "date", "picker_name", "items")
+DISPATCH_ITEM_FIELDS = ("part_number", "description", "quantity_sent")
+PART_HISTORY_FIELDS = ("part_number", "engineer_email", "description", "outstanding_qty", "outstanding_lines",
+                       "last_ordered", "last_sent", "sent_qty")
+
+# What this app and the order form change on an existing line
+ORDER_ITEM_VERSION_COLUMNS = (
+    PartsOrderItem.quantity,
+    func.coalesce(PartsOrderItem.quantity_sent, 0),
+    case((PartsOrderItem.back_order.is_(True), 1), else_=0),
+)
+
+def serialize_order_item(item, fields):
+    return api_record({
+        "id": lambda: item.id,
+        "order_id": lambda: item.order_id,
+        "email": lambda: item.order.email,
+        "order_date": lambda: item.order.date,
+        "part_number": lambda: item.part_number,
+        "description": lambda: item.description,
+        "quantity": lambda: item.quantity,
+        "quantity_sent": lambda: item.quantity_sent or 0,
+        "qty_remaining": lambda: item.qty_remaining,
+        "back_order": lambda: bool(item.back_order),
+    }, fields)
+
+def serialize_order(order, fields):
+    return api_record({
+        "id": lambda: order.id,
+        "email": lambda: order.email,
+        "date": lambda: order.date,
+        "status": lambda: order.status,
+        "items": lambda: [serialize_order_item(i, ORDER_ITEM_FIELDS) for i in sorted(order.items, key=lambda i: i.id)],
+    }, fields)
+
+def serialize_dispatch(dispatch, fields):
+    return api_record({
+        "id": lambda: dispatch.id,
+        "engineer_email": lambda: dispatch.engineer_email,
+        "date": lambda: dispatch.date,
+        "picker_name": lambda: dispatch.picker_name,
+        "items": lambda: [
+            {"part_number": i.part_number, "description": i.description, "quantity_sent": i.quantity_sent}
+            for i in sorted(dispatch.items, key=lambda i: i.id)
+        ],
+    }, fields)
+
+@app.route("/api/v1/orders")
+def api_orders():
+    """Orders, newest first. Filters: engineer, status"""
+    fields = api_fields(ORDER_FIELDS, default=ORDER_FIELDS[:-1])
+    limit, before_id = api_limit(), api_int_cursor()
+
+    query = db.session.query(PartsOrder)
+    if request.args.get("engineer"):
+        query = query.filter(PartsOrder.email == request.args["engineer"].strip())
+    if request.args.get("status"):
+        query = query.filter(PartsOrder.status == request.args["status"].strip())
+    if before_id is not None:
+        query = query.filter(PartsOrder.id < before_id)
+
+    window = query.order_by(PartsOrder.id.desc()).limit(limit + 1)
+    versions = [page_version(window, PartsOrder.id)]
+    if "items" in fields:
+        order_ids = window.with_entities(PartsOrder.id).subquery()
+        items = db.session.query(PartsOrderItem).filter(PartsOrderItem.order_id.in_(select(order_ids.c.id)))
+        versions.append(page_version(items, PartsOrderItem.id, *ORDER_ITEM_VERSION_COLUMNS))
+        window = window.options(selectinload(PartsOrder.items))
+    etag = api_version_etag(*versions)
+    not_modified = api_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    rows = window.all()
+    next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+    return api_response({"data": [serialize_order(o, fields) for o in rows[:limit]], "next_cursor": next_cursor}, etag=etag)
+
+@app.route("/api/v1/orders/<int:order_id>")
+def api_order(order_id):
+    fields = api_fields(ORDER_FIELDS)
+    order = db.session.get(PartsOrder, order_id) or db.session.get(PartsOrderArchive, order_id)
+    if order is None:
+        raise ApiError("Order not found", 404)
+    return api_response({"data": serialize_order(order, fields)})
+
+@app.route("/api/v1/order_items")
+def api_order_items():
+    """Order lines in id order. Filters: engineer, outstanding=true, back_order=true|false"""
+    fields = api_fields(ORDER_ITEM_FIELDS)
+    limit, after_id = api_limit(), api_int_cursor()
+
+    query = (
+        db.session.query(PartsOrderItem)
+        .join(PartsOrder, PartsOrder.id == PartsOrderItem.order_id)
+        .options(contains_eager(PartsOrderItem.order))
+    )
+    if request.args.get("engineer"):
+        query = query.filter(PartsOrder.email == request.args["engineer"].strip())
+    if request.args.get("outstanding", "").lower() == "true":
+        query = query.filter(PartsOrderItem.qty_remaining > 0)
+    if request.args.get("back_order", "").lower() in ("true", "false"):
+        query = query.filter(PartsOrderItem.back_order.is_(request.args["back_order"].lower() == "true"))
+    if after_id is not None:
+        query = query.filter(PartsOrderItem.id > after_id)
+
+    window = query.order_by(PartsOrderItem.id.asc()).limit(limit + 1)
+    etag = api_version_etag(page_version(window, PartsOrderItem.id, *ORDER_ITEM_VERSION_COLUMNS))
+    not_modified = api_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    rows = window.all()
+    next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+    return api_response({"data": [serialize_order_item(i, fields) for i in rows[:limit]], "next_cursor": next_cursor}, etag=etag)
+
+@app.route("/api/v1/dispatches")
+def api_dispatches():
+    """Dispatch notes, newest first. Filters: engineer, date_from, date_to (YYYY-MM-DD), include_archived"""
+    fields = api_fields(DISPATCH_FIELDS)
+    cursor = request.args.get("cursor", "").strip() or None
+    if cursor and decode_dispatch_cursor(cursor) is None:
+        raise ApiError("Invalid cursor")
+
+    engineer, start, end = export_filters()
+    query = dispatch_history_query(DispatchNote, engineer, start, end)
+    archived_query = dispatch_history_query(DispatchNoteArchive, engineer, start, end) if include_archived_arg() else None
+    limit = api_limit()
+
+    # Notes and their items never change once written, so the ids on the page fix the body
+    etag = api_version_etag(*(
+        page_version(window, note.id)
+        for note, window in dispatch_page_windows(query, cursor, limit, archived_query)
+    ))
+    not_modified = api_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    rows, next_cursor = paginate_dispatch_notes(
+        query, cursor, limit, with_items="items" in fields, archived_query=archived_query
+    )
+    return api_response({"data": [serialize_dispatch(d, fields) for d in rows], "next_cursor": next_cursor}, etag=etag)
+
+@app.route("/api/v1/dispatches/<int:dispatch_id>")
+def api_dispatch(dispatch_id):
+    fields = api_fields(DISPATCH_FIELDS)
+    dispatch = db.session.get(DispatchNote, dispatch_id) or db.session.get(DispatchNoteArchive, dispatch_id)
+    if dispatch is None:
+        raise ApiError("Dispatch note not found", 404)
+    return api_response({"data": serialize_dispatch(dispatch, fields)})
+
+def serialize_part_history(row, fields):
+    return api_record({
+        "part_number": lambda: row.part_number,
+        "engineer_email": lambda: row.engineer_email,
+        "description": lambda: row.description,
+        "outstanding_qty": lambda: int(row.outstanding_qty or 0),
+        "outstanding_lines": lambda: int(row.outstanding_lines or 0),
+        "last_ordered": lambda: row.last_ordered,
+        "last_sent": lambda: row.last_sent,
+        "sent_qty": lambda: int(row.sent_qty or 0),
+    }, fields)
+
+@app.route("/api/v1/part_history")
+def api_part_history():
+    """Per-engineer order and dispatch history of parts matching q. Filters: include_archived"""
+    fields = api_fields(PART_HISTORY_FIELDS)
+    term = request.args.get("q", "").strip()
+    if len(term) < PART_SEARCH_MIN_LENGTH:
+        raise ApiError(f"q must be at least {PART_SEARCH_MIN_LENGTH} characters")
+    cursor = request.args.get("cursor", "").strip() or None
+    if cursor and decode_part_search_cursor(cursor) is None:
+        raise ApiError("Invalid cursor")
+
+    rows, next_cursor = search_part_history(term, cursor, api_limit(), include_archived_arg())
+    return api_response({"data": [serialize_part_history(r, fields) for r in rows], "next_cursor": next_cursor})
+
+@app.route("/api/v1/demand")
+def api_demand():
+    """Demand rollups for date_from..date_to (YYYY-MM-DD, default the last DEMAND_REPORT_WEEKS weeks)"""
+    start, end = demand_report_range()
+    report = load_demand_report(start, end)
+    return api_response({"data": {
+        "date_from": start.isoformat(),
+        "date_to": (end - timedelta(days=1)).isoformat(),
+        "top_dispatched": [vars(p) for p in report.top_dispatched],
+        "top_back_ordered": [vars(p) for p in report.top_back_ordered],
+        "engineer_weekly": [
+            {"engineer_email": e.engineer_email, "total": e.total,
+             "weeks": [{"week": w.isoformat(), "qty_dispatched": q} for w, q in zip(report.weeks, e.weeks)]}
+            for e in report.engineer_weekly
+        ],
+    }})
+
+@app.route("/api/v1/catalogue")
+def api_catalogue():
+    """Catalogue parts in product code order. Filters: search, category"""
+    fields = api_fields(CatalogueStore.FIELDS)
+    limit = api_limit()
+    after = request.args.get("cursor", "")
+
+    index = catalogue_cache.get_index()
+    if index is None:
+        raise ApiError("Catalogue not available", 503)
+    # The catalogue version plus the query fixes the body, so a repeat poll is answered before searching
+    etag = hashlib.sha1(f"{catalogue_cache.version}|{request.query_string.decode()}".encode()).hexdigest()
+    not_modified = api_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    search, category = request.args.get("search", "").strip(), request.args.get("category", "").strip()
+    if search or category:
+        parts = index.search(search, category)
+        codes = [p.product_code for p in parts]
+    else:
+        parts, codes = index.parts, index.parts.sorted_codes
+    start = bisect_right(codes, after) if after else 0
+    page = [parts[i] for i in range(start, min(start + limit, len(codes)))]
+    next_cursor = page[-1].product_code if start + limit < len(codes) else None
+
+    return api_response({
+        "data": [{f: part[f] for f in fields} for part in page],
+        "next_cursor": next_cursor,
+    }, etag=etag)
+
+@app.route("/api/v1/catalogue/<path:product_code>")
+def api_catalogue_part(product_code):
+    fields = api_fields(CatalogueStore.FIELDS)
+    parts = catalogue_cache.get_parts()
+    part = parts.get(unquote(product_code)) if parts is not None else None
+    if part is None:
+        raise ApiError("Part not found", 404)
+    return api_response({"data": {f: part[f] for f in fields}})
 
 # ── Catalogue Management Routes (Debug Version) ──────────────────────────────
 
@@ -538,30 +3878,14 @@ def catalogue_manager():
         search_query = request.args.get('search', '').strip()
         category_filter = request.args.get('category', '').strip()
         
-        csv_content = fetch_csv_from_github()
-        if csv_content is None:
-            flash("Could not load CSV from GitHub. Check your connection.", "error")
+        index = catalogue_cache.get_index()
+        if index is None:
+            flash("The catalogue mirror is empty. Run `flask catalogue-sync` to fill it from GitHub.", "error")
             return render_template("catalogue_manager.html", parts=[], categories=[], search_query=search_query, category_filter=category_filter)
         
-        all_parts = parse_csv_content(csv_content)
-        
-        parts = all_parts
-        if search_query:
-            search_lower = search_query.lower()
-            parts = [p for p in parts if (
-                search_lower in p['product_code'].lower() or
-                search_lower in p.get('description', '').lower() or
-                search_lower in p.get('make', '').lower() or
-                search_lower in p.get('manufacturer', '').lower()
-            )]
+        parts = index.search(search_query, category_filter)
         
-        if category_filter:
-            parts = [p for p in parts if category_filter.lower() in p.get('category', '').lower()]
-        
-        categories = list(set(p.get('category', '') for p in all_parts if p.get('category', '')))
-        categories.sort()
-        
-        return render_template("catalogue_manager.html", parts=parts, categories=categories, search_query=search_query, category_filter=category_filter)
+        return render_template("catalogue_manager.html", parts=parts, categories=index.categories, search_query=search_query, category_filter=category_filter)
                              
     except Exception as e:
         flash(f"Error loading catalogue: {str(e)}", "error")
@@ -575,34 +3899,22 @@ def add_part():
             flash("Product code is required", "error")
             return redirect(url_for('catalogue_manager'))
         
-        csv_content, sha = get_github_file_info()
-        if csv_content is None:
-            flash("Could not access GitHub API. Check your token configuration.", "error")
+        operation, error = normalize_catalogue_operation(dict(request.form.to_dict(), op='add'))
+        if error:
+            flash(error, "error")
             return redirect(url_for('catalogue_manager'))
         
-        parts = parse_csv_content(csv_content)
-        
-        if any(p['product_code'] == product_code for p in parts):
+        # Cheap early rejection from the mirror; the write path re-checks against GitHub
+        if lookup_catalogue_parts([product_code]):
             flash(f"Part {product_code} already exists", "error")
             return redirect(url_for('catalogue_manager'))
         
-        new_part = {
-            'product_code': product_code,
-            'description': request.form.get('description', '').strip(),
-            'category': request.form.get('category', '').strip(),
-            'make': request.form.get('make', '').strip(),
-            'manufacturer': request.form.get('manufacturer', '').strip(),
-            'image': request.form.get('image', '').strip()
-        }
-        parts.append(new_part)
-        parts.sort(key=lambda x: x['product_code'])
-        
-        success, message = update_github_csv(parts, sha, f"Add new part: {product_code}")
+        ticket = catalogue_write_buffer.submit([operation])
         
-        if success:
+        if ticket.success:
             flash(f"Successfully added part: {product_code}", "success")
         else:
-            flash(f"Failed to add part: {message}", "error")
+            flash(f"Failed to add part: {ticket.message}", "error")
             
     except Exception as e:
         flash(f"Error adding part: {str(e)}", "error")
@@ -611,119 +3923,70 @@ def add_part():
 
 @app.route("/admin/catalogue/part/<path:product_code>", methods=["PUT", "DELETE"])
 def update_or_delete_part(product_code):
-    """FIXED VERSION: Handle special characters in product codes"""
+    """Update or delete one part; handles special characters in product codes"""
     # Decode URL-encoded product code
     product_code = unquote(product_code)
-    print(f"=== DEBUG: Received {request.method} request for product_code: '{product_code}' ===")
+    catalogue_log.debug("%s request for product code %r", request.method, product_code)
     
     try:
-        # Log request details
-        print(f"Request method: {request.method}")
-        print(f"Decoded product code: '{product_code}'")
-        
-        if request.method == "PUT":
-            print(f"Request JSON: {request.get_json()}")
-        
-        # Check GitHub token
-        print(f"GITHUB_TOKEN set: {bool(GITHUB_TOKEN)}")
-        
-        # Get current CSV from GitHub API
-        print("Attempting to fetch CSV from GitHub...")
-        csv_content, sha = get_github_file_info()
-        print(f"CSV content received: {bool(csv_content)}")
-        print(f"SHA received: {sha[:8] if sha else None}...")
-        
-        if csv_content is None:
-            error_msg = "Could not access GitHub API. Check your GITHUB_TOKEN."
-            print(f"ERROR: {error_msg}")
-            return jsonify({"success": False, "message": error_msg})
-        
-        # Parse existing parts
-        print("Parsing CSV content...")
-        parts = parse_csv_content(csv_content)
-        print(f"Parts parsed: {len(parts)} parts found")
-        
-        # Find the part to update/delete
-        print(f"Looking for part with product_code: '{product_code}'")
-        part_index = None
-        for i, part in enumerate(parts):
-            if part['product_code'] == product_code:
-                part_index = i
-                print(f"Found matching part at index {i}")
-                break
-        
-        if part_index is None:
-            error_msg = f"Part '{product_code}' not found in {len(parts)} parts"
-            print(f"ERROR: {error_msg}")
-            return jsonify({"success": False, "message": error_msg})
-        
-        print(f"Found part at index {part_index}: {parts[part_index]}")
-        
         if request.method == "DELETE":
-            print("Processing DELETE request...")
-            deleted_part = parts.pop(part_index)
-            commit_message = f"Delete part: {product_code}"
-            print(f"Deleted part: {deleted_part}")
-            
-        elif request.method == "PUT":
-            print("Processing PUT request...")
+            raw = {'op': 'delete', 'product_code': product_code}
+        else:
             data = request.get_json()
             if not data:
-                error_msg = "No JSON data provided in PUT request"
-                print(f"ERROR: {error_msg}")
-                return jsonify({"success": False, "message": error_msg})
-                
-            print(f"Update data received: {data}")
-            part = parts[part_index]
-            print(f"Original part: {part}")
-            
-            # Update only the provided fields
-            if 'description' in data:
-                old_val = part['description']
-                part['description'] = str(data['description']).strip()
-                print(f"Updated description: '{old_val}' -> '{part['description']}'")
-            if 'category' in data:
-                old_val = part['category']
-                part['category'] = str(data['category']).strip()
-                print(f"Updated category: '{old_val}' -> '{part['category']}'")
-            if 'make' in data:
-                old_val = part['make']
-                part['make'] = str(data['make']).strip()
-                print(f"Updated make: '{old_val}' -> '{part['make']}'")
-            if 'manufacturer' in data:
-                old_val = part['manufacturer']
-                part['manufacturer'] = str(data['manufacturer']).strip()
-                print(f"Updated manufacturer: '{old_val}' -> '{part['manufacturer']}'")
-            if 'image' in data:
-                old_val = part['image']
-                part['image'] = str(data['image']).strip()
-                print(f"Updated image: '{old_val}' -> '{part['image']}'")
-            
-            commit_message = f"Update part: {product_code}"
-            print(f"Updated part: {part}")
+                return jsonify({"success": False, "message": "No JSON data provided in PUT request"})
+            raw = {f: data[f] for f in CATALOGUE_FIELDS if f in data}
+            raw.update(op='update', product_code=product_code)
         
-        # Update GitHub
-        print(f"Attempting to update GitHub with commit message: '{commit_message}'")
-        print(f"Total parts to write: {len(parts)}")
+        operation, error = normalize_catalogue_operation(raw)
+        if error:
+            return jsonify({"success": False, "message": error})
         
-        success, message = update_github_csv(parts, sha, commit_message)
-        print(f"GitHub update result - Success: {success}, Message: '{message}'")
+        ticket = catalogue_write_buffer.submit([operation])
+        catalogue_log.info("%s %s: success=%s %s", request.method, product_code, ticket.success, ticket.message)
         
-        return jsonify({"success": success, "message": message})
+        return jsonify({"success": ticket.success, "message": ticket.message})
         
     except Exception as e:
         error_msg = f"Exception in update_or_delete_part: {str(e)}"
-        print(f"ERROR: {error_msg}")
-        print("Full traceback:")
-        traceback.print_exc()
+        catalogue_log.exception(error_msg)
         return jsonify({"success": False, "message": error_msg})
+
+@app.route("/admin/catalogue/batch", methods=["POST"])
+def batch_update_parts():
+    """Apply a list of add/update/delete operations as a single GitHub commit.
+
+    Body: {"operations": [{"op": "add"|"update"|"delete", "product_code": ..., <fields>}],
+           "message": optional commit message, "wait": false to queue and return 202}
+    """
+    data = request.get_json(silent=True) or {}
+    raw_operations = data.get('operations')
+    if not isinstance(raw_operations, list) or not raw_operations:
+        return jsonify({"success": False, "message": "No operations provided"}), 400
+
+    operations, errors = [], []
+    for i, raw in enumerate(raw_operations):
+        operation, error = normalize_catalogue_operation(raw)
+        if error:
+            errors.append({"index": i, "message": error})
+        operations.append(operation)
+    if errors:
+        return jsonify({"success": False, "message": "Invalid operations", "errors": errors}), 400
+
+    commit_message = str(data.get('message') or '').strip() or None
+    if data.get('wait') is False:
+        catalogue_write_buffer.submit(operations, commit_message, wait=False)
+        return jsonify({"success": True, "message": f"Queued {len(operations)} operations"}), 202
+
+    ticket = catalogue_write_buffer.submit(operations, commit_message)
+    return jsonify({"success": ticket.success, "message": ticket.message, "results": ticket.results})
         
 @app.route("/admin/catalogue/export")
 def export_catalogue():
     try:
-        csv_content = fetch_csv_from_github()
+        csv_content = catalogue_cache.get_csv()
         if csv_content is None:
-            flash("Could not access GitHub CSV", "error")
+            flash("The catalogue mirror is empty. Run `flask catalogue-sync` to fill it from GitHub.", "error")
             return redirect(url_for('catalogue_manager'))
         
         return Response(
@@ -735,33 +3998,33 @@ def export_catalogue():
         flash(f"Export failed: {str(e)}", "error")
         return redirect(url_for('catalogue_manager'))
 
+@app.route("/admin/catalogue/cache_stats")
+def catalogue_cache_stats():
+    return jsonify(catalogue_cache.stats())
+
+@app.route("/admin/github/stats")
+def github_stats():
+    return jsonify(github.stats())
+
 @app.route("/admin/catalogue/debug_test")
 def debug_test():
     """Test route to check GitHub connectivity"""
-    print("=== DEBUG TEST ROUTE ===")
-    
-    # Test 1: Check environment variables
-    print(f"GITHUB_TOKEN set: {bool(GITHUB_TOKEN)}")
-    print(f"GITHUB_REPO: {GITHUB_REPO}")
-    print(f"CSV_FILE_PATH: {CSV_FILE_PATH}")
-    
-    # Test 2: Try to fetch CSV
-    print("Testing CSV fetch...")
-    csv_content = fetch_csv_from_github()
-    print(f"Public CSV fetch success: {bool(csv_content)}")
+    # Test 1: Try to fetch CSV (a conditional GET, so usually a cheap 304)
+    status, _, _ = fetch_csv_from_github_conditional(get_app_state("catalogue_etag"))
+    csv_content = status in (200, 304)
+    cached_parts = catalogue_cache.get_parts()
     
-    # Test 3: Try GitHub API
-    print("Testing GitHub API...")
+    # Test 2: Try GitHub API
     api_content, sha = get_github_file_info()
-    print(f"API fetch success: {bool(api_content and sha)}")
+
+    cache_stats = catalogue_cache.stats()
+    cache_stats["mirror_sha"] = get_app_state("catalogue_sha")
+    cache_stats["mirror_synced_at"] = get_app_state("catalogue_synced_at")
     
-    # Test 4: Parse parts
-    parts = []
-    if csv_content:
-        parts = parse_csv_content(csv_content)
-        print(f"Parsed {len(parts)} parts")
-        if parts:
-            print(f"First part: {parts[0]}")
+    # Test 3: Parse parts
+    parts = cached_parts or []
+    github_log.info("Debug test: token set=%s, CSV fetch=%s, API fetch=%s, parts=%d",
+                    bool(GITHUB_TOKEN), bool(csv_content), bool(api_content and sha), len(parts))
     
     return f"""
     <div style="font-family: system-ui; padding: 40px; max-width: 700px; margin: 0 auto;">
@@ -783,6 +4046,13 @@ def debug_test():
                 <li><strong>Parts parsed:</strong> {len(parts) if parts else 0}</li>
             </ul>
         </div>
+
+        <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
+            <h4>Catalogue Cache:</h4>
+            <ul>
+                {''.join(f'<li><strong>{k}:</strong> {v}</li>' for k, v in cache_stats.items())}
+            </ul>
+        </div>
         
         {f'<div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;"><h4>Sample Data:</h4><pre>{str(parts[0]) if parts else "No parts found"}</pre></div>' if parts else ''}
         
@@ -801,27 +4071,16 @@ def test_edit():
         field_name = request.form.get('field_name') 
         new_value = request.form.get('new_value')
         
-        print(f"=== TEST EDIT FORM DATA ===")
-        print(f"Product Code: '{product_code}'")
-        print(f"Field Name: '{field_name}'")
-        print(f"New Value: '{new_value}'")
+        catalogue_log.debug("Test edit: %r %s=%r", product_code, field_name, new_value)
         
         # Try the same logic as the real edit
         csv_content, sha = get_github_file_info()
         if csv_content:
             parts = parse_csv_content(csv_content)
-            print(f"Found {len(parts)} parts")
-            
-            # Find the part
-            part_index = None
-            for i, part in enumerate(parts):
-                if part['product_code'] == product_code:
-                    part_index = i
-                    break
+            part = parts.get(product_code)
             
-            if part_index is not None:
-                print(f"Found part at index {part_index}")
-                parts[part_index][field_name] = new_value
+            if part is not None:
+                part[field_name] = new_value
                 success, message = update_github_csv(parts, sha, f"Test update: {product_code}")
                 return f"<h2>Update Result</h2><p>Success: {success}</p><p>Message: {message}</p><p><a href='/admin/catalogue/test_edit'>Try Again</a></p>"
             else:
@@ -865,12 +4124,236 @@ def hidden_parts_redirect():
     flash("The hidden parts feature has been upgraded to a full catalogue manager!", "info")
     return redirect(url_for('catalogue_manager'))
 
+# ── Schema Migrations ─────────────────────────────────────────────────────────
+#
+# db.create_all() only creates missing tables, so changes to existing tables
+# (new columns, new indexes) are applied here as numbered migrations. Run
+# `flask db-upgrade` on deploy; each migration is recorded in schema_migration
+# and only ever applied once. Migrations marked transactional=False run in
+# autocommit mode (PostgreSQL cannot build an index CONCURRENTLY inside a
+# transaction), so they must be safe to re-run after failing part way.
+
+class SchemaMigration(db.Model):
+    __tablename__ = "schema_migration"
+    version = db.Column(db.String(64), primary_key=True)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+MIGRATIONS = []
+
+def migration(version: str, transactional: bool = True):
+    def register(fn):
+        MIGRATIONS.append((version, fn, transactional))
+        return fn
+    return register
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+def create_index_concurrently(conn, index) -> None:
+    """Build an index without blocking writes: CREATE INDEX CONCURRENTLY on PostgreSQL, a plain create elsewhere"""
+    if conn.dialect.name != "postgresql":
+        index.create(bind=conn, checkfirst=True)
+        return
+    valid = conn.execute(
+        text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"),
+        {"name": index.name},
+    ).scalar()
+    if valid:
+        return
+    if valid is False:
+        # Left INVALID by an interrupted concurrent build
+        conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}")
+    ddl = str(CreateIndex(index).compile(dialect=conn.dialect))
+    conn.exec_driver_sql(re.sub(r"^CREATE (UNIQUE )?INDEX", r"CREATE \1INDEX CONCURRENTLY", ddl))
+
+@migration("0001_create_tables")
+def create_missing_tables(conn):
+    db.metadata.create_all(bind=conn)
+
+@migration("0002_parts_order_item_qty_remaining")
+def add_qty_remaining_column(conn):
+    """Add qty_remaining as a generated column.
+
+    On PostgreSQL a STORED generated column rewrites the whole of
+    parts_order_item under an ACCESS EXCLUSIVE lock, so order lines can be
+    neither read nor written until the copy finishes. Apply it in a
+    maintenance window. lock_timeout makes it fail fast, rather than queue
+    every other query behind it, if the table is busy when it starts.
+    """
+    if column_exists(conn, "parts_order_item", "qty_remaining"):
+        return
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+    # SQLite can only add VIRTUAL generated columns to an existing table; both kinds can be indexed
+    storage = "VIRTUAL" if conn.dialect.name == "sqlite" else "STORED"
+    conn.execute(text(
+        f"ALTER TABLE parts_order_item ADD COLUMN qty_remaining INTEGER "
+        f"GENERATED ALWAYS AS ({QTY_REMAINING_SQL}) {storage}"
+    ))
+
+@migration("0003_hot_query_indexes", transactional=False)
+def create_hot_query_indexes(conn):
+    for model in (PartsOrder, PartsOrderItem, DispatchNote, DispatchItem):
+        for index in model.__table__.indexes:
+            create_index_concurrently(conn, index)
+
+@migration("0004_catalogue_part")
+def create_catalogue_part_table(conn):
+    CataloguePart.__table__.create(bind=conn, checkfirst=True)
+
+@migration("0005_dispatch_document")
+def create_dispatch_document_table(conn):
+    DispatchDocument.__table__.create(bind=conn, checkfirst=True)
+
+@migration("0006_stock_ledger")
+def create_stock_ledger_tables(conn):
+    for model in (StockMovement, StockBalance, StockSnapshot, StockSnapshotLine):
+        model.__table__.create(bind=conn, checkfirst=True)
+
+@migration("0007_archive_tables")
+def create_archive_tables(conn):
+    for model in (PartsOrderArchive, PartsOrderItemArchive, DispatchNoteArchive, DispatchItemArchive, DispatchDocumentArchive):
+        model.__table__.create(bind=conn, checkfirst=True)
+    if conn.dialect.name == "postgresql":
+        # Ledger rows outlive their dispatch note once it is archived
+        conn.execute(text("ALTER TABLE stock_movement DROP CONSTRAINT IF EXISTS stock_movement_dispatch_note_id_fkey"))
+
+@migration("0008_part_search_indexes")
+def create_part_search_indexes(conn):
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for table in PART_SEARCH_TABLES:
+            for column in ("part_number", "description"):
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)"
+                ))
+        return
+
+    # External-content FTS5 tables: the index only, rows are read from the table itself
+    for table in PART_SEARCH_TABLES:
+        search = f"{table}_search"
+        conn.execute(text(f"DROP TABLE IF EXISTS {search}"))
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {search} USING fts5("
+            f"part_number, description, content='{table}', content_rowid='id', tokenize='trigram')"
+        ))
+        conn.execute(text(f"INSERT INTO {search}({search}) VALUES ('rebuild')"))
+        insert_row = f"INSERT INTO {search}(rowid, part_number, description) VALUES (new.id, new.part_number, new.description);"
+        delete_row = (
+            f"INSERT INTO {search}({search}, rowid, part_number, description) "
+            f"VALUES ('delete', old.id, old.part_number, old.description);"
+        )
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {search}_ai AFTER INSERT ON {table} BEGIN {insert_row} END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {search}_ad AFTER DELETE ON {table} BEGIN {delete_row} END"))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {search}_au AFTER UPDATE OF part_number, description ON {table} "
+            f"BEGIN {delete_row} {insert_row} END"
+        ))
+
+@migration("0009_demand_rollups")
+def create_demand_rollup_tables(conn):
+    for model in (DemandPartDaily, DemandEngineerDaily):
+        model.__table__.create(bind=conn, checkfirst=True)
+
+MIGRATION_LOCK_SQL = "hashtext('servitech_schema_migration')"
+
+def apply_migration(conn, version, fn, echo) -> None:
+    if conn.execute(SchemaMigration.__table__.select().where(SchemaMigration.version == version)).first():
+        return
+    echo(f"Applying migration {version}")
+    fn(conn)
+    conn.execute(SchemaMigration.__table__.insert().values(version=version, applied_at=datetime.utcnow()))
+
+def run_migrations(echo=print):
+    """Apply any migrations not yet recorded in schema_migration"""
+    with db.engine.begin() as conn:
+        SchemaMigration.__table__.create(bind=conn, checkfirst=True)
+
+    for version, fn, transactional in MIGRATIONS:
+        if transactional:
+            with db.engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    # Serialise concurrent deploys; released when this transaction ends
+                    conn.execute(text(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_SQL})"))
+                apply_migration(conn, version, fn, echo)
+            continue
+
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            postgres = conn.dialect.name == "postgresql"
+            # Polled rather than waited on: a session blocked inside a statement would hold
+            # a snapshot that the other deploy's concurrent index build has to wait out
+            while postgres and not conn.execute(text(f"SELECT pg_try_advisory_lock({MIGRATION_LOCK_SQL})")).scalar():
+                time.sleep(1)
+            try:
+                apply_migration(conn, version, fn, echo)
+            finally:
+                if postgres:
+                    conn.execute(text(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_SQL})"))
+
+@app.cli.command("db-upgrade")
+def db_upgrade_command():
+    """Create missing tables and apply pending schema migrations."""
+    run_migrations(echo=click.echo)
+    click.echo("Database is up to date")
+
+# ── Query Plan Checks ─────────────────────────────────────────────────────────
+
+def hot_query_plan_checks():
+    """(name, query, expected indexes) for the queries the busiest screens run.
+
+    Each expected entry is an index name, or a tuple of names any one of which
+    is acceptable (planners without statistics may pick either order_id index).
+    """
+    sample_email = "engineer@example.com"
+    return [
+        ("outstanding items", outstanding_items_query(sample_email),
+         ("ix_parts_order_email", ("ix_parts_order_item_outstanding", "ix_parts_order_item_order_id"))),
+        ("engineer dispatch history",
+         db.session.query(DispatchNote).filter(DispatchNote.engineer_email == sample_email)
+         .order_by(DispatchNote.date.desc()).limit(DISPATCH_HISTORY_PER_PAGE),
+         ("ix_dispatch_note_engineer_date",)),
+        ("dispatch history page",
+         db.session.query(DispatchNote).order_by(DispatchNote.date.desc(), DispatchNote.id.desc())
+         .limit(DISPATCH_HISTORY_PER_PAGE),
+         ("ix_dispatch_note_date_id",)),
+    ]
+
+def explain_query(query) -> str:
+    """Return the database's query plan for a Query as plain text"""
+    conn = db.session.connection()
+    sql = str(query.statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        return "\n".join(str(row[-1]) for row in rows)
+    if conn.dialect.name == "postgresql":
+        # On near-empty tables the planner prefers seq scans; force it to show whether an index applies
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+    rows = conn.execute(text(f"EXPLAIN {sql}")).fetchall()
+    return "\n".join(str(row[0]) for row in rows)
+
+@app.cli.command("explain-hot-queries")
+@click.option("--verbose", is_flag=True, help="Print each full plan")
+def explain_hot_queries_command(verbose):
+    """Check with EXPLAIN that the hot queries use their indexes."""
+    failures = 0
+    for name, query, expected in hot_query_plan_checks():
+        plan = explain_query(query)
+        missing = [
+            " or ".join(index) if isinstance(index, tuple) else index
+            for index in expected
+            if not any(name in plan for name in (index if isinstance(index, tuple) else (index,)))
+        ]
+        click.echo(f"{'FAIL' if missing else 'ok  '} {name}" + (f" (not using {', '.join(missing)})" if missing else ""))
+        if verbose or missing:
+            click.echo("    " + plan.replace("\n", "\n    "))
+        failures += bool(missing)
+    db.session.rollback()
+    if failures:
+        raise SystemExit(1)
+
 # ── Application Initialization ────────────────────────────────────────────────
 
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
+        run_migrations()
     app.run(debug=True)
-
-
-
@@ -0,0 +1,12 @@
+"""Benchmarks and load-test harness for the stock system.
+
+    python -m benchmarks --scale 0.01 --out results.json
+    python -m benchmarks --scale 0.01 --out new.json --compare results.json
+
+The harness seeds a database (SQLite by default, or any DATABASE_URL) with
+engineers, order lines and dispatch notes, then serves a synthetic catalogue
+from the in-process fake GitHub. It drives the hot routes through Flask's test
+client and records p50/p95/p99 latency and throughput per route as JSON.
+--scale 1 is the full production-sized data set: 500 engineers, 1M order
+lines and 200k dispatch notes.
+"""
@@ -0,0 +1,271 @@
+"""Seed a database, run the hot routes under load and write the timings as JSON"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_DATABASE = "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench.db")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL", DEFAULT_DATABASE))
+    parser.add_argument("--scale", type=float, default=0.01,
+                        help="fraction of 500 engineers / 1M order lines / 200k dispatch notes (default 0.01)")
+    parser.add_argument("--catalogue-parts", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests per route")
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads per route")
+    parser.add_argument("--routes", help="comma-separated subset of routes to run")
+    parser.add_argument("--reseed", action="store_true", help="seed even if the database already matches")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change in p95 or throughput counted as a regression (default 10)")
+    return parser.parse_args(argv)
+
+def configure_environment(args):
+    # The app reads its settings at import time
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("MAIL_ENABLED", "false")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class Scenario:
+    """One route under test; make_request() returns (method, path, form) for the next call"""
+
+    def __init__(self, name, make_request):
+        self.name = name
+        self.make_request = make_request
+
+def build_scenarios(appmod, volumes, rng):
+    engineers = volumes["engineers"]
+    notes = volumes["dispatch_notes"]
+    from benchmarks.seed import engineer_email
+
+    def random_engineer():
+        return engineer_email(rng.randrange(engineers))
+
+    def dispatch_post():
+        # Picking the line to send is setup, not part of the timed request
+        with appmod.app.app_context():
+            for _ in range(20):
+                email = random_engineer()
+                item = appmod.outstanding_items_query(email).first()
+                if item is not None:
+                    return "POST", f"/admin/parts_order_detail/{email}", {
+                        "picker_name": "Benchmark", f"send_{item.id}": "1",
+                    }
+        return "GET", f"/admin/parts_order_detail/{random_engineer()}", None
+
+    search_terms = ["pump", "01-2", "filter", "daikin", "part 123", ""]
+    return [
+        Scenario("parts_orders_list", lambda: ("GET", "/admin/parts_orders_list", None)),
+        Scenario("parts_order_detail_get", lambda: ("GET", f"/admin/parts_order_detail/{random_engineer()}", None)),
+        Scenario("parts_order_detail_post", dispatch_post),
+        Scenario("dispatched_orders", lambda: ("GET", "/admin/dispatched_orders", None)),
+        Scenario("view_dispatch_note", lambda: ("GET", f"/admin/dispatch_note/{rng.randrange(notes) + 1}", None)),
+        Scenario("catalogue_manager", lambda: ("GET", "/admin/catalogue?search=" + rng.choice(search_terms), None)),
+    ]
+
+def run_scenario(appmod, scenario, requests, warmup, concurrency):
+    warm_client = appmod.app.test_client()
+    for _ in range(warmup):
+        method, path, form = scenario.make_request()
+        warm_client.open(path, method=method, data=form).close()
+
+    lock = threading.Lock()
+    timings, errors = [], []
+    remaining = [requests]
+
+    def take():
+        with lock:
+            if not remaining[0]:
+                return None
+            remaining[0] -= 1
+            return scenario.make_request()
+
+    def worker():
+        client = appmod.app.test_client()
+        while True:
+            call = take()
+            if call is None:
+                return
+            method, path, form = call
+            started = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            elapsed = time.perf_counter() - started
+            response.close()
+            with lock:
+                timings.append(elapsed)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+
+    ms = sorted(t * 1000 for t in timings)
+    return {
+        "requests": len(ms),
+        "errors": len(errors),
+        "concurrency": concurrency,
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else None,
+        "p50_ms": round(percentile(ms, 50), 3) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 3) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 3) if ms else None,
+        "max_ms": round(ms[-1], 3) if ms else None,
+        # Wall time also covers choosing each request (e.g. the dispatch line), which is small
+        "throughput_rps": round(len(ms) / wall, 2) if wall else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def prepare_database(appmod, args):
+    """Seed unless the database already holds data from the same scale and seed"""
+    from benchmarks.seed import scaled_volumes, seed_database
+
+    fingerprint = json.dumps({"scale": args.scale, "seed": args.seed, "catalogue_parts": args.catalogue_parts})
+    with appmod.app.app_context():
+        if not args.reseed:
+            try:
+                stored = appmod.get_app_state("benchmark_seed")
+            except Exception:
+                appmod.db.session.rollback()
+                stored = None
+            if stored == fingerprint:
+                print("Reusing seeded database")
+                return dict(scaled_volumes(args.scale))
+
+        started = time.perf_counter()
+        volumes = seed_database(args.scale, args.catalogue_parts, seed=args.seed)
+        appmod.set_app_state("benchmark_seed", fingerprint)
+        appmod.db.session.commit()
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+        return volumes
+
+def start_fake_github(appmod, catalogue_parts, seed):
+    from benchmarks.seed import synthetic_catalogue_csv
+    from benchmarks.fake_github import FakeGitHubServer
+
+    server = FakeGitHubServer(
+        ("127.0.0.1", 0), {appmod.CSV_FILE_PATH: synthetic_catalogue_csv(catalogue_parts, seed)}, repo=appmod.GITHUB_REPO
+    )
+    server.start()
+    appmod.github.api_url = server.base_url
+    appmod.github.raw_url = server.base_url
+    appmod.GITHUB_TOKEN = appmod.GITHUB_TOKEN or "benchmark-token"
+    with appmod.app.app_context():
+        appmod.sync_catalogue_mirror()
+    return server
+
+def compare(results, baseline, threshold):
+    """Print per-route changes against a baseline; returns the routes that regressed"""
+    regressions = []
+    print(f"\n{'route':<26} {'p50':>16} {'p95':>16} {'p99':>16} {'rps':>16}")
+    for name, current in results["routes"].items():
+        before = baseline.get("routes", {}).get(name)
+        if not before:
+            print(f"{name:<26} (not in baseline)")
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            old, new = before.get(key), current.get(key)
+            if not old or new is None:
+                cells.append(f"{'-':>16}")
+                continue
+            change = (new - old) / old * 100
+            cells.append(f"{new:>8.1f} {change:>+6.1f}%")
+        print(f"{name:<26} " + " ".join(cells))
+
+        p95_change = _change(before.get("p95_ms"), current.get("p95_ms"))
+        rps_change = _change(before.get("throughput_rps"), current.get("throughput_rps"))
+        if (p95_change is not None and p95_change > threshold) or (rps_change is not None and rps_change < -threshold):
+            regressions.append(name)
+    return regressions
+
+def _change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import app as appmod
+
+    volumes = prepare_database(appmod, args)
+    server = start_fake_github(appmod, args.catalogue_parts, args.seed)
+    with appmod.app.app_context():
+        dialect = appmod.db.engine.dialect.name
+    rng = random.Random(args.seed)
+    scenarios = build_scenarios(appmod, volumes, rng)
+    if args.routes:
+        wanted = set(args.routes.split(","))
+        scenarios = [s for s in scenarios if s.name in wanted]
+
+    results = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": dialect,
+            "scale": args.scale,
+            "volumes": volumes,
+            "catalogue_parts": args.catalogue_parts,
+            "requests_per_route": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "routes": {},
+    }
+
+    print(f"{'route':<26} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>9} {'errors':>7}")
+    for scenario in scenarios:
+        stats = run_scenario(appmod, scenario, args.requests, args.warmup, args.concurrency)
+        results["routes"][scenario.name] = stats
+        print(f"{scenario.name:<26} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['throughput_rps']:>9.1f} {stats['errors']:>7}")
+    server.shutdown()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressed beyond {args.threshold:g}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
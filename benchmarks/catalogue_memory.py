@@ -0,0 +1,65 @@
+"""Compare the memory held by the catalogue as a list of dicts and as a CatalogueStore.
+
+Usage: python -m benchmarks.catalogue_memory [--parts 50000]
+
+Both representations are built from the same synthetic CSV and measured with
+tracemalloc, which counts only the allocations made while each one is built.
+"""
+
+import argparse
+import csv
+import gc
+import io
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import parse_csv_content  # noqa: E402
+from benchmarks.seed import synthetic_catalogue_csv  # noqa: E402
+
+def parse_as_dicts(csv_content):
+    """The catalogue representation the app used before CatalogueStore"""
+    parts = []
+    for row in csv.DictReader(io.StringIO(csv_content)):
+        parts.append({
+            'product_code': row['Product Code'].strip(),
+            'description': row['Description'].strip(),
+            'category': row['Category'].strip(),
+            'make': row['Make'].strip(),
+            'manufacturer': row['Manufacturer'].strip(),
+            'image': row['image'].strip(),
+        })
+    by_code = {p['product_code']: p for p in parts}
+    return parts, by_code
+
+def measure(build, csv_content):
+    gc.collect()
+    tracemalloc.start()
+    result = build(csv_content)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parts", type=int, default=50000)
+    args = parser.parse_args()
+
+    csv_content = synthetic_catalogue_csv(args.parts)
+    rows = [
+        ("list of dicts + code index", parse_as_dicts),
+        ("CatalogueStore", parse_csv_content),
+    ]
+    print(f"{args.parts} parts, {len(csv_content) / 1024:.0f} KiB of CSV")
+    print(f"{'representation':<28} {'retained':>12} {'per part':>10} {'peak':>12}")
+    for name, build in rows:
+        current, peak = measure(build, csv_content)
+        print(f"{name:<28} {current / 1024:>10.0f} K {current / args.parts:>8.0f} B {peak / 1024:>10.0f} K")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Local stand-in for raw.githubusercontent.com and the GitHub contents API.
+
+The benchmarks serve their synthetic catalogue from it and the tests drive
+GitHubClient against it. Run it for development with
+
+    python -m benchmarks.fake_github --port 8765 --csv parts.csv
+
+and point GITHUB_API_URL and GITHUB_RAW_URL at it.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+log = logging.getLogger("benchmarks.fake_github")
+
+def git_blob_sha(content: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+class FakeGitHubServer(ThreadingHTTPServer):
+    """Local stand-in for raw.githubusercontent.com and the contents API.
+
+    Serves `files` ({path: text}) for `repo`, answers conditional raw GETs
+    with 304, and accepts contents PUTs only when the SHA matches (409
+    otherwise), like the real API. `fail_next()` queues error responses for
+    the next requests, and every request is logged to `requests` as
+    (method, path, headers).
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 8765), files=None, repo="tomward0606/PartsProjectMain", latency=0.0):
+        self.files = {path: text.encode("utf-8") for path, text in (files or {}).items()}
+        self.repo = repo
+        self.commits = []
+        self.requests = []
+        self.failures = []
+        self.latency = latency
+        self.lock = threading.Lock()
+        super().__init__(address, FakeGitHubHandler)
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="fake-github", daemon=True)
+        thread.start()
+        return thread
+
+    def fail_next(self, *statuses, headers=None):
+        """Answer the next len(statuses) requests with these statuses instead of serving them"""
+        with self.lock:
+            self.failures.extend((status, headers or {}) for status in statuses)
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        log.debug("fake-github: " + format, *args)
+
+    def send_body(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("X-RateLimit-Remaining", "4999")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, payload, headers=None):
+        self.send_body(status, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json", **(headers or {})})
+
+    def route(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = urlsplit(self.path).path.lstrip("/")
+        contents_prefix = f"repos/{self.server.repo}/contents/"
+        raw_prefix = f"{self.server.repo}/main/"
+        if path.startswith(contents_prefix):
+            return "contents", path[len(contents_prefix):]
+        if path.startswith(raw_prefix):
+            return "raw", path[len(raw_prefix):]
+        return None, None
+
+    def injected_failure(self):
+        """Log the request and send a queued failure; returns True when one was sent"""
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, dict(self.headers)))
+            failure = self.server.failures.pop(0) if self.server.failures else None
+        if failure is None:
+            return False
+        status, headers = failure
+        self.send_json(status, {"message": "Injected failure"}, headers)
+        return True
+
+    def do_GET(self):
+        kind, file_path = self.route()
+        if self.injected_failure():
+            return
+        with self.server.lock:
+            content = self.server.files.get(file_path)
+        if kind is None or content is None:
+            return self.send_json(404, {"message": "Not Found"})
+        sha = git_blob_sha(content)
+        if kind == "raw":
+            etag = f'"{sha}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self.send_body(304, headers={"ETag": etag})
+            return self.send_body(200, content, {"ETag": etag, "Content-Type": "text/plain; charset=utf-8"})
+        return self.send_json(200, {
+            "path": file_path, "sha": sha, "encoding": "base64",
+            "content": base64.b64encode(content).decode("ascii"),
+        })
+
+    def do_PUT(self):
+        kind, file_path = self.route()
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.injected_failure():
+            return
+        if kind != "contents":
+            return self.send_json(404, {"message": "Not Found"})
+        with self.server.lock:
+            current = self.server.files.get(file_path)
+            if current is not None and payload.get("sha") != git_blob_sha(current):
+                return self.send_json(409, {"message": f"{file_path} does not match {payload.get('sha')}"})
+            content = base64.b64decode(payload.get("content", ""))
+            self.server.files[file_path] = content
+            self.server.commits.append(payload.get("message", ""))
+        self.send_json(200, {"content": {"path": file_path, "sha": git_blob_sha(content)}})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.fake_github", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8765, type=int)
+    parser.add_argument("--repo", default=os.environ.get("GITHUB_REPO", "tomward0606/PartsProjectMain"))
+    parser.add_argument("--csv", help="File to serve as the parts CSV")
+    parser.add_argument("--csv-path", default=os.environ.get("CSV_FILE_PATH", "parts.csv"),
+                        help="Repository path to serve it under (CSV_FILE_PATH)")
+    args = parser.parse_args(argv)
+
+    files = {}
+    if args.csv:
+        with open(args.csv, encoding="utf-8") as f:
+            files[args.csv_path] = f.read()
+    server = FakeGitHubServer((args.host, args.port), files, repo=args.repo)
+    print(f"Fake GitHub on {server.base_url}; set GITHUB_API_URL and GITHUB_RAW_URL to this address", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Synthetic data for the benchmarks: a seeded database and a catalogue CSV"""
+
+import csv
+import io
+import random
+from datetime import datetime, timedelta
+
+# Volumes at --scale 1
+FULL_SCALE = {"engineers": 500, "order_lines": 1_000_000, "dispatch_notes": 200_000}
+LINES_PER_ORDER = 8
+ITEMS_PER_DISPATCH = 3
+# Share of order lines that are still (at least partly) outstanding
+OUTSTANDING_SHARE = 0.04
+CHUNK = 10_000
+
+CATEGORIES = ["Filters", "Pumps", "Valves", "Boards", "Seals", "Motors", "Sensors", "Hoses"]
+MAKES = ["Nuaire", "Vent-Axia", "Daikin", "Mitsubishi", "Toshiba", "Panasonic"]
+MANUFACTURERS = ["Acme Ltd", "Globex", "Initech", "Umbrella", "Hooli"]
+PICKERS = ["Tom", "Sam", "Alex", "Jordan"]
+
+def product_code(i):
+    return f"{i // 10000:02d}-{i // 100 % 100:02d}-{i % 100:03d}"
+
+def synthetic_catalogue_csv(n, seed=1):
+    """A catalogue CSV of n parts in the GitHub file's format, sorted by product code"""
+    from app import CSV_FIELDNAMES
+
+    rng = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(CSV_FIELDNAMES)
+    for i in range(n):
+        writer.writerow([
+            product_code(i),
+            f"Replacement part {i} for unit {rng.randint(100, 999)}",
+            rng.choice(CATEGORIES),
+            rng.choice(MAKES),
+            rng.choice(MANUFACTURERS),
+            f"{i}.jpg" if rng.random() < 0.7 else "",
+        ])
+    return out.getvalue()
+
+def engineer_email(i):
+    return f"engineer{i:04d}@example.com"
+
+def scaled_volumes(scale):
+    return {name: max(1, int(count * scale)) for name, count in FULL_SCALE.items()}
+
+def _insert_chunked(conn, table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= CHUNK:
+            conn.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(table.insert(), batch)
+
+def seed_database(scale, catalogue_parts, seed=1, echo=print):
+    """Drop and recreate every table, then fill them at the given scale.
+
+    Must be called inside an app context. Returns the volumes written.
+    """
+    from app import (
+        DispatchItem, DispatchNote, PartsOrder, PartsOrderItem, db,
+        rebuild_engineer_summaries, run_migrations,
+    )
+
+    rng = random.Random(seed)
+    volumes = scaled_volumes(scale)
+    engineers = volumes["engineers"]
+    order_lines = volumes["order_lines"]
+    orders = max(1, order_lines // LINES_PER_ORDER)
+    notes = volumes["dispatch_notes"]
+    now = datetime.utcnow()
+    span = timedelta(days=730).total_seconds()
+
+    def past():
+        return now - timedelta(seconds=rng.random() * span)
+
+    db.drop_all()
+    run_migrations(echo=lambda msg: None)
+
+    with db.engine.begin() as conn:
+        echo(f"Seeding {orders} orders for {engineers} engineers")
+        _insert_chunked(conn, PartsOrder.__table__, (
+            {"id": i + 1, "email": engineer_email(i % engineers), "date": past(), "status": "open"}
+            for i in range(orders)
+        ))
+
+        echo(f"Seeding {order_lines} order lines")
+
+        def order_line(i):
+            quantity = rng.randint(1, 6)
+            outstanding = rng.random() < OUTSTANDING_SHARE
+            sent = rng.randint(0, quantity - 1) if outstanding else quantity
+            code = rng.randrange(catalogue_parts)
+            return {
+                "id": i + 1, "order_id": i // LINES_PER_ORDER + 1,
+                "part_number": product_code(code), "description": f"Replacement part {code}",
+                "quantity": quantity, "quantity_sent": sent,
+                "back_order": outstanding and rng.random() < 0.2,
+            }
+        _insert_chunked(conn, PartsOrderItem.__table__, (order_line(i) for i in range(order_lines)))
+
+        echo(f"Seeding {notes} dispatch notes")
+        _insert_chunked(conn, DispatchNote.__table__, (
+            {"id": i + 1, "engineer_email": engineer_email(rng.randrange(engineers)),
+             "date": past(), "picker_name": rng.choice(PICKERS)}
+            for i in range(notes)
+        ))
+
+        def dispatch_item(i):
+            code = rng.randrange(catalogue_parts)
+            return {
+                "id": i + 1, "dispatch_note_id": i // ITEMS_PER_DISPATCH + 1,
+                "part_number": product_code(code), "description": f"Replacement part {code}",
+                "quantity_sent": rng.randint(1, 4),
+            }
+        _insert_chunked(conn, DispatchItem.__table__, (dispatch_item(i) for i in range(notes * ITEMS_PER_DISPATCH)))
+
+    if db.engine.dialect.name == "postgresql":
+        # Explicit ids leave the sequences behind; new rows must not collide with them
+        with db.engine.begin() as conn:
+            for table in ("parts_order", "parts_order_item", "dispatch_note", "dispatch_item"):
+                conn.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                ))
+    with db.engine.begin() as conn:
+        conn.execute(db.text("ANALYZE"))
+
+    echo("Building engineer summaries")
+    rebuild_engineer_summaries()
+    db.session.commit()
+    return dict(volumes, orders=orders, dispatch_items=notes * ITEMS_PER_DISPATCH)
@@ -0,0 +1,85 @@
+import os
+import socket
+import sys
+import tempfile
+
+# The app reads its configuration at import time
+_db_dir = tempfile.mkdtemp(prefix="stock-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["MAIL_OUTBOX_RUN_IN_APP"] = "False"
+os.environ["MAIL_ENABLED"] = "True"
+os.environ["MAIL_USE_TLS"] = "False"
+os.environ["MAIL_SERVER"] = "127.0.0.1"
+os.environ["SERVER_TIMING_ENABLED"] = "False"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import app as stock
+from benchmarks.fake_github import FakeGitHubServer
+from tests.fakes import SMTPSink
+
+
+@pytest.fixture
+def app():
+    with stock.app.app_context():
+        stock.db.drop_all()
+        stock.run_migrations(echo=lambda message: None)
+        yield stock.app
+        stock.db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def seed_order(app):
+    """Create an order for `email` with one line per (part_number, quantity); returns the line ids"""
+    def create(email, lines):
+        order = stock.PartsOrder(email=email)
+        for part_number, quantity in lines:
+            order.items.append(stock.PartsOrderItem(
+                part_number=part_number, description=f"{part_number} description",
+                quantity=quantity, quantity_sent=0,
+            ))
+        stock.db.session.add(order)
+        stock.db.session.commit()
+        return [item.id for item in order.items]
+    return create
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_sink(app, monkeypatch):
+    sink = SMTPSink(("127.0.0.1", 0))
+    sink.start()
+    monkeypatch.setattr(app.extensions["mail"], "port", sink.port)
+    yield sink
+    sink.shutdown()
+    sink.server_close()
+
+
+PARTS_CSV = "Product Code,Description,Category,Make,Manufacturer,image\nP1,Widget,Widgets,Acme,Acme,\n"
+
+
+@pytest.fixture
+def fake_github(monkeypatch):
+    """A FakeGitHubServer serving PARTS_CSV, with the shared client pointed at it and backoff disabled"""
+    server = FakeGitHubServer(("127.0.0.1", 0), {stock.CSV_FILE_PATH: PARTS_CSV}, repo=stock.GITHUB_REPO)
+    server.start()
+    monkeypatch.setattr(stock.github, "api_url", server.base_url)
+    monkeypatch.setattr(stock.github, "raw_url", server.base_url)
+    monkeypatch.setattr(stock.github, "backoff_base", 0)
+    monkeypatch.setattr(stock.github, "_metrics", {})
+    monkeypatch.setattr(stock, "GITHUB_TOKEN", "test-token")
+    yield server
+    server.shutdown()
+    server.server_close()
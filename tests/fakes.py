@@ -0,0 +1,110 @@
+"""Local stand-ins for the services the stock system talks to.
+
+Used by the tests, and runnable for development:
+
+    python -m tests.fakes smtp --port 1025
+
+then point MAIL_SERVER/MAIL_PORT at it with MAIL_USE_TLS=False and
+MAIL_ENABLED=True. The fake GitHub is shared with the benchmarks and lives
+in benchmarks/fake_github.py.
+"""
+import argparse
+import socketserver
+import threading
+
+
+# ── SMTP Sink ─────────────────────────────────────────────────────────────────
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server that accepts every message and keeps it in memory.
+
+    Received messages are appended to `messages` as dicts with mail_from,
+    rcpt_to and data. Bind to port 0 and read `port` for a free port.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 1025), on_message=None):
+        self.messages = []
+        self.on_message = on_message
+        super().__init__(address, SMTPSinkHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True)
+        thread.start()
+        return thread
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        mail_from, rcpt_to = None, []
+        self.reply("220 smtp-sink ready")
+        for raw in self.rfile:
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            verb = line.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-smtp-sink")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 smtp-sink")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = line.split(":", 1)[-1].strip(), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_to.append(line.split(":", 1)[-1].strip())
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in self.rfile:
+                    data_line = data_line.decode("utf-8", "replace").rstrip("\r\n")
+                    if data_line == ".":
+                        break
+                    data.append(data_line[1:] if data_line.startswith("..") else data_line)
+                message = {"mail_from": mail_from, "rcpt_to": rcpt_to, "data": "\n".join(data)}
+                self.server.messages.append(message)
+                if self.server.on_message:
+                    self.server.on_message(message)
+                self.reply("250 OK: queued")
+            elif verb in ("RSET", "NOOP"):
+                if verb == "RSET":
+                    mail_from, rcpt_to = None, []
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+# ── Command Line ──────────────────────────────────────────────────────────────
+
+def run_smtp_sink(args):
+    def show(message):
+        print(f"--- message from {message['mail_from']} to {', '.join(message['rcpt_to'])} ---")
+        print(message["data"], flush=True)
+    sink = SMTPSink((args.host, args.port), on_message=show)
+    print(f"SMTP sink listening on {args.host}:{sink.port}", flush=True)
+    sink.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tests.fakes", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    smtp = commands.add_parser("smtp", help="Run an SMTP sink that prints every message it receives")
+    smtp.add_argument("--host", default="127.0.0.1")
+    smtp.add_argument("--port", default=1025, type=int)
+    smtp.set_defaults(run=run_smtp_sink)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
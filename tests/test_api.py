@@ -0,0 +1,128 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as stock
+
+
+def get_json(client, url, **headers):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.data
+    return response.get_json()
+
+
+def add_dispatch(email, date, lines=(("P1", 1),)):
+    note = stock.DispatchNote(engineer_email=email, date=date)
+    for part_number, qty in lines:
+        note.items.append(stock.DispatchItem(part_number=part_number, quantity_sent=qty, description=part_number))
+    stock.db.session.add(note)
+    stock.db.session.commit()
+    return note.id
+
+
+def test_orders_page_with_cursor(client, seed_order):
+    for i in range(5):
+        seed_order(f"e{i}@example.com", [("P1", 1)])
+
+    first = get_json(client, "/api/v1/orders?limit=2")
+    assert [o["email"] for o in first["data"]] == ["e4@example.com", "e3@example.com"]
+    second = get_json(client, f"/api/v1/orders?limit=2&cursor={first['next_cursor']}")
+    assert [o["email"] for o in second["data"]] == ["e2@example.com", "e1@example.com"]
+    last = get_json(client, f"/api/v1/orders?limit=2&cursor={second['next_cursor']}")
+    assert [o["email"] for o in last["data"]] == ["e0@example.com"]
+    assert last["next_cursor"] is None
+
+
+def test_order_items_filter_and_cursor(client, seed_order):
+    ids = seed_order("a@example.com", [("P1", 2), ("P2", 3), ("P3", 1)])
+    seed_order("b@example.com", [("P4", 1)])
+    stock.db.session.get(stock.PartsOrderItem, ids[1]).quantity_sent = 3
+    stock.db.session.commit()
+
+    page = get_json(client, "/api/v1/order_items?engineer=a@example.com&outstanding=true&limit=1")
+    assert [i["part_number"] for i in page["data"]] == ["P1"]
+    page = get_json(client, f"/api/v1/order_items?engineer=a@example.com&outstanding=true&limit=1&cursor={page['next_cursor']}")
+    assert [i["part_number"] for i in page["data"]] == ["P3"]
+    assert page["next_cursor"] is None
+
+    assert client.get("/api/v1/order_items?cursor=abc").status_code == 400
+
+
+def test_fields_selects_and_validates(client, seed_order):
+    seed_order("a@example.com", [("P1", 2)])
+
+    order = get_json(client, "/api/v1/orders")["data"][0]
+    assert "items" not in order
+    order = get_json(client, "/api/v1/orders?fields=id,items")["data"][0]
+    assert set(order) == {"id", "items"}
+    assert [i["part_number"] for i in order["items"]] == ["P1"]
+
+    response = client.get("/api/v1/orders?fields=id,secret")
+    assert response.status_code == 400
+    assert "secret" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("url", ["/api/v1/orders?fields=id,items", "/api/v1/order_items"])
+def test_unchanged_page_is_304_without_loading_rows(client, seed_order, monkeypatch, url):
+    ids = seed_order("a@example.com", [("P1", 2)])
+    response = client.get(url)
+    etag = response.headers["ETag"]
+    assert etag.startswith("W/")
+
+    def fail(*args):
+        raise AssertionError("rows were serialised for a 304")
+    monkeypatch.setattr(stock, "serialize_order_item", fail)
+    monkeypatch.setattr(stock, "serialize_order", fail)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    monkeypatch.undo()
+
+    stock.db.session.get(stock.PartsOrderItem, ids[0]).quantity_sent = 1
+    stock.db.session.commit()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_new_order_changes_the_orders_etag(client, seed_order):
+    seed_order("a@example.com", [("P1", 2)])
+    etag = client.get("/api/v1/orders").headers["ETag"]
+    seed_order("b@example.com", [("P1", 2)])
+    response = client.get("/api/v1/orders", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.get_json()["data"]) == 2
+
+
+def test_dispatches_page_and_304(client, app):
+    now = datetime.utcnow()
+    for days in range(3):
+        add_dispatch("a@example.com", now - timedelta(days=days))
+
+    first = client.get("/api/v1/dispatches?limit=2&fields=id,items")
+    body = first.get_json()
+    assert len(body["data"]) == 2 and body["data"][0]["items"][0]["part_number"] == "P1"
+    rest = get_json(client, f"/api/v1/dispatches?limit=2&cursor={body['next_cursor']}")
+    assert len(rest["data"]) == 1 and rest["next_cursor"] is None
+
+    again = client.get("/api/v1/dispatches?limit=2&fields=id,items", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    add_dispatch("a@example.com", now + timedelta(minutes=1))
+    changed = client.get("/api/v1/dispatches?limit=2&fields=id,items", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200
+
+
+def test_large_bodies_are_gzipped(client, seed_order, monkeypatch):
+    monkeypatch.setattr(stock, "API_GZIP_MIN_BYTES", 10)
+    seed_order("a@example.com", [("P1", 2)])
+
+    response = client.get("/api/v1/order_items", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.data))["data"][0]["part_number"] == "P1"
+
+    plain = client.get("/api/v1/order_items")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.get_json()["data"][0]["part_number"] == "P1"
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as stock
+
+
+@pytest.mark.parametrize("status, archived", [
+    ("pending", False),
+    ("sending", False),
+    ("failed", False),
+    ("sent", True),
+])
+def test_dispatch_note_is_archived_only_once_its_email_is_sent(app, status, archived):
+    old = datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS + 1)
+    note = stock.DispatchNote(engineer_email="a@example.com", date=old)
+    stock.db.session.add_all([
+        note,
+        stock.EmailOutbox(recipient="a@example.com", dispatch_note=note, status=status),
+        # The newest note is never archived
+        stock.DispatchNote(engineer_email="a@example.com", date=old),
+    ])
+    stock.db.session.commit()
+    note_id = note.id
+
+    moved = stock.archive_dispatch_notes(datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS))
+
+    assert moved == int(archived)
+    assert (stock.db.session.get(stock.DispatchNote, note_id) is None) == archived
+    outbox = stock.db.session.query(stock.EmailOutbox).one()
+    assert outbox.dispatch_note_id == (None if archived else note_id)
+
+
+def test_newest_note_is_kept_so_sqlite_cannot_reuse_its_id(app):
+    old = datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS + 1)
+    stock.db.session.add_all([stock.DispatchNote(engineer_email="a@example.com", date=old) for _ in range(3)])
+    stock.db.session.commit()
+
+    assert stock.archive_dispatch_notes(datetime.utcnow()) == 2
+    newest = stock.db.session.query(stock.DispatchNote).one()
+    stock.db.session.add(stock.DispatchNote(engineer_email="a@example.com"))
+    stock.db.session.commit()
+
+    archived_ids = {note.id for note in stock.db.session.query(stock.DispatchNoteArchive)}
+    live_ids = {note.id for note in stock.db.session.query(stock.DispatchNote)}
+    assert newest.id in live_ids
+    assert not archived_ids & live_ids
+
+
+def test_nothing_is_held_back_on_databases_with_sequences(app, monkeypatch):
+    stock.db.session.add(stock.DispatchNote(engineer_email="a@example.com"))
+    stock.db.session.commit()
+    monkeypatch.setattr(stock.db.session.get_bind().dialect, "name", "postgresql")
+    assert stock.newest_parent_ids(stock.DispatchNote, stock.DispatchItem, stock.DispatchItem.dispatch_note_id) == set()
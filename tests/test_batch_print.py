@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import app as stock
+
+PRINT_URL = "/admin/dispatch_notes/print"
+
+
+@contextmanager
+def counted_queries():
+    count = [0]
+
+    def before_cursor_execute(*args):
+        count[0] += 1
+
+    event.listen(stock.db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield count
+    finally:
+        event.remove(stock.db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def add_notes(count, day=datetime(2024, 3, 1), email="eng@example.com"):
+    """Notes recorded before dispatch documents existed, an hour apart; returns their ids"""
+    notes = []
+    for i in range(count):
+        note = stock.DispatchNote(engineer_email=email, date=day + timedelta(hours=i), picker_name="Tom")
+        note.items.append(stock.DispatchItem(part_number=f"P{i}", description=f"Part {i}", quantity_sent=1))
+        notes.append(note)
+    stock.db.session.add_all(notes)
+    stock.db.session.commit()
+    return [note.id for note in notes]
+
+
+def printed_ids(page):
+    return [int(chunk.split("<", 1)[0]) for chunk in page.split("Dispatch Note #")[1:]]
+
+
+def test_selected_notes_print_oldest_first_with_back_orders(client, seed_order):
+    ids = add_notes(3)
+    item_id = seed_order("eng@example.com", [("BO1", 2)])[0]
+    stock.dispatch_items("eng@example.com", "Tom", {f"send_{item_id}": "0", f"back_order_{item_id}": "on"})
+
+    response = client.get(f"{PRINT_URL}?ids={ids[2]},{ids[0]}")
+
+    assert response.is_streamed
+    page = response.get_data(as_text=True)
+    assert "<title>Dispatch Notes (2)</title>" in page
+    assert printed_ids(page) == [ids[0], ids[2]]
+    assert page.count("BO1 description") == 2
+
+
+def test_date_range_selects_notes(client):
+    ids = add_notes(3)
+    add_notes(1, email="other@example.com")
+
+    page = client.get(f"{PRINT_URL}?date_from=2024-03-01&date_to=2024-03-01&engineer=eng@example.com").get_data(as_text=True)
+
+    assert printed_ids(page) == ids
+
+
+def test_queries_do_not_grow_with_the_number_of_notes(app, client):
+    few = add_notes(2)
+    with counted_queries() as small:
+        client.get(f"{PRINT_URL}?ids={','.join(map(str, few))}").get_data()
+
+    many = add_notes(20, day=datetime(2024, 4, 1))
+    with counted_queries() as large:
+        page = client.get(f"{PRINT_URL}?ids={','.join(map(str, many))}").get_data(as_text=True)
+
+    assert printed_ids(page) == many
+    assert large[0] == small[0]
+    # Rendered in that batch and stored, so the next print just reads them
+    assert stock.DispatchDocument.query.count() == 22
+
+
+def test_archived_notes_print_first(client):
+    old = datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS + 1)
+    archived = add_notes(2, day=old)
+    for note_id in archived:
+        stock.get_dispatch_document(note_id)
+    live = add_notes(1, day=datetime.utcnow())
+    assert stock.archive_dispatch_notes(datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS)) == 2
+
+    by_ids = client.get(f"{PRINT_URL}?ids={','.join(map(str, archived + live))}").get_data(as_text=True)
+    by_range = client.get(f"{PRINT_URL}?date_from={old:%Y-%m-%d}&include_archived=1").get_data(as_text=True)
+
+    assert printed_ids(by_ids) == archived + live
+    assert printed_ids(by_range) == archived + live
+
+
+def test_bad_selections_go_back_to_the_history_page(client, monkeypatch):
+    add_notes(3)
+
+    for url, message in [
+        (f"{PRINT_URL}?ids=1,x", "Invalid dispatch note ids."),
+        (PRINT_URL, "Choose a date range or dispatch notes to print."),
+    ]:
+        response = client.get(url, follow_redirects=True)
+        assert response.request.path == "/admin/dispatched_orders"
+        assert message in response.get_data(as_text=True)
+
+    monkeypatch.setattr(stock, "BATCH_PRINT_MAX_NOTES", 2)
+    response = client.get(f"{PRINT_URL}?date_from=2024-03-01", follow_redirects=True)
+    assert "More than 2 dispatch notes selected" in response.get_data(as_text=True)
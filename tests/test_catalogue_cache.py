@@ -0,0 +1,63 @@
+import app as stock
+from tests.conftest import PARTS_CSV
+
+
+def test_empty_mirror_is_not_filled_from_a_request(app, fake_github):
+    stock.catalogue_cache.invalidate()
+    assert stock.catalogue_cache.get_parts() is None
+    assert fake_github.requests == []
+
+    assert stock.sync_catalogue_mirror()
+    assert [p.product_code for p in stock.catalogue_cache.get_parts()] == ["P1"]
+    assert len(fake_github.requests) == 1
+
+
+def test_reads_within_the_ttl_are_served_from_memory(app):
+    stock.apply_catalogue_snapshot(PARTS_CSV)
+    cache = stock.CatalogueCache(ttl=60)
+
+    first = cache.get_parts()
+    assert cache.get_parts() is first
+
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["revalidations"]) == (1, 1, 0)
+    assert stats["version"] == stock.get_app_state("catalogue_sha")
+
+
+def test_lapsed_entry_is_kept_while_the_mirror_is_unchanged(app):
+    stock.apply_catalogue_snapshot(PARTS_CSV)
+    cache = stock.CatalogueCache(ttl=0)
+
+    first = cache.get_parts()
+    assert cache.get_parts() is first
+    assert cache.get_csv() is cache.get_csv()
+    assert cache.get_index() is cache.get_index()
+
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["revalidations"] >= 2
+
+
+def test_new_mirror_revision_is_loaded_once_the_ttl_lapses(app):
+    stock.apply_catalogue_snapshot(PARTS_CSV)
+    cache = stock.CatalogueCache(ttl=0)
+    old_index = cache.get_index()
+
+    stock.apply_catalogue_snapshot(PARTS_CSV + "P2,Gadget,Gadgets,Acme,Acme,\n")
+
+    assert [p.product_code for p in cache.get_parts()] == ["P1", "P2"]
+    assert "P2,Gadget" in cache.get_csv()
+    assert cache.get_index() is not old_index
+    assert cache.stats()["misses"] == 2
+
+
+def test_sync_revalidates_with_the_stored_etag(app, fake_github):
+    assert stock.sync_catalogue_mirror()
+    etag = stock.get_app_state("catalogue_etag")
+    assert etag
+
+    assert not stock.sync_catalogue_mirror()
+
+    method, _, headers = fake_github.requests[-1]
+    assert method == "GET" and headers.get("If-None-Match") == etag
+    assert stock.CataloguePart.query.count() == 1
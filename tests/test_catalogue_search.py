@@ -0,0 +1,73 @@
+import pytest
+
+import app as stock
+
+PARTS = [
+    ("FLT-100", "Oil filter", "Filters", "Acme", "Acme Corp", ""),
+    ("FLT-200", "Air filter", "Filters", "Acme", "Bolt Ltd", ""),
+    ("VLV-10", "Check valve", "Valves", "Zeta", "Zeta", ""),
+    ("VLV-20", "Ball valve 1/2\"", "Valves", "Zeta", "Acme Corp", ""),
+    ("GSK-1", "Gasket", "", "", "", ""),
+]
+
+
+def naive_search(store, query, category):
+    """The substring filter the index replaces"""
+    query, category = query.lower(), category.lower()
+    return [
+        p.product_code for p in store
+        if (not query or any(query in p[f].lower() for f in stock.CatalogueSearchIndex.SEARCH_FIELDS))
+        and (not category or category in p.category.lower())
+    ]
+
+
+@pytest.fixture
+def store():
+    return stock.CatalogueStore.from_rows(sorted(PARTS))
+
+
+@pytest.mark.parametrize("query, category", [
+    ("", ""),
+    ("f", ""),
+    ("lt", ""),
+    ("filter", ""),
+    ("FILTER", ""),
+    ("acme corp", ""),
+    ("valve 1/2", ""),
+    ("-", ""),
+    ("nothing", ""),
+    ("", "valv"),
+    ("", "FILTERS"),
+    ("acme", "valves"),
+    ("zz", "filters"),
+])
+def test_index_matches_the_substring_filter(store, query, category):
+    index = stock.CatalogueSearchIndex(store)
+
+    assert [p.product_code for p in index.search(query, category)] == naive_search(store, query, category)
+
+
+def test_matches_do_not_span_two_fields(store):
+    index = stock.CatalogueSearchIndex(store)
+
+    # Each haystack is code, description, make and manufacturer joined by a separator
+    assert index.search("filteracme") == []
+    assert index.search("10oil") == []
+
+
+def test_deleted_parts_are_not_indexed(store):
+    store.delete("FLT-100")
+    index = stock.CatalogueSearchIndex(store)
+
+    assert [p.product_code for p in index.search("filter")] == ["FLT-200"]
+    assert [p.product_code for p in index.search("", "filters")] == ["FLT-200"]
+    assert index.categories == ["Filters", "Valves"]
+
+
+def test_results_are_views_of_the_store(store):
+    index = stock.CatalogueSearchIndex(store)
+
+    [part] = index.search("check")
+
+    assert part == store.get("VLV-10")
+    assert part.to_dict()["manufacturer"] == "Zeta"
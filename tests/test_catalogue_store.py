@@ -0,0 +1,117 @@
+import pytest
+
+import app as stock
+
+
+def part(code, description=""):
+    return (code, description, "Widgets", "Acme", "Acme", "")
+
+
+def test_round_trip_keeps_codes_sorted():
+    store = stock.CatalogueStore.from_rows([part("B"), part("D")])
+    store.append(part("C", "middle"))
+    store.append(part("A"))
+
+    assert [p.product_code for p in store] == ["A", "B", "C", "D"]
+    assert store.get("C").description == "middle"
+    assert store[2].product_code == "C"
+    assert "C" in store and len(store) == 4
+
+    assert store.delete("C")
+    assert not store.delete("C")
+    assert store.get("C") is None and "C" not in store
+    assert [row[0] for row in store.tuples()] == ["A", "B", "D"]
+
+    store.append(part("C", "back again"))
+    assert store.get("C").description == "back again"
+    assert [p.product_code for p in store] == ["A", "B", "C", "D"]
+
+
+def test_duplicate_code_is_rejected():
+    store = stock.CatalogueStore.from_rows([part("A")])
+    with pytest.raises(KeyError):
+        store.append(part("A"))
+
+
+def test_set_updates_in_place():
+    store = stock.CatalogueStore.from_rows([part("A")])
+    store.get("A")["description"] = "changed"
+    assert store.get("A").to_dict()["description"] == "changed"
+    with pytest.raises(KeyError):
+        store.get("A")["product_code"] = "B"
+
+
+def test_delete_and_re_add_cycles_do_not_grow_the_columns():
+    store = stock.CatalogueStore.from_rows([part(f"P{i:03}") for i in range(10)])
+    for cycle in range(50):
+        for i in range(10):
+            store.delete(f"P{i:03}")
+            store.append(part(f"P{i:03}", f"cycle {cycle}"))
+
+    assert len(store.columns["product_code"]) <= 10 + max(store.COMPACT_MIN_TOMBSTONES, 10) + 1
+    assert [p.description for p in store] == ["cycle 49"] * 10
+    assert [p.product_code for p in store] == [f"P{i:03}" for i in range(10)]
+
+
+def test_compact_keeps_lookups_and_order():
+    store = stock.CatalogueStore.from_rows([part(f"P{i:03}", str(i)) for i in range(200)])
+    for i in range(0, 200, 2):
+        store.delete(f"P{i:03}")
+    store.compact()
+
+    assert store.tombstones == 0
+    assert len(store.columns["description"]) == 100
+    assert [p.product_code for p in store] == [f"P{i:03}" for i in range(1, 200, 2)]
+    assert store.get("P151").description == "151"
+
+
+def test_repeated_values_share_one_string():
+    rows = [part(f"P{i}") for i in range(3)]
+    # Distinct but equal string objects, as the CSV reader hands them over
+    rows = [(code, desc, "".join(["Wid", "gets"]), "".join(["Ac", "me"]), "Acme", img) for code, desc, _, _, _, img in rows]
+    store = stock.CatalogueStore.from_rows(rows)
+
+    categories = store.columns["category"]
+    assert categories[0] is categories[1] is categories[2]
+    assert store.columns["make"][0] is store.columns["make"][2]
+    store.get("P1")["category"] = "".join(["Wid", "gets"])
+    assert store.columns["category"][1] is categories[0]
+
+
+def test_part_row_reads_like_the_old_dicts():
+    store = stock.CatalogueStore.from_rows([("A", None, "Widgets", "Acme", "Acme", "a.png")])
+    row = store.get("A")
+
+    assert row.description == "" and row["image"] == "a.png"
+    assert row.get("missing", "default") == "default"
+    assert row == {"product_code": "A", "description": "", "category": "Widgets",
+                   "make": "Acme", "manufacturer": "Acme", "image": "a.png"}
+    assert dict(row) == row.to_dict()
+    assert row == store[0] and {row, store.get("A")} == {row}
+
+
+def test_csv_round_trip_keeps_every_field():
+    csv_content = (
+        "Product Code,Description,Category,Make,Manufacturer,image\n"
+        "B2,\"Bolt, M6\",Fixings,Acme,Acme,b.png\n"
+        "A1,Anchor,Fixings,Zeta,Zeta Ltd,\n"
+        "A1,Duplicate,Fixings,Zeta,Zeta Ltd,\n"
+    )
+    store = stock.parse_csv_content(csv_content)
+
+    assert list(store.tuples()) == [
+        ("A1", "Anchor", "Fixings", "Zeta", "Zeta Ltd", ""),
+        ("B2", "Bolt, M6", "Fixings", "Acme", "Acme", "b.png"),
+    ]
+    assert list(stock.parse_csv_content(stock.serialize_parts_csv(store)).tuples()) == list(store.tuples())
+
+
+def test_mirror_loads_into_a_store(app):
+    stock.apply_catalogue_snapshot(
+        "Product Code,Description,Category,Make,Manufacturer,image\nP2,Gadget,Gadgets,Acme,Acme,\nP1,Widget,Widgets,Acme,Acme,\n"
+    )
+
+    store = stock.load_catalogue_mirror()
+
+    assert [row[:2] for row in store.tuples()] == [("P1", "Widget"), ("P2", "Gadget")]
+    assert store.columns["make"][0] is store.columns["make"][1]
@@ -0,0 +1,92 @@
+import app as stock
+from tests.conftest import PARTS_CSV
+
+
+def served_codes(fake_github):
+    store = stock.parse_csv_content(fake_github.files[stock.CSV_FILE_PATH].decode("utf-8"))
+    return {p.product_code: p.description for p in store}
+
+
+def test_operations_are_validated():
+    assert stock.normalize_catalogue_operation({"op": "ADD", "product_code": " P2 "}) == (
+        dict({"op": "add", "product_code": "P2"}, **dict.fromkeys(stock.CATALOGUE_FIELDS, "")), None)
+    assert stock.normalize_catalogue_operation({"op": "update", "product_code": "P1", "make": "Zeta"}) == (
+        {"op": "update", "product_code": "P1", "make": "Zeta"}, None)
+    assert stock.normalize_catalogue_operation({"op": "rename", "product_code": "P1"})[1] == "Unknown operation 'rename'"
+    assert stock.normalize_catalogue_operation({"op": "delete"})[1] == "Product code is required"
+    assert stock.normalize_catalogue_operation(["delete"])[1] == "Operation must be an object"
+
+
+def test_each_operation_succeeds_or_fails_on_its_own():
+    store = stock.parse_csv_content(PARTS_CSV)
+
+    results = stock.apply_catalogue_operations(store, [
+        {"op": "add", "product_code": "P0", "description": "First"},
+        {"op": "add", "product_code": "P1"},
+        {"op": "update", "product_code": "P9", "description": "Missing"},
+        {"op": "update", "product_code": "P1", "description": "Renamed"},
+        {"op": "delete", "product_code": "P0"},
+    ])
+
+    assert [r["success"] for r in results] == [True, False, False, True, True]
+    assert results[1]["message"] == "Part P1 already exists"
+    assert [(p.product_code, p.description) for p in store] == [("P1", "Renamed")]
+
+
+def test_buffered_edits_go_out_as_one_commit(app, fake_github):
+    buffer = stock.CatalogueWriteBuffer(app, window=60)
+    first = buffer.submit([{"op": "add", "product_code": "P2", "description": "Gadget"}], wait=False)
+    second = buffer.submit([
+        {"op": "update", "product_code": "P1", "description": "Sprocket"},
+        {"op": "delete", "product_code": "P9"},
+    ], wait=False)
+    assert buffer.pending_count() == 3
+
+    buffer.flush()
+
+    assert first.done.is_set() and second.done.is_set()
+    assert fake_github.commits == ["Batch catalogue update: 3 changes (1 add, 1 delete, 1 update)"]
+    assert served_codes(fake_github) == {"P1": "Sprocket", "P2": "Gadget"}
+    assert (first.success, [r["success"] for r in first.results]) == (True, [True])
+    assert (second.success, [r["success"] for r in second.results]) == (True, [True, False])
+    # The mirror follows the write without waiting for the sync job
+    assert {p.product_code for p in stock.CataloguePart.query} == {"P1", "P2"}
+
+
+def test_submitter_whose_operations_all_fail_is_told_so(app, fake_github):
+    buffer = stock.CatalogueWriteBuffer(app, window=60)
+    good = buffer.submit([{"op": "add", "product_code": "P2"}], wait=False)
+    bad = buffer.submit([{"op": "delete", "product_code": "P9"}], wait=False)
+
+    buffer.flush()
+
+    assert good.success and not bad.success
+    assert bad.message == "Part 'P9' not found in 2 parts"
+    assert len(fake_github.commits) == 1
+
+
+def test_sha_conflict_is_rebased_and_retried(app, fake_github, monkeypatch):
+    put_github_csv = stock.put_github_csv
+    shas = []
+
+    def put_after_someone_else(csv_content, sha, message):
+        shas.append(sha)
+        if len(shas) == 1:
+            # Another commit lands between our read and our write
+            fake_github.files[stock.CSV_FILE_PATH] += b"P3,Other,Widgets,Acme,Acme,\n"
+        return put_github_csv(csv_content, sha, message)
+
+    monkeypatch.setattr(stock, "put_github_csv", put_after_someone_else)
+    success, message, results = stock.commit_catalogue_operations([{"op": "add", "product_code": "P2"}])
+
+    assert success, message
+    assert len(shas) == 2 and shas[0] != shas[1]
+    assert set(served_codes(fake_github)) == {"P1", "P2", "P3"}
+    assert len(fake_github.commits) == 1
+
+
+def test_batch_endpoint_rejects_invalid_operations(client):
+    response = client.post("/admin/catalogue/batch", json={"operations": [{"op": "add"}, {"op": "x", "product_code": "A"}]})
+
+    assert response.status_code == 400
+    assert [e["index"] for e in response.get_json()["errors"]] == [0, 1]
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+import app as stock
+
+
+def rollups():
+    """{model name: {(day, key): (qty_dispatched, dispatch_lines, qty_cancelled, back_orders_raised)}}"""
+    result = {}
+    for model, key in ((stock.DemandPartDaily, "part_number"), (stock.DemandEngineerDaily, "engineer_email")):
+        result[model.__name__] = {
+            (row.day, getattr(row, key)): tuple(getattr(row, m) for m in stock.DEMAND_MEASURES)
+            for row in model.query.all()
+        }
+    return result
+
+
+def test_dispatch_and_back_order_add_to_todays_rollups(app, seed_order):
+    first, second = seed_order("eng@example.com", [("P1", 3), ("P2", 2)])
+
+    stock.dispatch_items("eng@example.com", "Tom", {
+        f"send_{first}": "2", f"send_{second}": "0", f"back_order_{second}": "on",
+    })
+    stock.dispatch_items("eng@example.com", "Tom", {f"send_{first}": "1"})
+
+    today = datetime.utcnow().date()
+    assert rollups() == {
+        "DemandPartDaily": {
+            (today, "P1"): (3, 2, 0, 0),
+            (today, "P2"): (0, 0, 0, 1),
+        },
+        "DemandEngineerDaily": {
+            (today, "eng@example.com"): (3, 2, 0, 1),
+        },
+    }
+
+
+def test_rejected_dispatch_leaves_rollups_alone(app, seed_order):
+    item_id = seed_order("eng@example.com", [("P1", 1)])[0]
+
+    stock.dispatch_items("eng@example.com", "Tom", {f"send_{item_id}": "2"})
+
+    assert rollups() == {"DemandPartDaily": {}, "DemandEngineerDaily": {}}
+
+
+def test_cancelling_a_line_records_what_was_still_outstanding(client, seed_order):
+    item_id = seed_order("eng@example.com", [("P1", 5)])[0]
+    stock.dispatch_items("eng@example.com", "Tom", {f"send_{item_id}": "2"})
+
+    response = client.post(f"/admin/cancel_order_item/{item_id}")
+
+    assert response.status_code == 302
+    assert stock.db.session.get(stock.PartsOrderItem, item_id) is None
+    today = datetime.utcnow().date()
+    assert rollups()["DemandPartDaily"] == {(today, "P1"): (2, 1, 3, 0)}
+    assert rollups()["DemandEngineerDaily"] == {(today, "eng@example.com"): (2, 1, 3, 0)}
+
+
+def test_backfill_rebuilds_dispatch_figures_and_is_idempotent(app, seed_order):
+    first, second = seed_order("eng@example.com", [("P1", 3), ("P2", 2)])
+    stock.dispatch_items("eng@example.com", "Tom", {f"send_{first}": "2", f"send_{second}": "1"})
+    stock.record_demand([{"part_number": "P2", "engineer_email": "eng@example.com", "qty_cancelled": 1}])
+    # A note from an earlier day that was dispatched before rollups existed
+    earlier = datetime.utcnow() - timedelta(days=3)
+    note = stock.DispatchNote(engineer_email="old@example.com", date=earlier)
+    note.items.append(stock.DispatchItem(part_number="P1", quantity_sent=4))
+    stock.db.session.add(note)
+    stock.db.session.commit()
+    recorded = rollups()
+
+    assert stock.backfill_demand() == 5
+    once = rollups()
+    assert stock.backfill_demand() == 5
+    assert rollups() == once
+
+    today, day = datetime.utcnow().date(), earlier.date()
+    assert once["DemandPartDaily"] == {
+        **recorded["DemandPartDaily"],
+        (day, "P1"): (4, 1, 0, 0),
+    }
+    assert once["DemandEngineerDaily"] == {
+        (today, "eng@example.com"): (3, 2, 1, 0),
+        (day, "old@example.com"): (4, 1, 0, 0),
+    }
+
+
+def test_backfill_counts_archived_dispatches(app, seed_order):
+    old = datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS + 1)
+    for _ in range(2):
+        note = stock.DispatchNote(engineer_email="eng@example.com", date=old)
+        note.items.append(stock.DispatchItem(part_number="P1", quantity_sent=1))
+        stock.db.session.add(note)
+    stock.db.session.commit()
+    stock.backfill_demand()
+    before = rollups()
+
+    assert stock.archive_dispatch_notes(datetime.utcnow()) == 1
+    stock.backfill_demand()
+
+    assert rollups() == before
+    assert before["DemandPartDaily"] == {(old.date(), "P1"): (2, 2, 0, 0)}
+
+
+def test_backfill_since_leaves_earlier_days_alone(app):
+    earlier = datetime.utcnow().date() - timedelta(days=10)
+    stock.record_demand([{"part_number": "P1", "engineer_email": "eng@example.com", "qty_dispatched": 7, "dispatch_lines": 1}],
+                        day=earlier)
+    stock.db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["demand-backfill", "--since", (earlier + timedelta(days=1)).isoformat()])
+
+    assert result.exit_code == 0, result.output
+    assert rollups()["DemandPartDaily"] == {(earlier, "P1"): (7, 1, 0, 0)}
+
+
+def test_report_reads_the_rollups(client, seed_order):
+    first, second = seed_order("eng@example.com", [("P1", 3), ("P2", 2)])
+    stock.dispatch_items("eng@example.com", "Tom", {
+        f"send_{first}": "3", f"send_{second}": "0", f"back_order_{second}": "on",
+    })
+
+    data = client.get("/api/v1/demand").get_json()["data"]
+
+    assert data["top_dispatched"] == [{"part_number": "P1", "total": 3}]
+    assert data["top_back_ordered"] == [{"part_number": "P2", "total": 1}]
+    assert [(e["engineer_email"], e["total"]) for e in data["engineer_weekly"]] == [("eng@example.com", 3)]
@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+import app as stock
+
+DETAIL_URL = "/admin/parts_order_detail/eng@example.com"
+
+
+@contextmanager
+def captured_statements():
+    """Collect (statement, parameters) for everything sent to the database inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(stock.db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(stock.db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def sent(item_id):
+    item = stock.db.session.get(stock.PartsOrderItem, item_id)
+    stock.db.session.refresh(item)
+    return item.quantity_sent, bool(item.back_order)
+
+
+def test_dispatch_inserts_all_items_in_one_statement(app, seed_order):
+    ids = seed_order("eng@example.com", [("P1", 2), ("P2", 3), ("P3", 1)])
+    form = {f"send_{item_id}": "1" for item_id in ids}
+
+    with captured_statements() as statements:
+        result = stock.dispatch_items("eng@example.com", "Tom", form)
+
+    assert result.errors == [] and result.lines_sent == 3
+    inserts = [s for s, _ in statements if s.lstrip().upper().startswith("INSERT INTO DISPATCH_ITEM")]
+    assert len(inserts) == 1
+    items = stock.DispatchItem.query.filter_by(dispatch_note_id=result.dispatch.id).all()
+    assert sorted((i.part_number, i.quantity_sent) for i in items) == [("P1", 1), ("P2", 1), ("P3", 1)]
+
+
+def test_only_changed_lines_are_updated(app, seed_order):
+    send, flag, untouched = seed_order("eng@example.com", [("P1", 2), ("P2", 3), ("P3", 1)])
+    form = {
+        f"send_{send}": "2",
+        f"send_{flag}": "0", f"back_order_{flag}": "on",
+        f"send_{untouched}": "0",
+    }
+
+    with captured_statements() as statements:
+        result = stock.dispatch_items("eng@example.com", "Tom", form)
+
+    assert (result.lines_sent, result.flags_changed) == (1, 1)
+    updated_ids = set()
+    for statement, parameters in statements:
+        if statement.lstrip().upper().startswith("UPDATE PARTS_ORDER_ITEM"):
+            rows = parameters if isinstance(parameters, list) else [parameters]
+            updated_ids.update(row[-1] for row in rows)
+    assert updated_ids == {send, flag}
+    assert sent(send) == (2, False)
+    assert sent(flag) == (0, True)
+    assert sent(untouched) == (0, False)
+
+
+def test_over_dispatch_is_rejected_and_nothing_is_written(app, seed_order):
+    good, bad = seed_order("eng@example.com", [("P1", 2), ("P2", 3)])
+
+    result = stock.dispatch_items("eng@example.com", "Tom", {f"send_{good}": "1", f"send_{bad}": "4"})
+
+    assert result.errors == ["Only 3 of P2 remain to be sent."]
+    assert result.dispatch is None
+    assert sent(good) == (0, False)
+    assert stock.DispatchNote.query.count() == 0
+    assert stock.DispatchItem.query.count() == 0
+    assert stock.StockMovement.query.count() == 0
+    assert stock.EmailOutbox.query.count() == 0
+
+
+def test_second_picker_on_the_same_screen_gets_a_stale_line_error(app, seed_order):
+    # Both pickers loaded the page while the lines were outstanding
+    whole, partial = seed_order("eng@example.com", [("P1", 2), ("P2", 3)])
+    form = {f"send_{whole}": "2", f"send_{partial}": "2"}
+
+    first = stock.dispatch_items("eng@example.com", "Tom", form)
+    second = stock.dispatch_items("eng@example.com", "Ann", form)
+
+    assert first.errors == [] and first.lines_sent == 2
+    assert second.errors == [
+        f"Line {whole} is no longer outstanding; it may already have been dispatched.",
+        "Only 1 of P2 remain to be sent.",
+    ]
+    assert second.dispatch is None
+    assert sent(whole) == (2, False)
+    assert sent(partial) == (2, False)
+    assert stock.DispatchNote.query.count() == 1
+
+
+def test_rejected_submission_redirects_back_with_errors(client, seed_order):
+    item_id = seed_order("eng@example.com", [("P1", 2)])[0]
+
+    response = client.post(DETAIL_URL, data={"picker_name": "Tom", f"send_{item_id}": "5"})
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith(DETAIL_URL)
+
+    page = client.get(response.headers["Location"]).get_data(as_text=True)
+    assert "Only 2 of P1 remain to be sent." in page
+    assert "Nothing was dispatched. Please correct the quantities and submit again." in page
+    assert sent(item_id) == (0, False)
+
+
+def test_submission_without_a_picker_is_refused(client, seed_order):
+    item_id = seed_order("eng@example.com", [("P1", 2)])[0]
+
+    response = client.post(DETAIL_URL, data={f"send_{item_id}": "1"}, follow_redirects=True)
+
+    assert "Please select or enter a picker name." in response.get_data(as_text=True)
+    assert stock.DispatchNote.query.count() == 0
+
+
+def test_successful_submission_flashes_the_picker(client, seed_order):
+    item_id = seed_order("eng@example.com", [("P1", 2)])[0]
+
+    response = client.post(DETAIL_URL, data={
+        "picker_name": "other", "custom_picker_name": "Sam", f"send_{item_id}": "2",
+    }, follow_redirects=True)
+
+    assert "Dispatch recorded successfully. Picked by: Sam" in response.get_data(as_text=True)
+    assert stock.DispatchNote.query.one().picker_name == "Sam"
+    assert sent(item_id) == (2, False)
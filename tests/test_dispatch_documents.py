@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import app as stock
+
+
+def dispatch(seed_order, lines, back_order=()):
+    """Send every line in full except those in back_order, which are flagged instead; returns the note id"""
+    ids = seed_order("eng@example.com", lines)
+    form = {}
+    for item_id, (part_number, quantity) in zip(ids, lines):
+        if part_number in back_order:
+            form.update({f"send_{item_id}": "0", f"back_order_{item_id}": "on"})
+        else:
+            form[f"send_{item_id}"] = str(quantity)
+    return stock.dispatch_items("eng@example.com", "Tom", form).dispatch.id
+
+
+def legacy_note(date=None):
+    """A note recorded before dispatch documents existed"""
+    note = stock.DispatchNote(engineer_email="eng@example.com", date=date or datetime(2024, 3, 1), picker_name="Ann")
+    note.items.append(stock.DispatchItem(part_number="P9", description="Old part", quantity_sent=4))
+    stock.db.session.add(note)
+    stock.db.session.commit()
+    return note.id
+
+
+def test_document_is_rendered_with_the_dispatch(app, seed_order):
+    note_id = dispatch(seed_order, [("P1", 2), ("P2", 1)])
+
+    document = stock.db.session.get(stock.DispatchDocument, note_id)
+
+    assert document.engineer_email == "eng@example.com"
+    assert document.text == "Picker: Tom\n\nItems Sent:\n- P1 (P1 description): 2\n- P2 (P2 description): 1"
+    assert f"Dispatch Note #{note_id}" in document.html and "<td>P2 description</td>" in document.html
+
+
+def test_page_and_email_reuse_the_stored_document(client, seed_order):
+    note_id = dispatch(seed_order, [("P1", 2), ("P2", 1)], back_order={"P2"})
+    document = stock.db.session.get(stock.DispatchDocument, note_id)
+    document.html, document.text = "<p>stored html</p>", "stored text"
+    stock.db.session.commit()
+
+    page = client.get(f"/admin/dispatch_note/{note_id}").get_data(as_text=True)
+    message = stock.build_dispatch_message("eng@example.com", note_id)
+
+    assert "<p>stored html</p>" in page
+    assert "<p>stored html</p>" in message.html
+    assert "stored text" in message.body
+    # The back-order section is live, not part of the stored copy
+    assert "- P2 (P2 description): 1" in message.body
+    assert "P2 description" in page
+
+
+def test_older_notes_are_rendered_once_on_first_view(client):
+    note_id = legacy_note()
+    assert stock.db.session.get(stock.DispatchDocument, note_id) is None
+
+    page = client.get(f"/admin/dispatch_note/{note_id}").get_data(as_text=True)
+
+    assert "Old part" in page and "Picker: Ann" in page
+    document = stock.db.session.get(stock.DispatchDocument, note_id)
+    assert document.text == "Picker: Ann\n\nItems Sent:\n- P9 (Old part): 4"
+    assert client.get(f"/admin/dispatch_note/{note_id}").status_code == 200
+    assert stock.DispatchDocument.query.count() == 1
+
+
+def test_archived_notes_keep_their_document(client, seed_order):
+    note_id = dispatch(seed_order, [("P1", 1)])
+    note = stock.db.session.get(stock.DispatchNote, note_id)
+    note.date = datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS + 1)
+    stock.EmailOutbox.query.update({"status": "sent"})
+    stock.db.session.commit()
+    legacy_note(datetime.utcnow())  # the newest note stays live on SQLite
+
+    assert stock.archive_dispatch_notes(datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS)) == 1
+    assert stock.db.session.get(stock.DispatchDocumentArchive, note_id) is not None
+
+    page = client.get(f"/admin/dispatch_note/{note_id}").get_data(as_text=True)
+    assert f"Dispatch Note #{note_id}" in page
+
+
+def test_unknown_note_is_not_found(client):
+    assert client.get("/admin/dispatch_note/999").status_code == 404
+    assert stock.build_dispatch_message("eng@example.com", 999) is None
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import app as stock
+
+
+def add_notes(*specs):
+    """Add a dispatch note per (engineer_email, date); returns their ids"""
+    notes = [stock.DispatchNote(engineer_email=email, date=date) for email, date in specs]
+    for note in notes:
+        note.items.append(stock.DispatchItem(part_number="P1", quantity_sent=1))
+    stock.db.session.add_all(notes)
+    stock.db.session.commit()
+    return [note.id for note in notes]
+
+
+def walk(query, per_page, **kwargs):
+    """Follow next_cursor from the first page to the last; returns the pages of ids"""
+    pages, cursor = [], None
+    while True:
+        notes, cursor = stock.paginate_dispatch_notes(query, cursor, per_page, **kwargs)
+        pages.append([note.id for note in notes])
+        if cursor is None:
+            return pages
+
+
+def test_pages_are_newest_first_and_ties_break_on_id(app):
+    day = datetime(2024, 3, 1, 9, 0)
+    ids = add_notes(*[("a@example.com", day - timedelta(days=i // 2)) for i in range(7)])
+
+    pages = walk(stock.dispatch_history_query(), per_page=3)
+
+    # Two notes share each date; the later id comes first
+    assert pages == [[ids[1], ids[0], ids[3]], [ids[2], ids[5], ids[4]], [ids[6]]]
+
+
+def test_newer_notes_do_not_shift_later_pages(app):
+    day = datetime(2024, 3, 1)
+    ids = add_notes(*[("a@example.com", day - timedelta(days=i)) for i in range(4)])
+    first, cursor = stock.paginate_dispatch_notes(stock.dispatch_history_query(), None, 2)
+
+    add_notes(("a@example.com", day + timedelta(days=1)))
+    second, last = stock.paginate_dispatch_notes(stock.dispatch_history_query(), cursor, 2)
+
+    assert [n.id for n in first] == ids[:2]
+    assert [n.id for n in second] == ids[2:]
+    assert last is None
+
+
+def test_filters_apply_to_every_page(app):
+    day = datetime(2024, 3, 10)
+    add_notes(
+        ("a@example.com", day), ("b@example.com", day), ("a@example.com", day - timedelta(days=1)),
+        ("a@example.com", day - timedelta(days=5)),
+    )
+    query = stock.dispatch_history_query(engineer="a@example.com", start=day - timedelta(days=2), end=day + timedelta(days=1))
+
+    notes = [n for page in walk(query, per_page=1) for n in page]
+
+    assert [stock.db.session.get(stock.DispatchNote, i).date for i in notes] == [day, day - timedelta(days=1)]
+
+
+def test_archived_notes_merge_into_the_same_pages(app):
+    old = datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS + 5)
+    archived = add_notes(*[("a@example.com", old + timedelta(hours=i)) for i in range(3)])
+    live = add_notes(("a@example.com", datetime.utcnow()))
+    stock.archive_dispatch_notes(datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS))
+    assert stock.db.session.query(stock.DispatchNoteArchive).count() == 3
+
+    pages = walk(stock.dispatch_history_query(), per_page=2,
+                 archived_query=stock.dispatch_history_query(stock.DispatchNoteArchive))
+
+    assert pages == [[live[0], archived[2]], [archived[1], archived[0]]]
+    assert walk(stock.dispatch_history_query(), per_page=2) == [live]
+
+
+def test_malformed_cursor_starts_from_the_first_page(app):
+    ids = add_notes(("a@example.com", datetime(2024, 3, 1)))
+
+    notes, _ = stock.paginate_dispatch_notes(stock.dispatch_history_query(), "not-a-cursor", 10)
+
+    assert [n.id for n in notes] == ids
+    assert stock.decode_dispatch_cursor("2024-03-01T00:00:00_x") is None
+
+
+def test_history_page_links_to_the_next_page(client):
+    day = datetime(2024, 3, 1)
+    add_notes(*[(f"e{i}@example.com", day - timedelta(days=i)) for i in range(3)])
+
+    first = client.get("/admin/dispatched_orders?per_page=2").get_data(as_text=True)
+    assert "e0@example.com" in first and "e1@example.com" in first and "e2@example.com" not in first
+    cursor = stock.encode_dispatch_cursor(stock.DispatchNote.query.filter_by(engineer_email="e1@example.com").one())
+    assert f"cursor={cursor}" in first
+
+    second = client.get(f"/admin/dispatched_orders?per_page=2&cursor={cursor}").get_data(as_text=True)
+    assert "e2@example.com" in second and "e0@example.com" not in second
+    assert "cursor=" not in second
+
+
+def test_per_page_is_clamped():
+    assert stock.clamp_per_page("0") == 1
+    assert stock.clamp_per_page("100000") == stock.DISPATCH_HISTORY_MAX_PER_PAGE
+    assert stock.clamp_per_page("junk") == stock.DISPATCH_HISTORY_PER_PAGE
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import app as stock
+from tests.conftest import unused_port
+
+
+def dispatch_one(client, seed_order):
+    item_id = seed_order("eng@example.com", [("P0001", 2)])[0]
+    response = client.post("/admin/parts_order_detail/eng@example.com", data={
+        "picker_name": "Tom", f"send_{item_id}": "1",
+    })
+    assert response.status_code == 302
+    return stock.EmailOutbox.query.one()
+
+
+def test_dispatch_email_is_delivered_to_sink(client, seed_order, smtp_sink):
+    row = dispatch_one(client, seed_order)
+    assert row.status == "pending"
+
+    assert stock.drain_outbox_once() == 1
+
+    row = stock.db.session.get(stock.EmailOutbox, row.id)
+    assert row.status == "sent"
+    assert row.sent_at is not None
+    assert len(smtp_sink.messages) == 1
+    message = smtp_sink.messages[0]
+    assert message["rcpt_to"] == ["<eng@example.com>"]
+    assert "P0001" in message["data"]
+
+
+def test_failed_send_is_retried(app, client, seed_order, smtp_sink, monkeypatch):
+    row = dispatch_one(client, seed_order)
+    sink_port = smtp_sink.port
+
+    # Nothing listening: the connection fails and the row is rescheduled
+    monkeypatch.setattr(app.extensions["mail"], "port", unused_port())
+    assert stock.drain_outbox_once() == 1
+    row = stock.db.session.get(stock.EmailOutbox, row.id)
+    assert row.status == "pending"
+    assert row.attempts == 1
+    assert row.last_error
+    assert row.next_attempt_at > datetime.utcnow()
+
+    # Not due yet, so the next drain leaves it alone
+    assert stock.drain_outbox_once() == 0
+
+    row.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    stock.db.session.commit()
+    monkeypatch.setattr(app.extensions["mail"], "port", sink_port)
+    assert stock.drain_outbox_once() == 1
+
+    row = stock.db.session.get(stock.EmailOutbox, row.id)
+    assert row.status == "sent"
+    assert row.attempts == 1
+    assert len(smtp_sink.messages) == 1
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+import app as stock
+
+
+@contextmanager
+def counted_queries():
+    """Count statements sent to the database inside the block"""
+    count = [0]
+
+    def before_cursor_execute(*args):
+        count[0] += 1
+
+    event.listen(stock.db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield count
+    finally:
+        event.remove(stock.db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def seed_engineer(seed_order, lines):
+    """An order of `lines` lines for eng@example.com, every other one on back order, plus one dispatch"""
+    ids = seed_order("eng@example.com", [(f"P{i}", 2) for i in range(lines)])
+    stock.dispatch_items("eng@example.com", "Tom", {
+        f"send_{ids[0]}": "1",
+        **{f"back_order_{item_id}": "on" for item_id in ids[1::2]},
+        **{f"send_{item_id}": "0" for item_id in ids[1:]},
+    })
+    stock.db.session.expunge_all()
+    return ids
+
+
+def load_everything(detail):
+    """Touch every attribute the detail template reads"""
+    for item in detail.outstanding_items:
+        item.order.date, item.qty_remaining
+    for dispatch in detail.engineer_dispatches:
+        [(i.part_number, i.quantity_sent) for i in dispatch.items]
+
+
+def test_detail_loads_in_a_fixed_number_of_queries(app, seed_order):
+    stock.record_stock_movements([{"part_number": "P1", "quantity": 5, "kind": "receipt"}])
+    stock.db.session.commit()
+    seed_engineer(seed_order, 2)
+    with counted_queries() as small:
+        load_everything(stock.load_engineer_detail("eng@example.com"))
+
+    stock.db.session.expunge_all()
+    seed_engineer(seed_order, 12)
+    with counted_queries() as large:
+        detail = stock.load_engineer_detail("eng@example.com")
+        load_everything(detail)
+
+    assert small[0] == large[0] <= 4
+    assert len(detail.outstanding_items) == 2 + 12
+    assert all(item.back_order for item in detail.back_orders)
+    assert {item.part_number for item in detail.back_orders} == {"P1", "P3", "P5", "P7", "P9", "P11"}
+    assert detail.stock_on_hand["P1"] == 5
+
+
+def test_history_is_paged(app, seed_order):
+    for _ in range(3):
+        seed_engineer(seed_order, 1)
+
+    first = stock.load_engineer_detail("eng@example.com", history_per_page=2)
+    second = stock.load_engineer_detail("eng@example.com", first.history_next_cursor, history_per_page=2)
+
+    assert len(first.engineer_dispatches) == 2 and first.history_next_cursor
+    assert len(second.engineer_dispatches) == 1 and second.history_next_cursor is None
+
+
+def test_detail_page_shows_outstanding_lines(client, seed_order):
+    seed_engineer(seed_order, 2)
+
+    page = client.get("/admin/parts_order_detail/eng@example.com").get_data(as_text=True)
+
+    assert "P0 description" in page and "P1 description" in page
+
+
+def test_back_order_section_is_cached_until_invalidated(app, seed_order):
+    ids = seed_engineer(seed_order, 2)
+    cache = stock.BackOrderSectionCache(ttl=60)
+
+    section = cache.get("eng@example.com")
+    assert "P1 (P1 description): 2" in section.text
+    assert cache.get("eng@example.com") is section
+
+    stock.dispatch_items("eng@example.com", "Tom", {f"send_{ids[1]}": "2"})
+    assert cache.get("eng@example.com") is section
+    cache.invalidate("eng@example.com")
+    assert cache.get("eng@example.com").text == ""
+
+
+def test_dispatch_invalidates_the_shared_section(app, seed_order):
+    ids = seed_engineer(seed_order, 2)
+    before = stock.back_order_sections.get("eng@example.com")
+
+    stock.dispatch_items("eng@example.com", "Tom", {f"send_{ids[1]}": "1", f"back_order_{ids[1]}": "on"})
+
+    after = stock.back_order_sections.get("eng@example.com")
+    assert after is not before
+    assert "P1 (P1 description): 1" in after.text
+
+
+def test_expired_sections_are_rendered_again(app, seed_order):
+    seed_engineer(seed_order, 2)
+    cache = stock.BackOrderSectionCache(ttl=0)
+
+    assert cache.get("eng@example.com") is not cache.get("eng@example.com")
+
+
+def test_get_many_loads_every_miss_in_one_query(app, seed_order):
+    for email in ("a@example.com", "b@example.com", "c@example.com"):
+        item_id = seed_order(email, [("P1", 1)])[0]
+        stock.dispatch_items(email, "Tom", {f"send_{item_id}": "0", f"back_order_{item_id}": "on"})
+    cache = stock.BackOrderSectionCache(ttl=60)
+    cached = cache.get("a@example.com")
+
+    with counted_queries() as queries:
+        sections = cache.get_many(["a@example.com", "b@example.com", "c@example.com", "none@example.com"])
+
+    assert queries[0] == 1
+    assert sections["a@example.com"] is cached
+    assert all("P1 (P1 description): 1" in sections[e].text for e in ("a@example.com", "b@example.com", "c@example.com"))
+    assert sections["none@example.com"].text == ""
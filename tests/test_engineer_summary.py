@@ -0,0 +1,62 @@
+import app as stock
+
+
+def summary(email):
+    row = stock.db.session.get(stock.EngineerOutstandingSummary, email)
+    return None if row is None else (row.outstanding_qty, row.line_count)
+
+
+def add_line(email, quantity, item_id=None):
+    """Write a line the way the engineer-facing app does, bypassing this app's summary upkeep"""
+    order = stock.PartsOrder(email=email)
+    order.items.append(stock.PartsOrderItem(id=item_id, part_number="P1", quantity=quantity, quantity_sent=0))
+    stock.db.session.add(order)
+    stock.db.session.commit()
+    return order.items[0].id
+
+
+def test_line_committed_below_watermark_is_picked_up(app):
+    first = add_line("a@example.com", 1)
+    add_line("a@example.com", 1)
+    add_line("a@example.com", 1)
+    late_id = first + 1
+    stock.db.session.execute(stock.delete(stock.PartsOrderItem).where(stock.PartsOrderItem.id == late_id))
+    stock.db.session.commit()
+    stock.sync_engineer_summaries()
+
+    # Allocated before that sync, committed after it
+    add_line("late@example.com", 4, item_id=late_id)
+    add_line("a@example.com", 1)
+    stock.sync_engineer_summaries()
+
+    assert summary("late@example.com") == (4, 1)
+    assert summary("a@example.com") == (3, 3)
+
+
+def test_edits_by_other_app_wait_for_the_rebuild_command(app):
+    item_id = add_line("a@example.com", 2)
+    stock.sync_engineer_summaries()
+    assert summary("a@example.com") == (2, 1)
+
+    stock.db.session.execute(
+        stock.update(stock.PartsOrderItem).where(stock.PartsOrderItem.id == item_id).values(quantity=7)
+    )
+    stock.db.session.commit()
+    stock.sync_engineer_summaries()
+    assert summary("a@example.com") == (2, 1)
+
+    result = app.test_cli_runner().invoke(args=["rebuild-engineer-summary"])
+    assert result.exit_code == 0, result.output
+    assert summary("a@example.com") == (7, 1)
+
+
+def test_list_page_syncs_new_lines_without_rebuilding(client):
+    add_line("a@example.com", 2)
+    response = client.get("/admin/parts_orders_list")
+    assert response.status_code == 200
+    assert summary("a@example.com") == (2, 1)
+
+    stock.db.session.execute(stock.delete(stock.EngineerOutstandingSummary))
+    stock.db.session.commit()
+    client.get("/admin/parts_orders_list")
+    assert summary("a@example.com") is None
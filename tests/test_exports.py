@@ -0,0 +1,118 @@
+import csv
+import gzip
+import io
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+import app as stock
+
+SHEET_NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def add_dispatch(email, date, lines):
+    note = stock.DispatchNote(engineer_email=email, date=date, picker_name="Tom")
+    for part_number, description, qty in lines:
+        note.items.append(stock.DispatchItem(part_number=part_number, description=description, quantity_sent=qty))
+    stock.db.session.add(note)
+    stock.db.session.commit()
+    return note.id
+
+
+def read_csv(data):
+    return list(csv.reader(io.StringIO(data.decode("utf-8"))))
+
+
+def xlsx_rows(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert {"[Content_Types].xml", "xl/workbook.xml", "xl/worksheets/sheet1.xml"} <= set(zf.namelist())
+        sheet = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    return [
+        [cell.findtext("s:v", namespaces=SHEET_NS) or cell.findtext("s:is/s:t", namespaces=SHEET_NS)
+         for cell in row.findall("s:c", SHEET_NS)]
+        for row in sheet.findall("s:sheetData/s:row", SHEET_NS)
+    ]
+
+
+def test_dispatch_csv_lists_items_oldest_first(client):
+    day = datetime(2024, 3, 1, 9, 30)
+    later = add_dispatch("b@example.com", day + timedelta(days=1), [("P2", "Gadget", 1)])
+    first = add_dispatch("a@example.com", day, [("P1", "Widget, large", 2), ("P3", None, 1)])
+
+    response = client.get("/admin/export/dispatches.csv")
+
+    assert response.is_streamed
+    assert response.headers["Content-Disposition"] == "attachment; filename=dispatch_history.csv"
+    assert read_csv(response.data) == [
+        ["Dispatch ID", "Dispatch Date", "Engineer", "Picked By", "Part Number", "Description", "Quantity Sent"],
+        [str(first), "2024-03-01 09:30:00", "a@example.com", "Tom", "P1", "Widget, large", "2"],
+        [str(first), "2024-03-01 09:30:00", "a@example.com", "Tom", "P3", "", "1"],
+        [str(later), "2024-03-02 09:30:00", "b@example.com", "Tom", "P2", "Gadget", "1"],
+    ]
+
+
+def test_dispatch_export_filters_and_includes_archived(client):
+    old = datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS + 1)
+    add_dispatch("a@example.com", old, [("P1", "Widget", 1)])
+    add_dispatch("b@example.com", old, [("P2", "Gadget", 1)])
+    add_dispatch("a@example.com", datetime.utcnow(), [("P3", "Sprocket", 1)])
+    assert stock.archive_dispatch_notes(datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS)) == 2
+
+    live = read_csv(client.get("/admin/export/dispatches.csv?engineer=a@example.com").data)
+    everything = read_csv(client.get("/admin/export/dispatches.csv?engineer=a@example.com&include_archived=1").data)
+
+    assert [row[4] for row in live[1:]] == ["P3"]
+    assert [row[4] for row in everything[1:]] == ["P1", "P3"]
+
+
+def test_csv_is_written_in_chunks(monkeypatch):
+    monkeypatch.setattr(stock, "EXPORT_CHUNK_ROWS", 2)
+
+    chunks = list(stock.stream_csv(["n"], ([i] for i in range(5))))
+
+    assert len(chunks) == 3
+    assert "".join(chunks).split() == ["n", "0", "1", "2", "3", "4"]
+
+
+def test_gzip_download_and_content_encoding(client):
+    add_dispatch("a@example.com", datetime(2024, 3, 1), [("P1", "Widget", 2)])
+    plain = client.get("/admin/export/dispatches.csv").data
+
+    download = client.get("/admin/export/dispatches.csv?gzip=1")
+    assert download.mimetype == "application/gzip"
+    assert download.headers["Content-Disposition"] == "attachment; filename=dispatch_history.csv.gz"
+    assert gzip.decompress(download.data) == plain
+
+    encoded = client.get("/admin/export/dispatches.csv", headers={"Accept-Encoding": "gzip, deflate"})
+    assert encoded.headers["Content-Encoding"] == "gzip"
+    assert encoded.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(encoded.data) == plain
+
+
+def test_outstanding_xlsx_is_a_valid_workbook(client, seed_order):
+    item_id = seed_order("eng@example.com", [("P<1>", 3), ("P2", 1)])[0]
+    stock.dispatch_items("eng@example.com", "Tom", {f"send_{item_id}": "1", f"back_order_{item_id}": "on"})
+    item = stock.db.session.get(stock.PartsOrderItem, item_id)
+    item.description = "Bolt & nut\x07"
+    stock.db.session.commit()
+
+    response = client.get("/admin/export/outstanding.xlsx")
+
+    assert response.headers["Content-Disposition"] == "attachment; filename=outstanding_orders.xlsx"
+    rows = xlsx_rows(response.data)
+    assert rows[0] == ["Order ID", "Order Date", "Engineer", "Part Number", "Description",
+                       "Qty Ordered", "Qty Sent", "Qty Remaining", "Back Order"]
+    assert [row[3:] for row in rows[1:]] == [
+        ["P<1>", "Bolt & nut", "3", "1", "2", "Yes"],
+        ["P2", "P2 description", "1", "0", "1", "No"],
+    ]
+
+
+def test_xlsx_is_flushed_as_rows_are_written(monkeypatch):
+    monkeypatch.setattr(stock, "EXPORT_CHUNK_ROWS", 100)
+    rows = ([i, "x" * 50] for i in range(1000))
+
+    chunks = list(stock.stream_xlsx("Sheet", ["n", "text"], rows))
+
+    assert len(chunks) > 2
+    assert len(xlsx_rows(b"".join(chunks))) == 1001
@@ -0,0 +1,68 @@
+import app as stock
+
+
+def test_server_errors_are_retried(fake_github):
+    fake_github.fail_next(502, 503)
+    response = stock.github.fetch_raw(stock.CSV_FILE_PATH)
+    assert response.status_code == 200
+    assert len(fake_github.requests) == 3
+    assert stock.github.stats()["calls"]["raw_get"]["retries"] == 2
+
+
+def test_rate_limited_request_honours_retry_after(fake_github):
+    fake_github.fail_next(429, headers={"Retry-After": "0"})
+    assert stock.github.get_contents(stock.CSV_FILE_PATH).status_code == 200
+    assert len(fake_github.requests) == 2
+
+
+def test_last_failure_is_returned_once_retries_run_out(fake_github):
+    fake_github.fail_next(*[503] * (stock.github.max_retries + 1))
+    assert stock.github.fetch_raw(stock.CSV_FILE_PATH).status_code == 503
+    assert len(fake_github.requests) == stock.github.max_retries + 1
+
+
+def test_client_errors_are_not_retried(fake_github):
+    fake_github.fail_next(404)
+    assert stock.github.fetch_raw(stock.CSV_FILE_PATH).status_code == 404
+    assert len(fake_github.requests) == 1
+
+
+def test_conditional_fetch_returns_304_for_current_etag(fake_github):
+    status, content, etag = stock.fetch_csv_from_github_conditional()
+    assert status == 200 and "P1" in content and etag
+
+    assert stock.fetch_csv_from_github_conditional(etag) == (304, None, etag)
+    assert fake_github.requests[-1][2]["If-None-Match"] == etag
+
+    fake_github.files[stock.CSV_FILE_PATH] += b"P2,Gadget,Widgets,Acme,Acme,\n"
+    status, content, new_etag = stock.fetch_csv_from_github_conditional(etag)
+    assert status == 200 and "P2" in content and new_etag != etag
+
+
+def test_put_with_stale_sha_is_rejected(fake_github):
+    _, sha = stock.get_github_file_info()
+    fake_github.files[stock.CSV_FILE_PATH] += b"P2,Gadget,Widgets,Acme,Acme,\n"
+    response = stock.github.put_contents(stock.CSV_FILE_PATH, {"message": "stale", "content": "", "sha": sha})
+    assert response.status_code == 409
+    assert fake_github.commits == []
+
+
+def test_sha_conflict_rebases_operations_onto_new_content(app, fake_github, monkeypatch):
+    fetch = stock.get_github_file_info
+    calls = []
+
+    def fetch_then_commit_elsewhere():
+        content, sha = fetch()
+        if not calls:
+            fake_github.files[stock.CSV_FILE_PATH] += b"P2,Gadget,Widgets,Acme,Acme,\n"
+        calls.append(sha)
+        return content, sha
+
+    monkeypatch.setattr(stock, "get_github_file_info", fetch_then_commit_elsewhere)
+    success, message, results = stock.commit_catalogue_operations([{"op": "add", "product_code": "P3", "description": "Sprocket"}])
+
+    assert success, message
+    assert len(calls) == 2 and calls[0] != calls[1]
+    assert fake_github.commits == ["Add new part: P3"]
+    content = fake_github.files[stock.CSV_FILE_PATH].decode("utf-8")
+    assert "P2,Gadget" in content and "P3,Sprocket" in content
@@ -0,0 +1,48 @@
+import logging
+import sys
+
+import pytest
+
+import app as stock
+
+
+def redacted(msg, *args, exc_info=None):
+    record = logging.LogRecord("stock.test", logging.ERROR, __file__, 1, msg, args, exc_info)
+    stock.RedactSecretsFilter().filter(record)
+    return record
+
+
+@pytest.mark.parametrize("message", [
+    "No GITHUB_TOKEN provided",
+    "GitHub token not configured",
+    "Using token auth for the catalogue mirror",
+])
+def test_plain_mentions_of_tokens_are_left_alone(message):
+    assert redacted(message).getMessage() == message
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Authorization: Bearer abc.def-123", "Authorization: [REDACTED]"),
+    ("sent Bearer abc.def-123 upstream", "sent Bearer [REDACTED] upstream"),
+    ("GET /raw?token=abc123&ref=main", "GET /raw?token=[REDACTED]&ref=main"),
+    ("pushed with ghp_" + "a" * 36, "pushed with [REDACTED]"),
+    ("pushed with github_pat_" + "B1_" * 10, "pushed with [REDACTED]"),
+])
+def test_credential_shapes_are_redacted(message, expected):
+    assert redacted(message).getMessage() == expected
+
+
+def test_configured_secret_is_redacted_from_args(monkeypatch):
+    monkeypatch.setattr(stock, "GITHUB_TOKEN", "s3cret-value")
+    assert redacted("calling with %s", "s3cret-value").getMessage() == "calling with [REDACTED]"
+
+
+def test_traceback_is_redacted(monkeypatch):
+    monkeypatch.setattr(stock, "GITHUB_TOKEN", "s3cret-value")
+    try:
+        raise RuntimeError("request failed for s3cret-value")
+    except RuntimeError:
+        record = redacted("sync failed", exc_info=sys.exc_info())
+    assert record.exc_info is None
+    assert "RuntimeError: request failed for [REDACTED]" in record.exc_text
+    assert "s3cret-value" not in logging.Formatter().format(record)
@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import inspect, text
+
+import app as stock
+
+# The tables as the app created them before migrations existed
+BASELINE_SCHEMA = [
+    """CREATE TABLE parts_order (
+        id INTEGER PRIMARY KEY, email VARCHAR(120) NOT NULL, date DATETIME, status VARCHAR(20))""",
+    """CREATE TABLE parts_order_item (
+        id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL REFERENCES parts_order (id),
+        part_number VARCHAR(64), description VARCHAR(256), quantity INTEGER,
+        quantity_sent INTEGER, back_order BOOLEAN NOT NULL)""",
+    """CREATE TABLE dispatch_note (
+        id INTEGER PRIMARY KEY, engineer_email VARCHAR(120) NOT NULL, date DATETIME, picker_name VARCHAR(100))""",
+    """CREATE TABLE dispatch_item (
+        id INTEGER PRIMARY KEY, dispatch_note_id INTEGER NOT NULL REFERENCES dispatch_note (id),
+        part_number VARCHAR(64), quantity_sent INTEGER, description VARCHAR(256))""",
+]
+
+
+def migrate():
+    applied = []
+    stock.run_migrations(echo=applied.append)
+    return applied
+
+
+@pytest.fixture
+def empty_database(app):
+    stock.db.session.remove()
+    stock.db.drop_all()
+    return app
+
+
+def test_fresh_database_migrates_once(empty_database):
+    assert len(migrate()) == len(stock.MIGRATIONS)
+    assert migrate() == []
+
+
+def test_existing_schema_is_upgraded_in_place(empty_database):
+    with stock.db.engine.begin() as conn:
+        for ddl in BASELINE_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO parts_order (id, email) VALUES (1, 'a@example.com')"))
+        conn.execute(text(
+            "INSERT INTO parts_order_item (id, order_id, part_number, quantity, quantity_sent, back_order) "
+            "VALUES (1, 1, 'P1', 5, 2, 0), (2, 1, 'P2', 3, 4, 0), (3, 1, 'P3', 2, NULL, 0)"
+        ))
+
+    assert len(migrate()) == len(stock.MIGRATIONS)
+    assert migrate() == []
+
+    with stock.db.engine.connect() as conn:
+        remaining = dict(conn.execute(text("SELECT id, qty_remaining FROM parts_order_item ORDER BY id")).all())
+        indexes = {ix["name"] for ix in inspect(conn).get_indexes("parts_order_item")}
+    # Over-dispatched lines report nothing remaining, never a negative amount
+    assert remaining == {1: 3, 2: 0, 3: 2}
+    assert {"ix_parts_order_item_order_id", "ix_parts_order_item_outstanding"} <= indexes
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+
+import app as stock
+
+
+def matches(table, term):
+    """Ids the search index returns for term"""
+    return set(stock.db.session.execute(stock.part_search_match_ids(table, term)).scalars())
+
+
+def history(term, **kwargs):
+    rows, _ = stock.search_part_history(term, **kwargs)
+    return [(r.part_number, r.engineer_email, int(r.outstanding_qty), int(r.sent_qty)) for r in rows]
+
+
+def add_dispatch(email, date, part_number, qty):
+    note = stock.DispatchNote(engineer_email=email, date=date)
+    note.items.append(stock.DispatchItem(part_number=part_number, description=f"{part_number} description", quantity_sent=qty))
+    stock.db.session.add(note)
+    stock.db.session.commit()
+    return note
+
+
+def test_index_follows_inserts_updates_and_deletes(app, seed_order):
+    table = stock.PartsOrderItem.__table__
+    item_id = seed_order("eng@example.com", [("FLT-1001", 2)])[0]
+    assert matches(table, "T-10") == {item_id}
+    # Descriptions are indexed too, matched anywhere in the text
+    assert matches(table, "1 descr") == {item_id}
+
+    item = stock.db.session.get(stock.PartsOrderItem, item_id)
+    item.part_number, item.description = "VLV-2002", "Check valve"
+    stock.db.session.commit()
+    assert matches(table, "FLT") == set()
+    assert matches(table, "lv-20") == {item_id}
+    assert matches(table, "k va") == {item_id}
+
+    stock.db.session.delete(item)
+    stock.db.session.commit()
+    assert matches(table, "VLV") == set()
+
+
+def test_history_combines_outstanding_and_sent_lines(app, seed_order):
+    seed_order("a@example.com", [("FLT-1001", 3)])
+    seed_order("b@example.com", [("FLT-1001", 1), ("VLV-2002", 1)])
+    add_dispatch("a@example.com", datetime.utcnow(), "FLT-1001", 2)
+
+    assert history("FLT") == [("FLT-1001", "a@example.com", 3, 2), ("FLT-1001", "b@example.com", 1, 0)]
+
+
+def test_history_pages_by_part_and_engineer(app, seed_order):
+    for i in range(3):
+        seed_order(f"e{i}@example.com", [("FLT-1001", 1)])
+
+    first, cursor = stock.search_part_history("FLT", per_page=2)
+    second, last = stock.search_part_history("FLT", cursor=cursor, per_page=2)
+
+    assert [r.engineer_email for r in first + second] == ["e0@example.com", "e1@example.com", "e2@example.com"]
+    assert last is None
+
+
+def test_archived_dispatches_only_with_include_archived(client):
+    old = datetime.utcnow() - timedelta(days=stock.ARCHIVE_AFTER_DAYS + 1)
+    add_dispatch("eng@example.com", old, "FLT-1001", 2)
+    # The newest note is never archived on SQLite
+    add_dispatch("other@example.com", old, "VLV-2002", 1)
+    assert stock.archive_dispatch_notes(datetime.utcnow()) == 1
+
+    assert history("FLT") == []
+    assert history("FLT", include_archived=True) == [("FLT-1001", "eng@example.com", 0, 2)]
+
+    live = client.get("/api/v1/part_history?q=FLT").get_json()["data"]
+    archived = client.get("/api/v1/part_history?q=FLT&include_archived=1").get_json()["data"]
+    assert live == []
+    assert [(r["engineer_email"], r["sent_qty"]) for r in archived] == [("eng@example.com", 2)]
+
+
+def test_short_terms_are_refused(client, seed_order):
+    seed_order("eng@example.com", [("FL", 1)])
+    short = "F" * (stock.PART_SEARCH_MIN_LENGTH - 1)
+
+    response = client.get(f"/api/v1/part_history?q={short}")
+    assert response.status_code == 400
+    assert "at least" in response.get_json()["error"]
+
+    page = client.get(f"/admin/part_search?q={short}").get_data(as_text=True)
+    assert f"Enter at least {stock.PART_SEARCH_MIN_LENGTH} characters to search." in page
+
+
+def test_quotes_in_the_term_are_matched_literally(app, seed_order):
+    item_id = seed_order("eng@example.com", [('PIPE 1/2"', 1)])[0]
+
+    assert matches(stock.PartsOrderItem.__table__, '1/2"') == {item_id}
+
+
+def test_postgres_matches_with_escaped_ilike(app, monkeypatch):
+    monkeypatch.setattr(stock.db.session.get_bind().dialect, "name", "postgresql")
+
+    query = stock.part_search_match_ids(stock.PartsOrderItem.__table__, "10%_a\\b").compile(dialect=postgresql.dialect())
+
+    sql = str(query)
+    assert "part_number ILIKE" in sql and "description ILIKE" in sql
+    assert sql.count("ESCAPE") == 2
+    assert set(query.params.values()) == {"%10\\%\\_a\\\\b%"}
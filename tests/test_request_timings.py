@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import app as stock
+
+
+def test_failed_statement_does_not_skew_later_query_timings(app):
+    with app.test_request_context():
+        stock.g.timings = timings = stock.RequestTimings()
+        with pytest.raises(OperationalError):
+            stock.db.session.execute(stock.text("SELECT * FROM no_such_table"))
+        stock.db.session.rollback()
+        assert timings.db_count == 0
+
+        stock.db.session.execute(stock.text("SELECT 1"))
+        assert timings.db_count == 1
+        assert timings.slowest_sql == "SELECT 1"
+        assert not stock.db.session.connection().info.get("query_started")
+
+
+def server_timing(response):
+    """{metric: {"dur": float, "desc": str}} from the Server-Timing header"""
+    metrics = {}
+    for entry in response.headers["Server-Timing"].split(", "):
+        name, *params = entry.split(";")
+        metrics[name] = {k: v.strip('"') for k, v in (p.split("=", 1) for p in params)}
+        metrics[name]["dur"] = float(metrics[name]["dur"])
+    return metrics
+
+
+def test_server_timing_header_reports_queries_and_render(client, seed_order, monkeypatch):
+    seed_order("eng@example.com", [("P1", 1)])
+    monkeypatch.setattr(stock, "SERVER_TIMING_ENABLED", True)
+
+    response = client.get("/admin/parts_order_detail/eng@example.com")
+
+    metrics = server_timing(response)
+    assert set(metrics) == {"db", "db-slowest", "github", "render", "total"}
+    queries = int(metrics["db"]["desc"].split()[0])
+    assert queries >= 3
+    assert metrics["github"]["desc"] == "0 calls"
+    assert metrics["render"]["dur"] > 0
+    assert metrics["total"]["dur"] >= metrics["db"]["dur"] >= metrics["db-slowest"]["dur"]
+
+
+def test_server_timing_header_is_off_by_default(client):
+    assert "Server-Timing" not in client.get("/metrics").headers
+
+
+def test_github_calls_are_counted(app, fake_github):
+    with app.test_request_context():
+        stock.g.timings = timings = stock.RequestTimings()
+        stock.github.fetch_raw(stock.CSV_FILE_PATH)
+        assert timings.http_count == 1
+        assert timings.http_ms > 0
+
+
+def test_metrics_expose_per_route_histograms(client):
+    client.get("/admin/dispatched_orders")
+    client.get("/admin/dispatched_orders")
+
+    body = client.get("/metrics").get_data(as_text=True)
+
+    lines = body.splitlines()
+    assert "# TYPE stock_request_duration_seconds histogram" in lines
+    count = next(l for l in lines if l.startswith('stock_request_duration_seconds_count{route="dispatched_orders",method="GET",status="200"}'))
+    assert int(count.split()[-1]) >= 2
+    assert any(l.startswith('stock_request_db_queries_bucket{route="dispatched_orders",method="GET",le="+Inf"}') for l in lines)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = stock.Histogram("h", "Help.", ("route",), (1, 5))
+    for value in (0.5, 3, 9):
+        histogram.observe(('a"b',), value)
+
+    assert histogram.render().splitlines() == [
+        "# HELP h Help.",
+        "# TYPE h histogram",
+        'h_bucket{route="a\\"b",le="1"} 1',
+        'h_bucket{route="a\\"b",le="5"} 2',
+        'h_bucket{route="a\\"b",le="+Inf"} 3',
+        'h_sum{route="a\\"b"} 12.500000',
+        'h_count{route="a\\"b"} 3',
+    ]
+
+
+def test_slow_requests_are_logged_with_their_slowest_statement(client, monkeypatch, caplog):
+    monkeypatch.setattr(stock, "SLOW_REQUEST_MS", 0)
+
+    client.get("/admin/dispatched_orders")
+
+    [record] = [r for r in caplog.records if r.name == "stock.perf"]
+    assert record.getMessage().startswith("Slow request GET /admin/dispatched_orders")
+    assert "SELECT" in record.getMessage()
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import app as stock
+
+
+def receive(part_number, quantity):
+    stock.record_stock_movements([{"part_number": part_number, "quantity": quantity, "kind": "receipt"}])
+    stock.db.session.commit()
+
+
+def settle_movements():
+    """Backdate every movement so take_stock_snapshot treats it as settled"""
+    settled = datetime.utcnow() - timedelta(seconds=stock.STOCK_SNAPSHOT_SETTLE_SECONDS + 1)
+    stock.db.session.execute(update(stock.StockMovement).values(created_at=settled))
+    stock.db.session.commit()
+
+
+def test_balance_is_snapshot_plus_later_movements(app):
+    receive("P1", 10)
+    receive("P2", 4)
+    stock.record_stock_movements([{"part_number": "P1", "quantity": -3, "kind": "adjustment", "note": "count"}])
+    stock.db.session.commit()
+    settle_movements()
+
+    snapshot = stock.take_stock_snapshot()
+    assert snapshot.last_movement_id == stock.db.session.query(stock.StockMovement).count()
+    # Nothing new since: no empty snapshot is written
+    assert stock.take_stock_snapshot() is None
+
+    receive("P1", 5)
+    receive("P3", 2)
+
+    assert stock.replay_stock_balances() == {"P1": 12, "P2": 4, "P3": 2}
+    assert stock.replay_stock_balances(["P1"]) == {"P1": 12}
+    assert stock.get_stock_balances(["P1", "P2", "P3", "P4"]) == {"P1": 12, "P2": 4, "P3": 2}
+
+
+def test_unsettled_movements_are_left_for_the_next_snapshot(app):
+    receive("P1", 10)
+    settle_movements()
+    receive("P1", 1)
+
+    snapshot = stock.take_stock_snapshot()
+    lines = dict(stock.db.session.query(stock.StockSnapshotLine.part_number, stock.StockSnapshotLine.on_hand)
+                 .filter_by(snapshot_id=snapshot.id).all())
+
+    assert lines == {"P1": 10}
+    assert stock.replay_stock_balances() == {"P1": 11}
+
+
+def test_dispatch_records_one_movement_per_line(client, seed_order):
+    receive("P1", 10)
+    first, second = seed_order("eng@example.com", [("P1", 3), ("P2", 2)])
+
+    response = client.post("/admin/parts_order_detail/eng@example.com", data={
+        "picker_name": "Tom", f"send_{first}": "3", f"send_{second}": "0",
+    })
+
+    assert response.status_code == 302
+    note = stock.DispatchNote.query.one()
+    movement = stock.StockMovement.query.filter_by(kind="dispatch").one()
+    assert (movement.part_number, movement.quantity) == ("P1", -3)
+    assert (movement.dispatch_note_id, movement.reference) == (note.id, "Tom")
+    assert stock.get_stock_balances(["P1", "P2"]) == {"P1": 7}
+    assert stock.replay_stock_balances() == {"P1": 7}
+
+
+def test_dispatch_below_zero_is_recorded_and_flagged(client, seed_order, caplog):
+    receive("P1", 1)
+    item_id = seed_order("eng@example.com", [("P1", 3)])[0]
+
+    response = client.post("/admin/parts_order_detail/eng@example.com", data={
+        "picker_name": "Tom", f"send_{item_id}": "3",
+    }, follow_redirects=True)
+
+    assert stock.db.session.get(stock.PartsOrderItem, item_id).quantity_sent == 3
+    assert stock.get_stock_balances(["P1"]) == {"P1": -2}
+    assert b"Stock on hand is now below zero for P1 (-2)" in response.data
+    assert any(r.name == "stock.dispatch" and "negative" in r.getMessage() for r in caplog.records)
+
+
+def test_stock_check_agrees_with_balances_after_dispatch(app, seed_order):
+    receive("P1", 5)
+    item_id = seed_order("eng@example.com", [("P1", 2)])[0]
+    result = stock.dispatch_items("eng@example.com", "Tom", {f"send_{item_id}": "2"})
+    assert result.negative_stock == {}
+
+    output = app.test_cli_runner().invoke(args=["stock-check"]).output
+
+    assert output.strip() == "All 1 balances match the ledger"
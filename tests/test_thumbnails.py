@@ -0,0 +1,50 @@
+import app as stock
+
+
+def failing_cache(tmp_path, monkeypatch):
+    cache = stock.ThumbnailCache(str(tmp_path), max_bytes=1024 * 1024, size=64)
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        raise ValueError("not an image")
+    monkeypatch.setattr(cache, "_fetch", fetch)
+    return cache, fetched
+
+
+def test_failed_fetch_is_not_retried_within_retry_window(tmp_path, monkeypatch):
+    cache, fetched = failing_cache(tmp_path, monkeypatch)
+    assert cache.get("http://images.test/a.jpg") is None
+    assert cache.get("http://images.test/a.jpg") is None
+    assert fetched == ["http://images.test/a.jpg"]
+
+
+def test_expired_failures_are_forgotten(tmp_path, monkeypatch):
+    monkeypatch.setattr(stock, "THUMBNAIL_RETRY_AFTER", 0)
+    cache, fetched = failing_cache(tmp_path, monkeypatch)
+    for i in range(100):
+        assert cache.get(f"http://images.test/{i}.jpg") is None
+    assert len(fetched) == 100
+    assert len(cache._failed_until) <= 1
+    assert len(cache._fetch_locks) == cache.FETCH_LOCK_STRIPES
+
+
+def test_eviction_drops_oldest_without_holding_the_lock(tmp_path, monkeypatch):
+    cache = stock.ThumbnailCache(str(tmp_path), max_bytes=1000, size=64)
+    scan = cache._scan
+
+    def unlocked_scan():
+        assert not cache._lock.locked()
+        return scan()
+    monkeypatch.setattr(cache, "_scan", unlocked_scan)
+
+    for i in range(5):
+        path = tmp_path / f"old{i}"
+        path.write_bytes(b"x" * 200)
+        stock.os.utime(path, (i, i))
+    cache._store(str(tmp_path / "new"), b"y" * 200)
+
+    remaining = sorted(p.name for p in tmp_path.iterdir())
+    assert remaining == ["new", "old2", "old3", "old4"]
+    assert cache.stats()["bytes"] == 800
+    assert cache.evictions == 2